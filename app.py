@@ -186,6 +186,10 @@ app.logger.addHandler(handler)
 logfile = open(log_file_path, 'a', encoding='utf-8')
 sys.stderr = sys.stdout
 
+# Per-endpoint latency + SSH round-trip accounting (see /_debug/perf)
+from routes.common.perf import install_request_timing
+install_request_timing(app)
+
 # Slå cache fra for JSON/plain
 @app.after_request
 def _no_cache_for_api(resp):
@@ -377,7 +381,7 @@ def on_window_closed():
 def run_browser_mode():
     print("Starting Linux Pi Monitor in browser...")
     print(" * Running at http://127.0.0.1:8080 (CTRL+C to stop)")
-    print(" * Debug routes: /_debug/health  /_debug/routes  /_debug/config  /_debug/glances-log\n")
+    print(" * Debug routes: /_debug/health  /_debug/routes  /_debug/config  /_debug/glances-log  /_debug/greenlets  /_debug/perf  /_debug/profile  /_debug/memory\n")
     threading.Thread(target=run_flask).start()
     webbrowser.open("http://127.0.0.1:8080")
     while True:
@@ -49,6 +49,7 @@ def register_routes(app):
     from .network import network_bp
     from .drivers import drivers_bp
     from .keepass import keepass_bp
+    from .debug import debug_bp
 
 
     # UI blueprints first
@@ -67,3 +68,4 @@ def register_routes(app):
     app.register_blueprint(glances_compat_bp)  # /glances-proxy/* and /api/3/*
     app.register_blueprint(network_bp)         # /network, /network/*
     app.register_blueprint(drivers_bp)           # /drivers
+    app.register_blueprint(debug_bp)             # /_debug/* (greenlets, watchdog)
@@ -0,0 +1,183 @@
+"""Bounded in-memory maps (TTL + LRU) for long-lived module-level state."""
+
+from __future__ import annotations
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import Any, Callable, Dict, Hashable, Iterator, List, Optional, Tuple
+
+# name -> map, so diagnostics (/_debug/memory) can list every bounded map
+_REGISTRY: "weakref.WeakValueDictionary[str, BoundedMap]" = weakref.WeakValueDictionary()
+
+_MISSING = object()
+
+
+class BoundedMap(MutableMapping):
+    """
+    Dict-like map with a soft size limit (LRU) and an optional idle TTL.
+
+    - Reads and writes mark an entry as recently used and restart its TTL.
+    - `can_evict(key, value)` protects entries that are still in use (e.g. a
+      running update); protected entries are never dropped, so the limit is
+      soft while they are alive.
+    - `on_evict(key, value, reason)` runs before an entry is dropped
+      (reason: "lru" | "ttl"); use it to persist state.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        maxsize: int = 1024,
+        ttl: Optional[float] = None,
+        on_evict: Optional[Callable[[Hashable, Any, str], None]] = None,
+        can_evict: Optional[Callable[[Hashable, Any], bool]] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.maxsize = max(1, int(maxsize))
+        self.ttl = float(ttl) if ttl else None
+        self._on_evict = on_evict
+        self._can_evict = can_evict
+        self._clock = clock
+        self._lock = threading.RLock()
+        self._data: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evicted_lru = 0
+        self.evicted_ttl = 0
+        _REGISTRY[name] = self
+
+    # ---- internals ----------------------------------------------------
+    def _expired(self, ts: float, now: float) -> bool:
+        return self.ttl is not None and (now - ts) >= self.ttl
+
+    def _evictable(self, key, value) -> bool:
+        if self._can_evict is None:
+            return True
+        try:
+            return bool(self._can_evict(key, value))
+        except Exception:
+            return False
+
+    def _drop(self, key, value, reason: str) -> None:
+        if self._on_evict is not None:
+            try:
+                self._on_evict(key, value, reason)
+            except Exception:
+                pass
+        self._data.pop(key, None)
+        if reason == "ttl":
+            self.evicted_ttl += 1
+        else:
+            self.evicted_lru += 1
+
+    def _sweep(self, now: float) -> None:
+        """Drop expired entries from the LRU end, then trim to maxsize."""
+        # Entries are ordered by last use, so expired ones sit at the front
+        if self.ttl is not None:
+            protected = 0
+            while len(self._data) > protected:
+                key, (value, ts) = next(iter(self._data.items()))
+                if not self._expired(ts, now):
+                    break
+                if self._evictable(key, value):
+                    self._drop(key, value, "ttl")
+                else:
+                    # Still in use: treat as fresh and look further
+                    self._data[key] = (value, now)
+                    self._data.move_to_end(key)
+                    protected += 1
+        if len(self._data) > self.maxsize:
+            for key in list(self._data.keys()):
+                if len(self._data) <= self.maxsize:
+                    break
+                value = self._data[key][0]
+                if self._evictable(key, value):
+                    self._drop(key, value, "lru")
+
+    # ---- mapping API --------------------------------------------------
+    def __getitem__(self, key):
+        with self._lock:
+            now = self._clock()
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                self.misses += 1
+                raise KeyError(key)
+            value, ts = item
+            if self._expired(ts, now) and self._evictable(key, value):
+                self._drop(key, value, "ttl")
+                self.misses += 1
+                raise KeyError(key)
+            self._data[key] = (value, now)
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def __setitem__(self, key, value) -> None:
+        with self._lock:
+            now = self._clock()
+            self._data[key] = (value, now)
+            self._data.move_to_end(key)
+            self._sweep(now)
+
+    def __delitem__(self, key) -> None:
+        with self._lock:
+            del self._data[key]
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            return item is not _MISSING and not (
+                self._expired(item[1], self._clock()) and self._evictable(key, item[0])
+            )
+
+    def __iter__(self) -> Iterator:
+        return iter(self.keys())
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def keys(self) -> List:  # type: ignore[override]
+        with self._lock:
+            return list(self._data.keys())
+
+    def values(self) -> List:  # type: ignore[override]
+        with self._lock:
+            return [v for v, _ in self._data.values()]
+
+    def items(self) -> List[Tuple[Any, Any]]:  # type: ignore[override]
+        with self._lock:
+            return [(k, v) for k, (v, _) in self._data.items()]
+
+    def peek(self, key, default=None):
+        """Read without touching LRU order, TTL or hit counters."""
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            return default if item is _MISSING else item[0]
+
+    def purge(self) -> int:
+        """Run TTL/LRU eviction now; returns how many entries were dropped."""
+        with self._lock:
+            before = len(self._data)
+            self._sweep(self._clock())
+            return before - len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "name": self.name,
+                "entries": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evicted_lru": self.evicted_lru,
+                "evicted_ttl": self.evicted_ttl,
+            }
+
+
+def all_stats() -> List[Dict[str, Any]]:
+    """Stats for every live BoundedMap, by name."""
+    return [m.stats() for _, m in sorted(_REGISTRY.items())]
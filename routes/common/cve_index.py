@@ -0,0 +1,196 @@
+"""
+Offline CVE lookups from a Debian security-tracker JSON dump.
+
+The dump (https://security-tracker.debian.org/tracker/data/json, fetched by
+whatever means the admin prefers) is read once and reduced to one small
+gzip file per release: source package -> fixed versions -> CVEs. Lookups
+never touch the network; a release's table is loaded on first use.
+"""
+
+from __future__ import annotations
+import bisect
+import gzip
+import json
+import os
+import re
+import sys
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from routes.common import debversion
+from routes.common.fs import get_logs_dir
+
+ENV_TRACKER = "RPI_MONITOR_SECURITY_TRACKER"   # path of the JSON dump to index
+DEFAULT_TRACKER = "security-tracker.json"       # relative to the logs dir
+DIR_NAME = "cve_index"
+MAX_CVES = 50   # per package in an annotation
+
+_RX_RELEASE = re.compile(r"^[a-z][a-z0-9-]*$")
+_WS = re.compile(r"[ \t\n\r]*")
+
+
+class _Table:
+    """Fixed versions of one source package, ascending, with the CVEs each one fixes."""
+    __slots__ = ("keys", "versions", "cves")
+
+    def __init__(self, rows: List[List[Any]]):
+        self.versions = [r[0] for r in rows]
+        self.keys = [debversion.sort_key(v) for v in self.versions]
+        self.cves: List[Tuple[str, ...]] = [tuple(sys.intern(c) for c in r[1]) for r in rows]
+
+    def fixed_between(self, current: str, candidate: str) -> List[str]:
+        """CVEs fixed after `current`, up to and including `candidate`."""
+        lo = bisect.bisect_right(self.keys, debversion.sort_key(current))
+        hi = bisect.bisect_right(self.keys, debversion.sort_key(candidate), lo=lo)
+        return [c for row in self.cves[lo:hi] for c in row]
+
+
+_lock = threading.Lock()
+_tables: Dict[str, Dict[str, _Table]] = {}           # release -> source -> table (loaded releases)
+_memo: Dict[Tuple[str, str, str, str], List[str]] = {}
+_meta: Optional[Dict[str, Any]] = None
+
+
+def tracker_path() -> str:
+    return os.environ.get(ENV_TRACKER) or os.path.join(get_logs_dir(), DEFAULT_TRACKER)
+
+
+def _index_dir() -> str:
+    return os.path.join(get_logs_dir(), DIR_NAME)
+
+
+def _iter_object(text: str) -> Iterator[Tuple[str, Any]]:
+    """(key, value) of a top-level JSON object, one member at a time (the dump is large)."""
+    dec = json.JSONDecoder()
+    pos = _WS.match(text, 0).end()
+    if text[pos:pos + 1] != "{":
+        raise ValueError("security tracker dump must be a JSON object")
+    pos = _WS.match(text, pos + 1).end()
+    if text[pos:pos + 1] == "}":
+        return
+    while True:
+        key, pos = dec.raw_decode(text, pos)
+        pos = _WS.match(text, pos).end()
+        if text[pos:pos + 1] != ":":
+            raise ValueError(f"expected ':' at offset {pos}")
+        value, pos = dec.raw_decode(text, _WS.match(text, pos + 1).end())
+        yield key, value
+        pos = _WS.match(text, pos).end()
+        c = text[pos:pos + 1]
+        if c == "}":
+            return
+        if c != ",":
+            raise ValueError(f"expected ',' or '}}' at offset {pos}")
+        pos = _WS.match(text, pos + 1).end()
+
+
+def build(text: str) -> Dict[str, Dict[str, List[List[Any]]]]:
+    """
+    Dump -> {release: {source: [[fixed_version, [cve, ...]], ...]}}, versions
+    ascending. Only resolved issues count; "0" means never affected.
+    """
+    out: Dict[str, Dict[str, Dict[str, List[str]]]] = {}
+    for source, issues in _iter_object(text):
+        if not isinstance(issues, dict):
+            continue
+        for cve, info in issues.items():
+            if not cve.startswith("CVE-") or not isinstance(info, dict):
+                continue
+            for release, rel in (info.get("releases") or {}).items():
+                rel = rel or {}
+                fixed = rel.get("fixed_version") or ""
+                if rel.get("status") != "resolved" or not fixed or fixed == "0":
+                    continue
+                out.setdefault(release, {}).setdefault(source, {}).setdefault(fixed, []).append(cve)
+    return {
+        release: {
+            source: [[v, sorted(by_version[v])] for v in sorted(by_version, key=debversion.sort_key)]
+            for source, by_version in sources.items()
+        }
+        for release, sources in out.items()
+    }
+
+
+def refresh(path: Optional[str] = None, keep_as: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Rebuild the per-release index files from a local dump; returns the new
+    metadata. With `keep_as`, the dump is moved there once it indexed fine.
+    """
+    global _meta
+    path = path or tracker_path()
+    with open(path, "r", encoding="utf-8") as f:
+        index = build(f.read())
+    d = _index_dir()
+    os.makedirs(d, exist_ok=True)
+    releases = {}
+    for release, sources in index.items():
+        if not _RX_RELEASE.match(release):
+            continue
+        target = os.path.join(d, f"{release}.json.gz")
+        with gzip.open(target + ".tmp", "wt", encoding="utf-8") as f:
+            json.dump(sources, f, separators=(",", ":"))
+        os.replace(target + ".tmp", target)
+        releases[release] = {"sources": len(sources), "fixes": sum(len(rows) for rows in sources.values())}
+    if keep_as:
+        os.replace(path, keep_as)
+        path = keep_as
+    meta = {"source": os.path.abspath(path), "source_mtime": os.path.getmtime(path),
+            "built_at": time.time(), "releases": releases}
+    with open(os.path.join(d, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    with _lock:
+        _tables.clear()
+        _memo.clear()
+        _meta = meta
+    return meta
+
+
+def meta() -> Optional[Dict[str, Any]]:
+    """Metadata of the current index (None if none was built yet)."""
+    global _meta
+    if _meta is None:
+        try:
+            with open(os.path.join(_index_dir(), "meta.json"), "r", encoding="utf-8") as f:
+                _meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+    return _meta
+
+
+def _release(release: str) -> Dict[str, _Table]:
+    tables = _tables.get(release)
+    if tables is not None:
+        return tables
+    with _lock:
+        tables = _tables.get(release)
+        if tables is None:
+            tables = {}
+            if _RX_RELEASE.match(release or ""):
+                try:
+                    with gzip.open(os.path.join(_index_dir(), f"{release}.json.gz"), "rt", encoding="utf-8") as f:
+                        tables = {sys.intern(src): _Table(rows) for src, rows in json.load(f).items()}
+                except (OSError, ValueError):
+                    tables = {}
+            _tables[release] = tables
+    return tables
+
+
+def fixed_by(release: str, source: str, current: str, candidate: str) -> List[str]:
+    """
+    CVEs that upgrading `source` from `current` to `candidate` fixes on
+    `release` (a codename such as bookworm). A dict lookup plus a bisect;
+    results are memoized per (release, source, current, candidate).
+    """
+    if not release or not source or not current or not candidate:
+        return []
+    key = (release, source, current, candidate)
+    hit = _memo.get(key)
+    if hit is not None:
+        return hit
+    table = _release(release).get(source)
+    cves = table.fixed_between(current, candidate)[:MAX_CVES] if table else []
+    if len(_memo) > 50000:
+        _memo.clear()
+    _memo[key] = cves
+    return cves
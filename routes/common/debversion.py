@@ -0,0 +1,74 @@
+"""Debian version comparison (same ordering as `dpkg --compare-versions`)."""
+
+from __future__ import annotations
+import functools
+from typing import Tuple
+
+_DIGITS = "0123456789"
+
+
+def _order(c: str) -> int:
+    # '~' sorts before everything, even the end of the string; letters before other symbols
+    if c in _DIGITS:
+        return 0
+    if ("a" <= c <= "z") or ("A" <= c <= "Z"):
+        return ord(c)
+    if c == "~":
+        return -1
+    return ord(c) + 256
+
+
+def _verrevcmp(a: str, b: str) -> int:
+    i = j = 0
+    while i < len(a) or j < len(b):
+        first_diff = 0
+        while (i < len(a) and a[i] not in _DIGITS) or (j < len(b) and b[j] not in _DIGITS):
+            ac = _order(a[i]) if i < len(a) else 0
+            bc = _order(b[j]) if j < len(b) else 0
+            if ac != bc:
+                return ac - bc
+            i += 1
+            j += 1
+        while i < len(a) and a[i] == "0":
+            i += 1
+        while j < len(b) and b[j] == "0":
+            j += 1
+        while i < len(a) and a[i] in _DIGITS and j < len(b) and b[j] in _DIGITS:
+            if not first_diff:
+                first_diff = ord(a[i]) - ord(b[j])
+            i += 1
+            j += 1
+        if i < len(a) and a[i] in _DIGITS:
+            return 1
+        if j < len(b) and b[j] in _DIGITS:
+            return -1
+        if first_diff:
+            return first_diff
+    return 0
+
+
+def split(version: str) -> Tuple[int, str, str]:
+    """'1:2.3-4' -> (1, '2.3', '4'); a missing epoch is 0, a missing revision ''."""
+    version = (version or "").strip()
+    epoch = 0
+    if ":" in version:
+        head, version = version.split(":", 1)
+        try:
+            epoch = int(head)
+        except ValueError:
+            epoch = 0
+    upstream, _, revision = version.rpartition("-") if "-" in version else (version, "", "")
+    return epoch, upstream, revision
+
+
+def compare(a: str, b: str) -> int:
+    """-1, 0 or 1 as `a` is older than, equal to or newer than `b`."""
+    ea, ua, ra = split(a)
+    eb, ub, rb = split(b)
+    if ea != eb:
+        return -1 if ea < eb else 1
+    r = _verrevcmp(ua, ub) or _verrevcmp(ra, rb)
+    return (r > 0) - (r < 0)
+
+
+sort_key = functools.cmp_to_key(compare)
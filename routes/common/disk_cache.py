@@ -0,0 +1,189 @@
+"""Size-bounded LRU cache of blobs on disk (one file per key, oldest-used evicted first)."""
+
+from __future__ import annotations
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+CACHE_SUBDIR = os.path.join('var', 'cache', 'linux-pi-monitor')
+FALLBACK_SUBDIR = os.path.join('instance', 'cache')
+
+_RX_UNSAFE = re.compile(r'[^A-Za-z0-9.+_-]+')
+
+
+def _probe_dir(name: str) -> str:
+    for base in (CACHE_SUBDIR, FALLBACK_SUBDIR):
+        path = os.path.join(base, name)
+        try:
+            os.makedirs(path, exist_ok=True)
+            probe = os.path.join(path, '.w')
+            with open(probe, 'w', encoding='utf-8') as f:
+                f.write('1')
+            os.remove(probe)
+            return path
+        except Exception:
+            continue
+    raise RuntimeError(f"no writable cache directory for {name}")
+
+
+class DiskLRU:
+    """
+    Blobs keyed by string, stored under var/cache/linux-pi-monitor/<name>
+    (fallback instance/cache/<name>). Reads refresh an entry's mtime, which is
+    the LRU order after a restart; writes evict until the total fits max_bytes.
+    Pinned entries are never evicted (the total may then exceed max_bytes).
+    """
+
+    def __init__(self, name: str, max_bytes: int):
+        self.name = name
+        self.max_bytes = max(1, int(max_bytes))
+        self._dir: Optional[str] = None
+        self._lock = threading.Lock()
+        self._index: "OrderedDict[str, int]" = OrderedDict()  # filename -> size, LRU first
+        self._pins: Dict[str, int] = {}                          # filename -> pin count
+        self._total = 0
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def _filename(self, key: str) -> str:
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+        return f"{_RX_UNSAFE.sub('_', key)[:80]}.{digest}"
+
+    def _ensure(self) -> str:
+        """Directory, and the index rebuilt from it on first use (by mtime)."""
+        if self._dir is None:
+            path = _probe_dir(self.name)
+            files = []
+            for fn in os.listdir(path):
+                if fn.startswith('.') or fn.endswith('.tmp'):
+                    continue
+                try:
+                    st = os.stat(os.path.join(path, fn))
+                except OSError:
+                    continue
+                files.append((st.st_mtime, fn, st.st_size))
+            for _mt, fn, size in sorted(files):
+                self._index[fn] = size
+                self._total += size
+            self._dir = path
+        return self._dir
+
+    def get(self, key: str) -> Optional[bytes]:
+        fn = self._filename(key)
+        with self._lock:
+            path = os.path.join(self._ensure(), fn)
+            if fn not in self._index:
+                self.misses += 1
+                return None
+            self._index.move_to_end(fn)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self._total -= self._index.pop(fn, 0)
+                self.misses += 1
+            return None
+        self.hits += 1
+        return data
+
+    def path(self, key: str) -> Optional[str]:
+        """File of a cached entry (counts as a use), for callers that stream it themselves."""
+        fn = self._filename(key)
+        with self._lock:
+            path = os.path.join(self._ensure(), fn)
+            if fn not in self._index or not os.path.exists(path):
+                self._total -= self._index.pop(fn, 0)
+                self.misses += 1
+                return None
+            self._index.move_to_end(fn)
+            self.hits += 1
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return path
+
+    def tmp_path(self, key: str) -> str:
+        """Scratch file next to the cache (same filesystem), for put_file()."""
+        with self._lock:
+            return os.path.join(self._ensure(), f".{self._filename(key)}.{threading.get_ident()}.tmp")
+
+    def put(self, key: str, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        fn = self._filename(key)
+        with self._lock:
+            base = self._ensure()
+            path = os.path.join(base, fn)
+            tmp = path + '.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+            self._admit(base, fn, len(data))
+
+    def put_file(self, key: str, src: str) -> Optional[str]:
+        """Move a finished file (e.g. from tmp_path()) into the cache; returns its path."""
+        size = os.path.getsize(src)
+        if size > self.max_bytes:
+            os.remove(src)
+            return None
+        fn = self._filename(key)
+        with self._lock:
+            base = self._ensure()
+            path = os.path.join(base, fn)
+            os.replace(src, path)
+            self._admit(base, fn, size)
+        return path
+
+    def pin(self, key: str) -> None:
+        """Keep `key` (present or still to be put) from being evicted until unpin()."""
+        fn = self._filename(key)
+        with self._lock:
+            self._pins[fn] = self._pins.get(fn, 0) + 1
+
+    def unpin(self, key: str) -> None:
+        fn = self._filename(key)
+        with self._lock:
+            n = self._pins.get(fn, 0) - 1
+            if n > 0:
+                self._pins[fn] = n
+            else:
+                self._pins.pop(fn, None)
+
+    def _admit(self, base: str, fn: str, size: int) -> None:
+        """Account a new file and evict the least recently used unpinned ones; lock held."""
+        self._total += size - self._index.pop(fn, 0)
+        self._index[fn] = size
+        if self._total <= self.max_bytes:
+            return
+        for old in list(self._index):
+            if self._total <= self.max_bytes:
+                break
+            if old == fn or old in self._pins:
+                continue
+            self._total -= self._index.pop(old)
+            self.evicted += 1
+            try:
+                os.remove(os.path.join(base, old))
+            except OSError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "name": self.name,
+                "dir": self._dir,
+                "entries": len(self._index),
+                "bytes": self._total,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evicted": self.evicted,
+                "pinned": len(self._pins),
+            }
@@ -1,21 +1,49 @@
 from __future__ import annotations
+import atexit
+import gzip
+import json
 import os
-from typing import List, Dict
+import shutil
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+from routes.common.bounded import BoundedMap
 
 
 LOG_SUBDIR = os.path.join('var', 'log', 'linux-pi-monitor', 'updates')
 FALLBACK_SUBDIR = os.path.join('instance', 'update_logs')
 
+FLUSH_INTERVAL = 1.0      # seconds between flushes of an active run log
+IDLE_CLOSE_AFTER = 600    # close handles of runs that stopped writing
+TAIL_LINES = 200          # in-memory tail kept per run
+_BUFFER_SIZE = 64 * 1024
+
+_logs_dir: Optional[str] = None
+_logs_dir_lock = threading.Lock()
+
+# Observers of run logs: "line" (run_id, line_no, text), "finalize" (run_id), "delete" (run_id)
+_HOOKS: Dict[str, List[Callable[..., None]]] = {"line": [], "finalize": [], "delete": []}
+
+
+def add_log_hook(kind: str, fn: Callable[..., None]) -> None:
+    _HOOKS[kind].append(fn)
+
+
+def _fire(kind: str, *args: Any) -> None:
+    for fn in _HOOKS.get(kind, ()):
+        try:
+            fn(*args)
+        except Exception:
+            pass
+
 
 def _ensure_dir(path: str) -> None:
     os.makedirs(path, exist_ok=True)
 
 
-def get_logs_dir() -> str:
-    """
-    Return a writable directory for update logs.
-    Prefer var/log/linux-pi-monitor/updates, fallback to instance/update_logs.
-    """
+def _probe_logs_dir() -> str:
     primary = LOG_SUBDIR
     try:
         _ensure_dir(primary)
@@ -30,60 +58,455 @@ def get_logs_dir() -> str:
         return fb
 
 
+def get_logs_dir() -> str:
+    """
+    Return a writable directory for update logs.
+    Prefer var/log/linux-pi-monitor/updates, fallback to instance/update_logs.
+    The write probe runs once per process; the result is cached.
+    """
+    global _logs_dir
+    if _logs_dir is None:
+        with _logs_dir_lock:
+            if _logs_dir is None:
+                _logs_dir = _probe_logs_dir()
+    return _logs_dir
+
+
 def make_log_path(run_id: str) -> str:
     base = get_logs_dir()
     safe = ''.join(c for c in (run_id or '') if c.isalnum() or c in ('-', '_', 'T', 'Z', '.'))
     return os.path.join(base, f"{safe}.log")
 
 
-def list_logs() -> List[Dict]:
+def make_gz_path(run_id: str) -> str:
+    return make_log_path(run_id) + '.gz'
+
+
+def _started_from_id(run_id: str) -> str:
+    # best-effort from name prefix like 2025-10-12T00-41-03Z_xxx
+    if 'T' in run_id and 'Z' in run_id:
+        ts = run_id.split('_', 1)[0]
+        return ts.replace('-', ':', 2).replace('T', 'T').replace('-', ':', 2).replace('::', ':')
+    return ''
+
+
+# ---------------------------------------------------------------------
+# Run-log archive index (index.json in the logs dir)
+# ---------------------------------------------------------------------
+INDEX_NAME = 'index.json'
+_COMPRESS_CHUNK = 64 * 1024
+
+_index: Optional[Dict[str, Dict[str, Any]]] = None
+_index_mtime: Optional[float] = None
+_index_lock = threading.RLock()
+
+
+def _index_path() -> str:
+    return os.path.join(get_logs_dir(), INDEX_NAME)
+
+
+def _scan_dir() -> Dict[str, Dict[str, Any]]:
+    """Build index entries from the files on disk (first run / lost index)."""
     base = get_logs_dir()
-    items: List[Dict] = []
+    runs: Dict[str, Dict[str, Any]] = {}
     try:
-        for name in os.listdir(base):
-            if not name.endswith('.log'):
-                continue
-            path = os.path.join(base, name)
+        names = os.listdir(base)
+    except Exception:
+        return runs
+    for name in names:
+        if name.endswith('.log'):
+            run_id, compressed = name[:-4], False
+        elif name.endswith('.log.gz'):
+            run_id, compressed = name[:-7], True
+        else:
+            continue
+        try:
+            st = os.stat(os.path.join(base, name))
+        except Exception:
+            continue
+        entry = runs.setdefault(run_id, {'id': run_id, 'start': None, 'end': int(st.st_mtime)})
+        entry['stored_size'] = int(st.st_size)
+        entry['compressed'] = compressed
+        if not compressed:
+            entry['size'] = int(st.st_size)
+    return runs
+
+
+def _load_index() -> Dict[str, Dict[str, Any]]:
+    """Cached index; re-read only when the file changed on disk."""
+    global _index, _index_mtime
+    with _index_lock:
+        path = _index_path()
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            mtime = None
+        if _index is not None and mtime == _index_mtime:
+            return _index
+        runs: Optional[Dict[str, Dict[str, Any]]] = None
+        if mtime is not None:
             try:
-                st = os.stat(path)
-                run_id = name[:-4]
-                # started is best-effort from name prefix like 2025-10-12T00-41-03Z_xxx
-                started = ''
-                if 'T' in run_id and 'Z' in run_id:
-                    ts = run_id.split('_', 1)[0]
-                    started = ts.replace('-', ':', 2).replace('T', 'T').replace('-', ':', 2).replace('::', ':')
-                items.append({
-                    'id': run_id,
-                    'size': int(st.st_size),
-                    'started': started,
-                    'mtime': int(st.st_mtime),
-                })
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                runs = data.get('runs') if isinstance(data, dict) else None
             except Exception:
-                continue
-    except Exception:
-        pass
-    items.sort(key=lambda x: x.get('mtime') or 0, reverse=True)
+                runs = None
+        if runs is None:
+            runs = _scan_dir()
+            _index = runs
+            _save_index()
+        else:
+            _index, _index_mtime = runs, mtime
+        return _index
+
+
+def _save_index() -> None:
+    global _index_mtime
+    path = _index_path()
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({'version': 1, 'runs': _index or {}}, f)
+    os.replace(tmp, path)
+    _index_mtime = os.stat(path).st_mtime
+
+
+def index_update(run_id: str, **fields: Any) -> Dict[str, Any]:
+    """Create/merge an index entry (run_id, action, host, rc, start, end, size, packages...)."""
+    with _index_lock:
+        runs = _load_index()
+        entry = runs.setdefault(run_id, {'id': run_id})
+        entry.update({k: v for k, v in fields.items() if v is not None})
+        _save_index()
+        return dict(entry)
+
+
+def index_get(run_id: str) -> Optional[Dict[str, Any]]:
+    with _index_lock:
+        entry = _load_index().get(run_id)
+        return dict(entry) if entry else None
+
+
+def list_logs() -> List[Dict]:
+    """All archived runs, newest first, from one index read."""
+    with _index_lock:
+        runs = [dict(e) for e in _load_index().values()]
+    items: List[Dict] = []
+    for e in runs:
+        run_id = e['id']
+        e.setdefault('size', e.get('stored_size', 0))
+        e['started'] = _started_from_id(run_id)
+        e['mtime'] = int(e.get('end') or e.get('start') or 0)
+        if e.get('start') and e.get('end'):
+            e['duration'] = int(max(0, e['end'] - e['start']))
+        items.append(e)
+    items.sort(key=lambda x: (x.get('start') or x.get('mtime') or 0, x['id']), reverse=True)
     return items
 
 
-def read_log(run_id: str) -> str:
+def _compress(run_id: str) -> None:
+    """gzip <run>.log -> <run>.log.gz in small steps so the hub stays responsive."""
+    src = make_log_path(run_id)
+    dst = make_gz_path(run_id)
+    tmp = dst + '.tmp'
+    try:
+        with open(src, 'rb') as fin, gzip.open(tmp, 'wb', compresslevel=6) as fout:
+            while True:
+                chunk = fin.read(_COMPRESS_CHUNK)
+                if not chunk:
+                    break
+                fout.write(chunk)
+                time.sleep(0)  # cooperative yield under eventlet
+        if run_id in _WRITERS:
+            # Run got reopened while we were compressing; keep the plain log
+            os.remove(tmp)
+            return
+        os.replace(tmp, dst)
+        os.remove(src)
+        index_update(run_id, compressed=True, stored_size=os.path.getsize(dst))
+    except FileNotFoundError:
+        pass
+    except Exception:
+        try:
+            os.remove(tmp)
+        except Exception:
+            pass
+
+
+def finalize_log(run_id: str, compress: bool = True, **meta: Any) -> None:
+    """Close the run's writer, record final metadata and gzip it in the background."""
+    close_log(run_id)
+    try:
+        size = os.path.getsize(make_log_path(run_id))
+    except Exception:
+        size = None
+    meta.setdefault('end', time.time())
+    index_update(run_id, size=size, stored_size=size, compressed=False, **meta)
+    _fire("finalize", run_id)
+    if compress:
+        threading.Thread(target=_compress, args=(run_id,), name=f"gz-{run_id}", daemon=True).start()
+
+
+def iter_log_chunks(run_id: str, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    """Stream a run log as raw bytes, decompressing archived runs on the fly."""
+    flush_log(run_id)
     path = make_log_path(run_id)
-    with open(path, 'r', encoding='utf-8', errors='replace') as f:
-        return f.read()
+    if os.path.exists(path):
+        opener = open(path, 'rb')
+    else:
+        opener = gzip.open(make_gz_path(run_id), 'rb')  # FileNotFoundError if neither exists
+    with opener as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def log_exists(run_id: str) -> bool:
+    return os.path.exists(make_log_path(run_id)) or os.path.exists(make_gz_path(run_id))
+
+
+def read_log(run_id: str) -> str:
+    return b''.join(iter_log_chunks(run_id)).decode('utf-8', errors='replace')
+
+
+def make_state_path(run_id: str) -> str:
+    """Run state snapshot lives next to the log: <run_id>.json"""
+    return make_log_path(run_id)[:-4] + '.json'
+
+
+def save_run_state(run_id: str, state: Dict[str, Any]) -> None:
+    path = make_state_path(run_id)
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+def load_run_state(run_id: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(make_state_path(run_id), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else None
+    except Exception:
+        return None
 
 
 def delete_log(run_id: str) -> bool:
-    path = make_log_path(run_id)
+    close_log(run_id)
+    _TAILS.pop(run_id, None)
+    removed = False
+    for path in (make_log_path(run_id), make_gz_path(run_id), make_state_path(run_id)):
+        try:
+            os.remove(path)
+            removed = removed or not path.endswith('.json')
+        except Exception:
+            pass
+    with _index_lock:
+        runs = _load_index()
+        if runs.pop(run_id, None) is not None:
+            _save_index()
+    _fire("delete", run_id)
+    return removed
+
+
+# ---------------------------------------------------------------------
+# Buffered run-log writer
+# ---------------------------------------------------------------------
+class _RunLog:
+    """One buffered append handle per active run, plus a tail ring."""
+
+    def __init__(self, run_id: str, tail: Deque[str]):
+        path = make_log_path(run_id)
+        self.run_id = run_id
+        self.lines = _count_lines(path)
+        self.fh = open(path, 'a', encoding='utf-8', buffering=_BUFFER_SIZE)
+        self.lock = threading.Lock()
+        self.tail = tail
+        self.partial = ''
+        self.last_write = time.monotonic()
+        self.last_flush = self.last_write
+        self.dirty = False
+
+    def write(self, text: str) -> None:
+        done: List[Tuple[int, str]] = []
+        with self.lock:
+            self.fh.write(text)
+            self.dirty = True
+            now = time.monotonic()
+            self.last_write = now
+            parts = (self.partial + text).split('\n')
+            self.partial = parts.pop()
+            for ln in parts:
+                ln = ln.rstrip('\r')
+                self.tail.append(ln)
+                self.lines += 1
+                done.append((self.lines, ln))
+            if now - self.last_flush >= FLUSH_INTERVAL:
+                self._flush(now)
+        if _HOOKS["line"]:
+            for no, ln in done:
+                _fire("line", self.run_id, no, ln)
+
+    def _flush(self, now: float) -> None:
+        if self.dirty:
+            self.fh.flush()
+            self.dirty = False
+        self.last_flush = now
+
+    def flush(self) -> None:
+        with self.lock:
+            self._flush(time.monotonic())
+
+    def close(self) -> None:
+        with self.lock:
+            try:
+                self.fh.close()
+            except Exception:
+                pass
+            last = None
+            if self.partial:
+                last = self.partial.rstrip('\r')
+                self.tail.append(last)
+                self.lines += 1
+                self.partial = ''
+        if last is not None and _HOOKS["line"]:
+            _fire("line", self.run_id, self.lines, last)
+
+
+def _count_lines(path: str) -> int:
+    n = 0
     try:
-        os.remove(path)
-        return True
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(_BUFFER_SIZE), b''):
+                n += chunk.count(b'\n')
     except Exception:
-        return False
+        pass
+    return n
+
+
+_WRITERS: Dict[str, _RunLog] = {}
+_WRITERS_LOCK = threading.Lock()
+# Tails outlive the writer so finished runs keep serving last_lines from memory
+_TAILS: BoundedMap = BoundedMap("fs._TAILS", maxsize=64, ttl=6 * 3600)
+_flusher_started = False
+
+
+def _flusher() -> None:
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        now = time.monotonic()
+        with _WRITERS_LOCK:
+            writers = list(_WRITERS.items())
+        for run_id, w in writers:
+            try:
+                if now - w.last_write >= IDLE_CLOSE_AFTER:
+                    close_log(run_id)
+                elif w.dirty and now - w.last_flush >= FLUSH_INTERVAL:
+                    w.flush()
+            except Exception:
+                pass
+
+
+def _restore_archived(run_id: str) -> None:
+    """Unpack <run>.log.gz back to <run>.log so a reopened run appends to its full output."""
+    src = make_gz_path(run_id)
+    dst = make_log_path(run_id)
+    if os.path.exists(dst) or not os.path.exists(src):
+        return
+    tmp = dst + '.tmp'
+    with gzip.open(src, 'rb') as fin, open(tmp, 'wb') as fout:
+        shutil.copyfileobj(fin, fout, _COMPRESS_CHUNK)
+    os.replace(tmp, dst)
+    os.remove(src)
+    index_update(run_id, compressed=False, stored_size=os.path.getsize(dst))
+
+
+def _writer(run_id: str) -> _RunLog:
+    global _flusher_started
+    w = _WRITERS.get(run_id)
+    if w is not None:
+        return w
+    with _WRITERS_LOCK:
+        w = _WRITERS.get(run_id)
+        if w is None:
+            _restore_archived(run_id)
+            tail = _TAILS.get(run_id)
+            if tail is None:
+                # Reopened after a restart: seed the ring from what is on disk
+                tail = deque(_tail_file(make_log_path(run_id), TAIL_LINES), maxlen=TAIL_LINES)
+                _TAILS[run_id] = tail
+            w = _WRITERS[run_id] = _RunLog(run_id, tail)
+        if not _flusher_started:
+            _flusher_started = True
+            threading.Thread(target=_flusher, name="runlog-flusher", daemon=True).start()
+    return w
 
 
 def append_log(run_id: str, text: str) -> None:
+    if text:
+        _writer(run_id).write(text)
+
+
+def flush_log(run_id: str) -> None:
+    w = _WRITERS.get(run_id)
+    if w is not None:
+        w.flush()
+
+
+def close_log(run_id: str) -> None:
+    """Flush and release the handle; call when a run finishes."""
+    with _WRITERS_LOCK:
+        w = _WRITERS.pop(run_id, None)
+    if w is not None:
+        w.close()
+
+
+def _close_all() -> None:
+    for run_id in list(_WRITERS.keys()):
+        close_log(run_id)
+
+
+atexit.register(_close_all)
+
+
+def _tail_file(path: str, max_lines: int) -> List[str]:
+    try:
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            block = 4096
+            data = b""
+            while size > 0 and data.count(b"\n") <= max_lines:
+                read_size = block if size >= block else size
+                size -= read_size
+                f.seek(size)
+                data = f.read(read_size) + data
+            text = data.decode("utf-8", errors="replace")
+            return text.splitlines()[-max_lines:]
+    except Exception:
+        return []
+
+
+def tail_lines(run_id: str, max_lines: int = 50) -> List[str]:
+    """Last lines of a run log: from the in-memory ring, else from disk."""
+    tail = _TAILS.get(run_id)
+    if tail is not None and max_lines <= (tail.maxlen or 0):
+        lines = list(tail)
+        w = _WRITERS.get(run_id)
+        if w is not None and w.partial:
+            lines.append(w.partial.rstrip('\r'))
+        return lines[-max_lines:]
     path = make_log_path(run_id)
-    _ensure_dir(os.path.dirname(path))
-    with open(path, 'a', encoding='utf-8') as f:
-        f.write(text)
+    if os.path.exists(path):
+        return _tail_file(path, max_lines)
+    # Archived (gzip) logs cannot be read backwards; stream through a ring instead
+    ring: Deque[str] = deque(maxlen=max_lines)
+    try:
+        with gzip.open(make_gz_path(run_id), 'rt', encoding='utf-8', errors='replace') as f:
+            for ln in f:
+                ring.append(ln.rstrip('\r\n'))
+    except Exception:
+        return []
+    return list(ring)
 
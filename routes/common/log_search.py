@@ -0,0 +1,327 @@
+"""Inverted index over update run logs: package names + error keywords -> (run, line)."""
+
+from __future__ import annotations
+import json
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from routes.common import fs
+from routes.common.bounded import BoundedMap
+
+ENV_MAX_RUNS = "RPI_MONITOR_LOG_SEARCH_RUNS"
+DEFAULT_MAX_RUNS = 500    # newest runs kept searchable in memory
+MAX_LINES_PER_TERM = 50   # offsets kept per (term, run); counts keep going
+_BACKFILL_YIELD_EVERY = 2000
+
+# Lines that name the package being worked on
+_RX_PKG_LINES = [
+    re.compile(r'^(?:Unpacking|Setting up|Removing|Purging configuration files for|Processing triggers for)\s+([^\s(]+)'),
+    re.compile(r'^Selecting previously unselected package\s+(\S+?)\.?$'),
+    re.compile(r'^Preparing to unpack\s+\S*?/([^/_\s]+)_[^\s]*\.deb'),
+    re.compile(r'^(?:Inst|Conf|Remv)\s+([^\s(]+)'),
+    re.compile(r'^dpkg: (?:error processing package|dependency problems prevent configuration of)\s+([^\s(:]+(?::[a-z0-9]+)?)'),
+    re.compile(r'^Get:\d+\s.*\s([a-z0-9][a-z0-9+.\-]*)\s+\S+\s+\S+\s+\[[\d.,]+\s*[kMG]?B\]'),
+]
+# "Errors were encountered while processing:" is followed by " pkg" lines
+_RX_ERR_LIST = re.compile(r'^\s+([a-z0-9][a-z0-9+.\-]*(?::[a-z0-9]+)?)\s*$')
+
+KEYWORDS: Set[str] = {
+    'e:', 'w:', 'err:', 'error', 'errors', 'failed', 'failure', 'fatal', 'warning',
+    'broken', 'unmet', 'conflict', 'conflicts', 'held', 'timeout', 'denied',
+    'dpkg', 'interrupted', 'corrupt', 'hash', 'mismatch', 'unable', 'killed',
+}
+_RX_WORD = re.compile(r"[a-z0-9][a-z0-9+.\-]*:?")
+
+
+def normalize(term: str) -> str:
+    """Lower-case; package names lose their :arch suffix ('libc6:arm64' -> 'libc6')."""
+    t = term.strip().lower()
+    if t.endswith(':') or ':' not in t:
+        return t
+    return t.split(':', 1)[0]
+
+
+def line_terms(line: str, after_error_list: bool = False) -> Set[str]:
+    """Terms worth indexing in one log line."""
+    out: Set[str] = set()
+    text = line.rstrip()
+    for rx in _RX_PKG_LINES:
+        m = rx.match(text)
+        if m:
+            out.add(normalize(m.group(1)))
+            break
+    if after_error_list:
+        m = _RX_ERR_LIST.match(text)
+        if m:
+            out.add(normalize(m.group(1)))
+    low = text.lower()
+    for w in _RX_WORD.findall(low):
+        if w in KEYWORDS:
+            out.add(w)
+        elif w.rstrip(':') in KEYWORDS:
+            out.add(w.rstrip(':'))
+    return out
+
+
+class _RunTerms:
+    """Postings of one run plus the little bit of parser state between lines."""
+
+    __slots__ = ("terms", "counts", "in_err_list")
+
+    def __init__(self):
+        self.terms: Dict[str, List[int]] = {}
+        self.counts: Dict[str, int] = {}
+        self.in_err_list = False
+
+    def add(self, line_no: int, line: str) -> Set[str]:
+        terms = line_terms(line, self.in_err_list)
+        if line.startswith('Errors were encountered while processing'):
+            self.in_err_list = True
+        elif self.in_err_list and not line.startswith((' ', '\t')):
+            self.in_err_list = False
+        new: Set[str] = set()
+        for t in terms:
+            offs = self.terms.get(t)
+            if offs is None:
+                offs = self.terms[t] = []
+                new.add(t)
+            if len(offs) < MAX_LINES_PER_TERM:
+                offs.append(line_no)
+            self.counts[t] = self.counts.get(t, 0) + 1
+        return new
+
+    def to_json(self) -> Dict[str, Any]:
+        return {"version": 1, "terms": self.terms, "counts": self.counts}
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> "_RunTerms":
+        rt = cls()
+        rt.terms = {str(k): [int(x) for x in v] for k, v in (data.get("terms") or {}).items()}
+        rt.counts = {str(k): int(v) for k, v in (data.get("counts") or {}).items()}
+        for t, offs in rt.terms.items():
+            rt.counts.setdefault(t, len(offs))
+        return rt
+
+
+def max_runs() -> int:
+    try:
+        return max(10, int(os.environ.get(ENV_MAX_RUNS) or DEFAULT_MAX_RUNS))
+    except ValueError:
+        return DEFAULT_MAX_RUNS
+
+
+def _unlink_terms(run_id: str, rt: _RunTerms) -> None:
+    for t in rt.terms:
+        ids = _POSTINGS.get(t)
+        if ids is not None:
+            ids.discard(run_id)
+            if not ids:
+                del _POSTINGS[t]
+
+
+_lock = threading.RLock()
+# Oldest runs drop out (with their postings) once more than max_runs() are indexed;
+# runs still being written stay. Only inserts evict, and those hold _lock.
+_RUNS: BoundedMap = BoundedMap(
+    "log_search._RUNS", maxsize=max_runs(),
+    on_evict=lambda run_id, rt, _reason: _unlink_terms(run_id, rt),
+    can_evict=lambda run_id, _rt: run_id not in fs._WRITERS,
+)
+# term -> run ids containing it (the inverted part; offsets stay per run)
+_POSTINGS: Dict[str, Set[str]] = {}
+_backfilled = False
+
+
+def _terms_path(run_id: str) -> str:
+    return fs.make_log_path(run_id)[:-4] + '.terms.json'
+
+
+def _link(run_id: str, terms: Iterable[str]) -> None:
+    for t in terms:
+        _POSTINGS.setdefault(t, set()).add(run_id)
+
+
+def _unlink(run_id: str) -> None:
+    rt = _RUNS.pop(run_id, None)
+    if rt is not None:
+        _unlink_terms(run_id, rt)
+
+
+# ---- fs hooks (incremental updates) ----------------------------------
+def _on_line(run_id: str, line_no: int, line: str) -> None:
+    with _lock:
+        rt = _RUNS.peek(run_id)
+        if rt is None:
+            rt = _RUNS[run_id] = _RunTerms()
+        _link(run_id, rt.add(line_no, line))
+
+
+def _on_finalize(run_id: str) -> None:
+    with _lock:
+        rt = _RUNS.peek(run_id)
+        data = rt.to_json() if rt is not None else None
+    if data is None:
+        return
+    path = _terms_path(run_id)
+    tmp = path + '.tmp'
+    try:
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(tmp, path)
+    except Exception:
+        pass
+
+
+def _on_delete(run_id: str) -> None:
+    with _lock:
+        _unlink(run_id)
+    try:
+        os.remove(_terms_path(run_id))
+    except Exception:
+        pass
+
+
+fs.add_log_hook("line", _on_line)
+fs.add_log_hook("finalize", _on_finalize)
+fs.add_log_hook("delete", _on_delete)
+
+
+# ---- archive backfill --------------------------------------------------
+def _iter_lines(run_id: str) -> Iterator[str]:
+    rest = b''
+    for chunk in fs.iter_log_chunks(run_id):
+        parts = (rest + chunk).split(b'\n')
+        rest = parts.pop()
+        for p in parts:
+            yield p.decode('utf-8', errors='replace').rstrip('\r')
+    if rest:
+        yield rest.decode('utf-8', errors='replace').rstrip('\r')
+
+
+def _index_archived(run_id: str) -> None:
+    """Load a run's sidecar, or build (and save) it by reading the log once."""
+    path = _terms_path(run_id)
+    rt: Optional[_RunTerms] = None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            rt = _RunTerms.from_json(json.load(f))
+    except Exception:
+        rt = None
+    if rt is None:
+        rt = _RunTerms()
+        try:
+            for no, line in enumerate(_iter_lines(run_id), 1):
+                rt.add(no, line)
+                if no % _BACKFILL_YIELD_EVERY == 0:
+                    time.sleep(0)  # cooperative yield under eventlet
+        except FileNotFoundError:
+            return
+        with _lock:
+            if run_id in _RUNS:  # got indexed live meanwhile
+                return
+            _RUNS[run_id] = rt
+            _link(run_id, rt.terms)
+        _on_finalize(run_id)
+        return
+    with _lock:
+        if run_id not in _RUNS:
+            _RUNS[run_id] = rt
+            _link(run_id, rt.terms)
+
+
+def ensure_loaded() -> None:
+    """Index the newest archived runs not seen yet (once per process)."""
+    global _backfilled
+    if _backfilled:
+        return
+    # Oldest of the window first, so the newest end up most recently used
+    for item in reversed(fs.list_logs()[:max_runs()]):
+        run_id = item['id']
+        with _lock:
+            if run_id in _RUNS:
+                continue
+        if run_id in fs._WRITERS:
+            continue  # still being written; covered by the line hook
+        _index_archived(run_id)
+    _backfilled = True
+
+
+# ---- queries -------------------------------------------------------------
+def _expand(term: str) -> List[str]:
+    """Exact term, or every indexed term with that prefix for 'foo*'."""
+    if term.endswith('*'):
+        prefix = term[:-1]
+        if not prefix:
+            return []
+        return [t for t in _POSTINGS if t.startswith(prefix)]
+    return [term] if term in _POSTINGS else []
+
+
+def parse_query(q: str) -> List[str]:
+    out: List[str] = []
+    for raw in (q or '').split():
+        star = raw.endswith('*')
+        t = normalize(raw.rstrip('*'))
+        if t:
+            out.append(t + ('*' if star else ''))
+    return out
+
+
+def search(q: str, limit: int = 50) -> Dict[str, Any]:
+    """
+    Runs containing ALL query terms (package names or error keywords,
+    'foo*' for prefixes), newest first, with the matching line numbers.
+    """
+    ensure_loaded()
+    terms = parse_query(q)
+    if not terms:
+        return {"q": q, "terms": [], "total": 0, "runs": []}
+    with _lock:
+        groups: List[List[str]] = [_expand(t) for t in terms]
+        run_ids: Optional[Set[str]] = None
+        for group in sorted(groups, key=lambda g: sum(len(_POSTINGS.get(t, ())) for t in g)):
+            ids: Set[str] = set()
+            for t in group:
+                ids |= _POSTINGS.get(t, set())
+            run_ids = ids if run_ids is None else (run_ids & ids)
+            if not run_ids:
+                break
+        run_ids = run_ids or set()
+        hits: Dict[str, Tuple[Dict[int, List[str]], Dict[str, int]]] = {}
+        for run_id in run_ids:
+            rt = _RUNS.peek(run_id)
+            if rt is None:
+                continue
+            lines: Dict[int, List[str]] = {}
+            counts: Dict[str, int] = {}
+            for group in groups:
+                for t in group:
+                    for no in rt.terms.get(t, ()):
+                        lines.setdefault(no, []).append(t)
+                    if t in rt.counts:
+                        counts[t] = rt.counts[t]
+            hits[run_id] = (lines, counts)
+    meta = {it['id']: it for it in fs.list_logs()}
+    runs: List[Dict[str, Any]] = []
+    for run_id, (lines, counts) in hits.items():
+        m = meta.get(run_id, {})
+        runs.append({
+            "id": run_id,
+            "action": m.get("action"),
+            "host": m.get("host"),
+            "rc": m.get("rc"),
+            "start": m.get("start"),
+            "started": m.get("started"),
+            "counts": counts,
+            "lines": [{"line": no, "terms": sorted(set(ts))} for no, ts in sorted(lines.items())],
+        })
+    runs.sort(key=lambda r: (r.get("start") or 0, r["id"]), reverse=True)
+    return {"q": q, "terms": terms, "total": len(runs), "runs": runs[:max(1, limit)]}
+
+
+def stats() -> Dict[str, Any]:
+    with _lock:
+        return {"runs": len(_RUNS), "max_runs": _RUNS.maxsize, "terms": len(_POSTINGS), "backfilled": _backfilled}
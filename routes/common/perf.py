@@ -0,0 +1,169 @@
+"""Request timing + SSH round-trip accounting (feeds /_debug/perf)."""
+
+from __future__ import annotations
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Dict, List, Optional
+
+try:
+    from flask import g, has_request_context, request
+except Exception:  # pragma: no cover
+    g = None  # type: ignore
+    request = None  # type: ignore
+
+    def has_request_context() -> bool:  # type: ignore
+        return False
+
+
+# Log-spaced bucket bounds: 0.5 ms .. ~5 min. Fixed size => bounded memory
+# no matter how many requests are recorded.
+_BOUNDS_MS: List[float] = [0.5 * (1.25 ** i) for i in range(58)]
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram with approximate percentiles."""
+
+    __slots__ = ("counts", "count", "total_ms", "min_ms", "max_ms")
+
+    def __init__(self):
+        self.counts = [0] * (len(_BOUNDS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.min_ms: Optional[float] = None
+        self.max_ms: Optional[float] = None
+
+    def add(self, ms: float) -> None:
+        self.counts[bisect_left(_BOUNDS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.min_ms = ms if self.min_ms is None else min(self.min_ms, ms)
+        self.max_ms = ms if self.max_ms is None else max(self.max_ms, ms)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q / 100.0 * self.count
+        seen = 0
+        for idx, n in enumerate(self.counts):
+            if not n:
+                continue
+            if seen + n >= rank:
+                lo = _BOUNDS_MS[idx - 1] if idx > 0 else 0.0
+                hi = _BOUNDS_MS[idx] if idx < len(_BOUNDS_MS) else (self.max_ms or lo)
+                # Linear interpolation inside the bucket, clamped to observed range
+                est = lo + (hi - lo) * ((rank - seen) / n)
+                return round(max(self.min_ms or 0.0, min(est, self.max_ms or est)), 2)
+            seen += n
+        return round(self.max_ms or 0.0, 2)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total_ms / self.count, 2) if self.count else None,
+            "min_ms": round(self.min_ms, 2) if self.min_ms is not None else None,
+            "max_ms": round(self.max_ms, 2) if self.max_ms is not None else None,
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "p99_ms": self.percentile(99),
+        }
+
+
+class _Stats:
+    __slots__ = ("hist", "ssh_calls", "ssh_bytes", "ssh_ms", "errors")
+
+    def __init__(self):
+        self.hist = LatencyHistogram()
+        self.ssh_calls = 0
+        self.ssh_bytes = 0
+        self.ssh_ms = 0.0
+        self.errors = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        d = self.hist.summary()
+        d.update({
+            "errors": self.errors,
+            "ssh_calls": self.ssh_calls,
+            "ssh_bytes": self.ssh_bytes,
+            "ssh_ms": round(self.ssh_ms, 1),
+            "ssh_calls_per_req": round(self.ssh_calls / self.hist.count, 2) if self.hist.count else None,
+        })
+        return d
+
+
+_LOCK = threading.Lock()
+_ENDPOINTS: Dict[str, _Stats] = {}
+# SSH work done outside a request (background runs, updater thread)
+_BACKGROUND = {"ssh_calls": 0, "ssh_bytes": 0, "ssh_ms": 0.0}
+_SINCE = time.time()
+
+
+def record_ssh(elapsed_ms: float, nbytes: int = 0) -> None:
+    """Account one SSH round trip to the current request (or background)."""
+    if has_request_context():
+        acc = getattr(g, "_perf_ssh", None)
+        if acc is not None:
+            acc[0] += 1
+            acc[1] += int(nbytes or 0)
+            acc[2] += float(elapsed_ms)
+            return
+    with _LOCK:
+        _BACKGROUND["ssh_calls"] += 1
+        _BACKGROUND["ssh_bytes"] += int(nbytes or 0)
+        _BACKGROUND["ssh_ms"] += float(elapsed_ms)
+
+
+def _before() -> None:
+    g._perf_t0 = time.perf_counter()
+    g._perf_ssh = [0, 0, 0.0]  # calls, bytes, ms
+
+
+def _after(resp):
+    t0 = getattr(g, "_perf_t0", None)
+    if t0 is None:
+        return resp
+    total_ms = (time.perf_counter() - t0) * 1000.0
+    calls, nbytes, ssh_ms = getattr(g, "_perf_ssh", None) or [0, 0, 0.0]
+    key = request.endpoint or "(unmatched)"
+    with _LOCK:
+        st = _ENDPOINTS.get(key)
+        if st is None:
+            st = _ENDPOINTS[key] = _Stats()
+        st.hist.add(total_ms)
+        st.ssh_calls += calls
+        st.ssh_bytes += nbytes
+        st.ssh_ms += ssh_ms
+        if resp.status_code >= 500:
+            st.errors += 1
+    timing = [f"app;dur={total_ms:.1f}"]
+    if calls:
+        timing.append(f'ssh;desc="{calls} round trips, {nbytes} B";dur={ssh_ms:.1f}')
+    resp.headers.add("Server-Timing", ", ".join(timing))
+    return resp
+
+
+def install_request_timing(app) -> None:
+    """Attach the timing middleware to a Flask app."""
+    app.before_request(_before)
+    app.after_request(_after)
+
+
+def snapshot() -> Dict[str, Any]:
+    with _LOCK:
+        endpoints = {k: v.to_dict() for k, v in _ENDPOINTS.items()}
+        background = dict(_BACKGROUND)
+    background["ssh_ms"] = round(background["ssh_ms"], 1)
+    return {
+        "since": _SINCE,
+        "uptime_s": int(time.time() - _SINCE),
+        "endpoints": dict(sorted(endpoints.items(), key=lambda kv: -(kv[1]["count"] or 0))),
+        "background": background,
+    }
+
+
+def reset() -> None:
+    global _SINCE
+    with _LOCK:
+        _ENDPOINTS.clear()
+        _BACKGROUND.update({"ssh_calls": 0, "ssh_bytes": 0, "ssh_ms": 0.0})
+        _SINCE = time.time()
@@ -0,0 +1,224 @@
+"""Per-host cache of the installed-package inventory (one dpkg-query dump, keyed by the dpkg status file)."""
+
+from __future__ import annotations
+import bisect
+import os
+import shlex
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from routes.common.bounded import BoundedMap
+from routes.common.singleflight import SingleFlight
+from routes.common import pkg_snapshots
+
+ENV_TTL = "RPI_MONITOR_INVENTORY_TTL"
+DEFAULT_TTL = 5.0   # seconds an inventory is trusted without even checking the status file
+
+STATUS_FILE = "/var/lib/dpkg/status"
+# dpkg replaces the status file on every change: inode + mtime + size identify a version of it
+_STAMP = f"stat -c '%i.%Y.%s' {STATUS_FILE} 2>/dev/null"
+_FORMAT = "${Package}\\t${db:Status-Abbrev}\\t${Version}\\t${Architecture}\\t${source:Package}\\n"
+
+# command -> stdout (e.g. utils.ssh_run, or ssh_exec bound to a client)
+Runner = Callable[[str], str]
+
+# name -> (status abbrev, version, arch, source package); "ii"/"hi" = installed.
+# Native-arch and arch "all" packages are keyed by the bare name, other
+# architectures as "name:arch" (libc6 and libc6:armhf on an arm64 host)
+Packages = Dict[str, Tuple[str, str, str, str]]
+
+
+def is_installed(status: str) -> bool:
+    # Status-Abbrev is <desired><state><error>; the state letter counts ("hi" = held, installed)
+    return len(status) >= 2 and status[1] == "i"
+
+
+class Index:
+    """Sorted names for prefix lookups (bisect) and one newline-joined blob for substring scans."""
+
+    def __init__(self, names: Iterable[str]):
+        self.names: List[str] = sorted(names)
+        self.starts: List[int] = []
+        pos = 0
+        for n in self.names:
+            self.starts.append(pos)
+            pos += len(n) + 1
+        self.blob = "\n".join(self.names)
+
+    def prefix(self, q: str, limit: int) -> Tuple[List[str], int]:
+        i = bisect.bisect_left(self.names, q)
+        j = bisect.bisect_left(self.names, q + "\uffff", lo=i)
+        return self.names[i:min(j, i + limit)], j - i
+
+    def substring(self, q: str, limit: int) -> Tuple[List[str], int]:
+        hits: List[str] = []
+        total = 0
+        pos = self.blob.find(q)
+        while pos != -1:
+            k = bisect.bisect_right(self.starts, pos) - 1
+            total += 1
+            if len(hits) < limit:
+                hits.append(self.names[k])
+            # Continue after this name: one hit per package
+            nxt = self.starts[k + 1] if k + 1 < len(self.starts) else len(self.blob)
+            pos = self.blob.find(q, nxt)
+        return hits, total
+
+
+class Inventory:
+    __slots__ = ("host", "stamp", "arch", "ts", "checked", "packages", "_index")
+
+    def __init__(self, host: str, stamp: str, packages: Packages, arch: str = ""):
+        self.host = host
+        self.stamp = stamp
+        self.arch = arch             # dpkg's native architecture
+        self.ts = time.time()        # when the dump was taken
+        self.checked = time.time()   # when the stamp was last compared
+        self.packages = packages
+        self._index: Optional[Index] = None
+
+    def installed(self) -> pkg_snapshots.Installed:
+        return {n: (v, a) for n, (st, v, a, _src) in self.packages.items() if is_installed(st)}
+
+    def index(self) -> Index:
+        if self._index is None:   # built on the first search, reused until the next dump
+            self._index = Index(n for n, (st, _v, _a, _src) in self.packages.items() if is_installed(st))
+        return self._index
+
+    def source_of(self, name: str) -> str:
+        """Source package of a binary package (the name itself when unknown)."""
+        row = self.packages.get(name)
+        return (row[3] if row else "") or name
+
+
+_CACHE: BoundedMap = BoundedMap("common._PKG_INVENTORY", maxsize=32, ttl=24 * 3600)
+_FLIGHT = SingleFlight()
+_lock = threading.Lock()
+
+
+def ttl() -> float:
+    try:
+        return max(0.0, float(os.environ.get(ENV_TTL) or DEFAULT_TTL))
+    except ValueError:
+        return DEFAULT_TTL
+
+
+def key(name: str, arch: str, native: str) -> str:
+    """Inventory key of a package: the bare name unless it is of a foreign architecture."""
+    return name if not native or arch in (native, "all", "") else f"{name}:{arch}"
+
+
+def parse(text: str, native: str = "") -> Packages:
+    """
+    dpkg-query lines -> packages. Without the native architecture every
+    package is keyed by its bare name and of several the installed one wins.
+    """
+    pkgs: Packages = {}
+    for line in (text or "").splitlines():
+        parts = line.split("\t")
+        if len(parts) < 4 or not parts[0]:
+            continue
+        name, status, version, arch = parts[0], parts[1].strip(), parts[2].strip(), parts[3].strip()
+        source = parts[4].strip() if len(parts) > 4 else ""
+        k = key(name, arch, native)
+        if k in pkgs and is_installed(pkgs[k][0]) and not is_installed(status):
+            continue
+        pkgs[k] = (status, version, arch, source or name)
+    return pkgs
+
+
+def _refresh(host: str, run: Runner) -> Inventory:
+    inv = _CACHE.peek(host)
+    known = inv.stamp if inv is not None else ""
+    # One round trip: print the stamp and the native arch, dump the inventory only if the stamp changed
+    script = (f"s=$({_STAMP}); echo \"$s\"; dpkg --print-architecture 2>/dev/null || echo; "
+              f"[ -n \"$s\" ] && [ \"$s\" = {shlex.quote(known)} ] || "
+              f"dpkg-query -W -f={shlex.quote(_FORMAT)} 2>/dev/null")
+    out = run(f"sh -c {shlex.quote(script)}") or ""
+    stamp, _, rest = out.partition("\n")
+    arch, _, body = rest.partition("\n")
+    stamp, arch = stamp.strip(), arch.strip()
+    if not stamp:
+        raise RuntimeError(f"cannot read {STATUS_FILE}")
+    if inv is not None and stamp == inv.stamp and not body.strip():
+        inv.checked = time.time()
+        return inv
+    inv = Inventory(host, stamp, parse(body, arch), arch)
+    with _lock:
+        _CACHE[host] = inv
+    try:
+        pkg_snapshots.record(host, inv.installed())
+    except Exception:
+        pass   # history is best effort; the inventory itself is fine
+    return inv
+
+
+def get(host: str, run: Runner, max_age: Optional[float] = None) -> Inventory:
+    """
+    Inventory of `host`. Within `max_age` (default: RPI_MONITOR_INVENTORY_TTL)
+    of the last check the cached one is returned without contacting the host;
+    otherwise one exec compares the status file and re-dumps only on change.
+    Concurrent callers for a host share that exec.
+    """
+    inv = _CACHE.peek(host)
+    limit = ttl() if max_age is None else max_age
+    if inv is not None and time.time() - inv.checked < limit:
+        return inv
+    inv, _shared = _FLIGHT.do(host, lambda: _refresh(host, run))
+    return inv
+
+
+def status(host: str, run: Runner, names: Iterable[str],
+           max_age: Optional[float] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    name -> {installed, status, version, arch}; unknown packages are not
+    installed. A bare name means the native-arch package, as for apt; a
+    name may also carry an architecture ("libc6:armhf").
+    """
+    inv = get(host, run, max_age)
+    pkgs = inv.packages
+    result: Dict[str, Dict[str, Any]] = {}
+    for name in names:
+        bare, _, want_arch = name.partition(":")
+        st, version, arch, _src = pkgs.get(key(bare, want_arch, inv.arch), ("", "", "", ""))
+        if want_arch and arch != want_arch:
+            st, version, arch = "", "", ""
+        result[name] = {"installed": is_installed(st), "status": st or None,
+                        "version": version or None, "arch": arch or None}
+    return result
+
+
+def search(host: str, run: Runner, q: str, mode: str = "substring", limit: int = 100,
+           max_age: Optional[float] = None) -> Dict[str, Any]:
+    """Installed packages whose name starts with / contains `q` (all of them for an empty q)."""
+    inv = get(host, run, max_age)
+    idx = inv.index()
+    q = (q or "").strip().lower()
+    if not q:
+        names, total = idx.names[:limit], len(idx.names)
+    elif mode == "prefix":
+        names, total = idx.prefix(q, limit)
+    else:
+        names, total = idx.substring(q, limit)
+    return {
+        "total": total,
+        "count": len(idx.names),
+        "ts": inv.ts,
+        "packages": [{"name": n, "version": inv.packages[n][1], "arch": inv.packages[n][2],
+                      "status": inv.packages[n][0]} for n in names],
+    }
+
+
+def invalidate(host: str) -> None:
+    """Force a stamp check on the next get() (e.g. right after an apt transaction)."""
+    inv = _CACHE.peek(host)
+    if inv is not None:
+        inv.checked = 0.0
+
+
+def stats() -> Dict[str, Any]:
+    return {
+        host: {"packages": len(inv.packages), "age": int(time.time() - inv.ts)}
+        for host, inv in _CACHE.items()
+    }
@@ -0,0 +1,131 @@
+"""Installed-package snapshots per host (gzip TSV, one per dpkg change) and diffs between them."""
+
+from __future__ import annotations
+import gzip
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from routes.common.bounded import BoundedMap
+from routes.common import debversion
+from routes.common.fs import get_logs_dir
+
+ENV_KEEP = "RPI_MONITOR_INVENTORY_KEEP"
+DEFAULT_KEEP = 200   # snapshots per host; the oldest are deleted first
+
+DIR_NAME = "inventory"
+
+# name -> (version, arch) of the installed packages
+Installed = Dict[str, Tuple[str, str]]
+
+_lock = threading.Lock()
+_LOADED: BoundedMap = BoundedMap("common._PKG_SNAPSHOTS", maxsize=16, ttl=3600)
+_RX_FILE = re.compile(r"^(\d+)-(\d+)\.tsv\.gz$")   # <epoch>-<package count>.tsv.gz
+
+
+def keep() -> int:
+    try:
+        return max(1, int(os.environ.get(ENV_KEEP) or DEFAULT_KEEP))
+    except ValueError:
+        return DEFAULT_KEEP
+
+
+def _host_dir(host: str, create: bool = False) -> str:
+    d = os.path.join(get_logs_dir(), DIR_NAME, re.sub(r"[^A-Za-z0-9._-]", "_", host) or "_")
+    if create:
+        os.makedirs(d, exist_ok=True)
+    return d
+
+
+def _encode(installed: Installed) -> bytes:
+    lines = "".join(f"{n}\t{v}\t{a}\n" for n, (v, a) in sorted(installed.items()))
+    return gzip.compress(lines.encode("utf-8"), mtime=0)
+
+
+def list_snapshots(host: str) -> List[Dict[str, Any]]:
+    """[{id, ts, count, bytes}] oldest first."""
+    d = _host_dir(host)
+    try:
+        names = os.listdir(d)
+    except FileNotFoundError:
+        return []
+    snaps = []
+    for fn in names:
+        m = _RX_FILE.match(fn)
+        if m:
+            snaps.append({"id": int(m.group(1)), "ts": int(m.group(1)), "count": int(m.group(2)),
+                          "bytes": os.path.getsize(os.path.join(d, fn))})
+    return sorted(snaps, key=lambda s: s["id"])
+
+
+def load(host: str, snap_id: int) -> Optional[Installed]:
+    key = (host, snap_id)
+    cached = _LOADED.get(key)
+    if cached is not None:
+        return cached
+    for s in list_snapshots(host):
+        if s["id"] == snap_id:
+            path = os.path.join(_host_dir(host), f"{s['id']}-{s['count']}.tsv.gz")
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                installed = {}
+                for line in f:
+                    parts = line.rstrip("\n").split("\t")
+                    if len(parts) >= 3:
+                        installed[parts[0]] = (parts[1], parts[2])
+            _LOADED[key] = installed
+            return installed
+    return None
+
+
+def record(host: str, installed: Installed, now: Optional[float] = None) -> Optional[int]:
+    """Store a snapshot unless it equals the latest one; returns the new id (or None)."""
+    data = _encode(installed)
+    with _lock:
+        snaps = list_snapshots(host)
+        d = _host_dir(host, create=True)
+        if snaps:
+            last = snaps[-1]
+            with open(os.path.join(d, f"{last['id']}-{last['count']}.tsv.gz"), "rb") as f:
+                if f.read() == data:
+                    return None   # status file rewritten without a package change
+        snap_id = max(int(now or time.time()), snaps[-1]["id"] + 1 if snaps else 0)
+        path = os.path.join(d, f"{snap_id}-{len(installed)}.tsv.gz")
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        for old in snaps[:max(0, len(snaps) + 1 - keep())]:
+            try:
+                os.remove(os.path.join(d, f"{old['id']}-{old['count']}.tsv.gz"))
+            except OSError:
+                pass
+    _LOADED[(host, snap_id)] = dict(installed)
+    return snap_id
+
+
+def at(host: str, ts: float) -> Optional[Dict[str, Any]]:
+    """Latest snapshot taken at or before `ts` (the oldest one if all are newer)."""
+    snaps = list_snapshots(host)
+    if not snaps:
+        return None
+    before = [s for s in snaps if s["ts"] <= ts]
+    return before[-1] if before else snaps[0]
+
+
+def diff(old: Installed, new: Installed) -> Dict[str, List[Dict[str, Any]]]:
+    """added / removed / upgraded / downgraded / changed (same version, other arch) between two snapshots."""
+    out: Dict[str, List[Dict[str, Any]]] = {"added": [], "removed": [], "upgraded": [], "downgraded": [], "changed": []}
+    for name in sorted(new.keys() - old.keys()):
+        out["added"].append({"name": name, "version": new[name][0], "arch": new[name][1]})
+    for name in sorted(old.keys() - new.keys()):
+        out["removed"].append({"name": name, "version": old[name][0], "arch": old[name][1]})
+    for name in sorted(old.keys() & new.keys()):
+        (v1, a1), (v2, a2) = old[name], new[name]
+        if (v1, a1) == (v2, a2):
+            continue
+        c = debversion.compare(v2, v1)
+        kind = "upgraded" if c > 0 else ("downgraded" if c < 0 else "changed")
+        out[kind].append({"name": name, "from": v1, "to": v2, "arch": a2})
+    return out
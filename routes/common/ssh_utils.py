@@ -1,9 +1,14 @@
 # routes/ssh_utils.py
 # Robust SSH helpers til Linux/Pi Monitor
 
+import codecs
 import os
+import select
+import time
 import paramiko
-from typing import List, Tuple, Optional
+from typing import Callable, Iterator, List, Tuple, Optional
+
+from routes.common.perf import record_ssh
 
 
 # -------------------------
@@ -173,6 +178,8 @@ def ssh_exec(
     - shell=True => kør via 'sh -lc "<cmd>"' så pipes/&&/|| virker.
     - get_pty=True kan tvinges for programmer der gerne vil have TTY.
     """
+    t0 = time.perf_counter()
+    nbytes = 0
     try:
         run_cmd = f'sh -lc "{_quote_sh(cmd)}"' if shell else cmd
         stdin, stdout, stderr = ssh.exec_command(run_cmd, timeout=timeout, get_pty=get_pty)
@@ -181,12 +188,15 @@ def ssh_exec(
             stderr.channel.settimeout(timeout)
         except Exception:
             pass
-        out = stdout.read().decode(errors="replace")
-        err = stderr.read().decode(errors="replace")
+        raw_out = stdout.read()
+        raw_err = stderr.read()
+        nbytes = len(raw_out) + len(raw_err)
         rc = stdout.channel.recv_exit_status()
-        return rc, out, err
+        return rc, raw_out.decode(errors="replace"), raw_err.decode(errors="replace")
     except Exception as e:
         return 255, "", f"exec_error({cmd}): {e}"
+    finally:
+        record_ssh((time.perf_counter() - t0) * 1000.0, nbytes)
 
 
 def ssh_exec_shell(ssh: paramiko.SSHClient, cmd: str, timeout: int = 20) -> Tuple[int, str, str]:
@@ -194,6 +204,154 @@ def ssh_exec_shell(ssh: paramiko.SSHClient, cmd: str, timeout: int = 20) -> Tupl
     return ssh_exec(ssh, cmd, timeout=timeout, shell=True)
 
 
+# -------------------------
+# Streaming exec
+# -------------------------
+STREAM_CHUNK = 64 * 1024
+PARTIAL_FLUSH_S = 0.25  # hand over an unterminated line (prompt, progress) after this much quiet
+
+
+class _Splitter:
+    """Incremental UTF-8 decode + line split for one stream."""
+
+    __slots__ = ("dec", "buf", "lines")
+
+    def __init__(self, lines: bool):
+        self.dec = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.buf = ""
+        self.lines = lines
+
+    def feed(self, data: bytes) -> List[str]:
+        text = self.dec.decode(data)
+        if not self.lines:
+            return [text] if text else []
+        text = self.buf + text
+        if "\n" not in text:
+            self.buf = text
+            return self.flush() if len(text) >= STREAM_CHUNK else []
+        head, _, self.buf = text.rpartition("\n")
+        return [ln + "\n" for ln in head.split("\n")]
+
+    def flush(self) -> List[str]:
+        text, self.buf = self.buf, ""
+        return [text] if text else []
+
+    def close(self) -> List[str]:
+        tail = self.dec.decode(b"", final=True)
+        if tail:
+            self.buf += tail
+        return self.flush()
+
+
+def iter_ssh_stream(
+    ssh: paramiko.SSHClient,
+    cmd: str,
+    timeout: Optional[float] = 3600,
+    get_pty: bool = False,
+    lines: bool = True,
+    idle_interval: Optional[float] = None,
+) -> Iterator[Tuple[str, object]]:
+    """
+    Run a command and hand its output over as it arrives.
+
+    Yields ("stdout"|"stderr", text) - whole lines ending in "\n" when
+    lines=True (an unterminated tail is handed over after a short quiet
+    spell), raw decoded chunks otherwise - then ("exit", rc) last.
+    ("idle", seconds) is yielded every `idle_interval` without output.
+    Waits on the channel with select(), which is green under eventlet, and
+    reads up to 64 KB per call; there are no fixed sleeps. Raises
+    TimeoutError when `timeout` (whole command) runs out.
+    """
+    t0 = time.perf_counter()
+    nbytes = 0
+    try:
+        _stdin, stdout, _stderr = ssh.exec_command(cmd, get_pty=get_pty)
+        chan = stdout.channel
+        chan.setblocking(False)
+        streams = (
+            ("stdout", chan.recv_ready, chan.recv, _Splitter(lines)),
+            ("stderr", chan.recv_stderr_ready, chan.recv_stderr, _Splitter(lines)),
+        )
+        start = time.monotonic()
+        last_data = last_idle = start
+        while True:
+            got = False
+            for name, ready, recv, split in streams:
+                while ready():
+                    try:
+                        data = recv(STREAM_CHUNK)
+                    except Exception:
+                        break
+                    if not data:
+                        break
+                    got = True
+                    nbytes += len(data)
+                    for text in split.feed(data):
+                        yield name, text
+            now = time.monotonic()
+            if got:
+                last_data = last_idle = now
+            if chan.eof_received or chan.closed:
+                if not (chan.recv_ready() or chan.recv_stderr_ready()):
+                    break
+                continue
+            if got:
+                continue
+            # Nothing buffered: wait for the channel (stdout/stderr/eof all wake it)
+            waits = []
+            if timeout:
+                waits.append(start + timeout - now)
+            if idle_interval:
+                waits.append(last_idle + idle_interval - now)
+            partial = any(split.buf for _, _, _, split in streams)
+            if partial:
+                waits.append(last_data + PARTIAL_FLUSH_S - now)
+            if timeout and now - start >= timeout:
+                chan.close()
+                raise TimeoutError(f"command timed out after {timeout}s")
+            if partial and now - last_data >= PARTIAL_FLUSH_S:
+                for name, _, _, split in streams:
+                    for text in split.flush():
+                        yield name, text
+                continue
+            if idle_interval and now - last_idle >= idle_interval:
+                last_idle = now
+                yield "idle", round(now - last_data, 1)
+                continue
+            select.select([chan], [], [], max(0.0, min(waits)) if waits else None)
+        for name, _, _, split in streams:
+            for text in split.close():
+                yield name, text
+        yield "exit", chan.recv_exit_status()
+    finally:
+        record_ssh((time.perf_counter() - t0) * 1000.0, nbytes)
+
+
+def ssh_stream(
+    ssh: paramiko.SSHClient,
+    cmd: str,
+    on_stdout: Optional[Callable[[str], None]] = None,
+    on_stderr: Optional[Callable[[str], None]] = None,
+    on_idle: Optional[Callable[[float], None]] = None,
+    **kw,
+) -> int:
+    """Callback form of iter_ssh_stream; returns the exit code."""
+    rc = 255
+    for kind, val in iter_ssh_stream(ssh, cmd, **kw):
+        if kind == "stdout":
+            if on_stdout:
+                on_stdout(val)  # type: ignore[arg-type]
+        elif kind == "stderr":
+            if on_stderr:
+                on_stderr(val)  # type: ignore[arg-type]
+        elif kind == "idle":
+            if on_idle:
+                on_idle(val)  # type: ignore[arg-type]
+        elif kind == "exit":
+            rc = int(val)  # type: ignore[arg-type]
+    return rc
+
+
 # -------------------------
 # Key generation
 # -------------------------
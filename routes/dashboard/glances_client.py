@@ -13,10 +13,13 @@ try:
 except Exception:  # pragma: no cover
     get_active_profile = None  # type: ignore
 
+from routes.common.bounded import BoundedMap
+
 _API_PREFIX: Optional[str] = None
 _API_CANDIDATES = ('/api/4', '/api/3')
 _NUMERIC_RE = re.compile(r'[-+]?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?')
-_NET_COUNTERS: Dict[str, Dict[str, float]] = {}
+# (base_url, iface) -> last counter sample; per host so profile switches don't mix
+_NET_COUNTERS: BoundedMap = BoundedMap("glances_client._NET_COUNTERS", maxsize=256, ttl=600)
 _PREFIX_FACTORS = {
     '': 1.0,
     'k': 1024.0,
@@ -172,7 +175,7 @@ def _counter_rate_kbps(sample: Dict[str, Any], direction: str, iface: str) -> Op
         f"total_{direction}",
     )
     now = time.time()
-    store = _NET_COUNTERS.setdefault(iface, {})
+    store = _NET_COUNTERS.setdefault((glances_base_url() or '', iface), {})
     ts_key = f"{direction}_ts"
     val_key = f"{direction}_value"
     value = None
@@ -2,17 +2,19 @@ from __future__ import annotations
 
 from typing import Tuple
 import time
-from .ssh_client import ssh_run
+from .ssh_client import ssh_run, active_host
+from routes.common.bounded import BoundedMap
 
 
-_last_stats = {"rx": None, "tx": None, "time": None}
+# host -> {"rx", "tx", "time"} from the previous sample
+_last_stats: BoundedMap = BoundedMap("metrics_net._last_stats", maxsize=64, ttl=600)
 
 
 def parse_net_speed() -> Tuple[float, float, float, str]:
     """Return (total_kBps, rx_kBps, tx_kBps, best_iface).
 
     Scans /proc/net/dev for the busiest interface and computes deltas since the
-    last call, matching the previous app behavior.
+    last call for the same host, matching the previous app behavior.
     """
     txt = ssh_run("cat /proc/net/dev") or ""
     best_iface, rx, tx, best_total = None, 0, 0, 0
@@ -28,14 +30,15 @@ def parse_net_speed() -> Tuple[float, float, float, str]:
                     best_iface, rx, tx, best_total = iface.strip(), curr_rx, curr_tx, total
 
     now = time.time()
-    if _last_stats["rx"] is None:
-        _last_stats.update({"rx": rx, "tx": tx, "time": now})
+    host = active_host()
+    prev = _last_stats.get(host)
+    _last_stats[host] = {"rx": rx, "tx": tx, "time": now}
+    if prev is None:
         return 0.0, 0.0, 0.0, best_iface or "?"
 
-    dt = now - (_last_stats["time"] or now)
-    drx = (rx - (_last_stats["rx"] or 0)) / dt if dt > 0 else 0
-    dtx = (tx - (_last_stats["tx"] or 0)) / dt if dt > 0 else 0
-    _last_stats.update({"rx": rx, "tx": tx, "time": now})
+    dt = now - (prev["time"] or now)
+    drx = (rx - (prev["rx"] or 0)) / dt if dt > 0 else 0
+    dtx = (tx - (prev["tx"] or 0)) / dt if dt > 0 else 0
     total_kBps = round((drx + dtx) / 1024.0, 1)
     rx_kBps = round(drx / 1024.0, 1)
     tx_kBps = round(dtx / 1024.0, 1)
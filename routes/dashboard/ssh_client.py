@@ -22,3 +22,12 @@ def ssh_run(cmd: str) -> str:
         logging.getLogger(__name__).warning("ssh_run error: %s", e)
         return ""
 
+
+
+def active_host() -> str:
+    """Host of the profile ssh_run talks to ('' when none is configured)."""
+    try:
+        from utils import _load_active_profile  # lazy import avoids cycles
+        return (_load_active_profile() or {}).get("host", "") or ""
+    except Exception:  # pragma: no cover
+        return ""
@@ -0,0 +1,7 @@
+# routes/debug/__init__.py
+from flask import Blueprint
+
+# Diagnostics under /_debug/* (health/config/routes live in app.py)
+debug_bp = Blueprint("debug", __name__)
+
+from . import views_debug  # noqa: F401
@@ -0,0 +1,211 @@
+# routes/debug/hub_watch.py
+# Greenlet/thread inventory and an opt-in watchdog for eventlet hub stalls.
+
+from __future__ import annotations
+import gc
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+try:
+    import greenlet as _greenlet
+except Exception:  # pragma: no cover
+    _greenlet = None  # type: ignore
+
+try:
+    import eventlet
+    from eventlet import patcher as _patcher
+    # The watchdog must run on a real OS thread; a green thread would be
+    # blocked by the very stall it is supposed to observe.
+    _real_threading = _patcher.original("threading")
+    _real_time = _patcher.original("time")
+except Exception:  # pragma: no cover
+    eventlet = None  # type: ignore
+    _real_threading = threading
+    _real_time = time
+
+STACK_LIMIT = 40
+STALL_RING_SIZE = 50
+ENV_THRESHOLD = "RPI_MONITOR_HUB_WATCHDOG_MS"
+
+
+def format_stack(frame, limit: int = STACK_LIMIT) -> List[str]:
+    """Return 'file:line in func: code' entries, innermost call last."""
+    if frame is None:
+        return []
+    out: List[str] = []
+    for fs in traceback.extract_stack(frame, limit=limit):
+        code = (fs.line or "").strip()
+        out.append(f"{fs.filename}:{fs.lineno} in {fs.name}" + (f": {code}" if code else ""))
+    return out
+
+
+def list_threads(with_stacks: bool = True) -> List[Dict[str, Any]]:
+    """OS threads as seen by the interpreter (sys._current_frames)."""
+    names: Dict[int, str] = {}
+    for mod in (threading, _real_threading):
+        try:
+            for t in mod.enumerate():
+                if t.ident is not None:
+                    names.setdefault(t.ident, t.name)
+        except Exception:
+            pass
+    items: List[Dict[str, Any]] = []
+    for ident, frame in sys._current_frames().items():
+        item: Dict[str, Any] = {
+            "ident": ident,
+            "name": names.get(ident, ""),
+            "top": f"{frame.f_code.co_filename}:{frame.f_lineno} in {frame.f_code.co_name}",
+        }
+        if with_stacks:
+            item["stack"] = format_stack(frame)
+        items.append(item)
+    items.sort(key=lambda x: x["ident"])
+    return items
+
+
+def list_greenlets(with_stacks: bool = True) -> List[Dict[str, Any]]:
+    """All live greenlets found by the garbage collector."""
+    if _greenlet is None:
+        return []
+    current = _greenlet.getcurrent()
+    items: List[Dict[str, Any]] = []
+    for obj in gc.get_objects():
+        try:
+            if not isinstance(obj, _greenlet.greenlet) or obj.dead:
+                continue
+        except Exception:
+            continue
+        frame = obj.gr_frame
+        item: Dict[str, Any] = {
+            "id": id(obj),
+            "type": type(obj).__name__,
+            "current": obj is current,
+            "started": bool(obj) or frame is not None,
+            "parent": id(obj.parent) if obj.parent is not None else None,
+            "top": (f"{frame.f_code.co_filename}:{frame.f_lineno} in {frame.f_code.co_name}" if frame else ""),
+        }
+        if with_stacks:
+            # gr_frame is None for the running greenlet; use our own frame instead
+            item["stack"] = format_stack(frame if frame is not None else (sys._getframe(1) if obj is current else None))
+        items.append(item)
+    return items
+
+
+class HubWatchdog:
+    """
+    Detect eventlet hub stalls.
+
+    A green heartbeat ticks every `interval`; a real OS thread checks how old
+    the last tick is. When it exceeds the threshold, the hub thread's current
+    stack (the code that is hogging the hub) is recorded in a bounded ring.
+    """
+
+    def __init__(self, maxlen: int = STALL_RING_SIZE):
+        self._lock = _real_threading.Lock()
+        self._stalls: Deque[Dict[str, Any]] = deque(maxlen=maxlen)
+        self._gen = 0
+        self._beat = 0.0
+        self._hub_ident: Optional[int] = None
+        self.threshold_ms = 0
+        self.interval_ms = 0
+        self.started_at: Optional[float] = None
+        self.total_stalls = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold_ms > 0
+
+    def start(self, threshold_ms: int) -> None:
+        if eventlet is None:
+            raise RuntimeError("eventlet not available")
+        threshold_ms = int(threshold_ms)
+        if threshold_ms <= 0:
+            raise ValueError("threshold_ms must be > 0")
+        self.stop()
+        with self._lock:
+            self._gen += 1
+            gen = self._gen
+            self.threshold_ms = threshold_ms
+            self.interval_ms = max(5, min(250, threshold_ms // 4))
+            # Called from a green context, so this is the hub's OS thread
+            self._hub_ident = _real_threading.get_ident()
+            self._beat = _real_time.monotonic()
+            self.started_at = time.time()
+        eventlet.spawn(self._heartbeat, gen)
+        t = _real_threading.Thread(target=self._monitor, args=(gen,), name="hub-watchdog", daemon=True)
+        t.start()
+
+    def stop(self) -> None:
+        with self._lock:
+            self._gen += 1
+            self.threshold_ms = 0
+            self.started_at = None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._stalls.clear()
+            self.total_stalls = 0
+
+    def _heartbeat(self, gen: int) -> None:
+        while gen == self._gen:
+            self._beat = _real_time.monotonic()
+            eventlet.sleep(self.interval_ms / 1000.0)
+
+    def _monitor(self, gen: int) -> None:
+        reported_beat = None
+        record: Optional[Dict[str, Any]] = None
+        while gen == self._gen:
+            _real_time.sleep(self.interval_ms / 1000.0)
+            beat = self._beat
+            lag_ms = (_real_time.monotonic() - beat) * 1000.0 - self.interval_ms
+            if lag_ms < self.threshold_ms:
+                record = None
+                continue
+            if beat == reported_beat and record is not None:
+                # Same stall still in progress: just extend its duration
+                record["stalled_ms"] = int(lag_ms)
+                continue
+            frame = sys._current_frames().get(self._hub_ident or -1)
+            record = {
+                "ts": time.time(),
+                "stalled_ms": int(lag_ms),
+                "threshold_ms": self.threshold_ms,
+                "stack": format_stack(frame),
+            }
+            reported_beat = beat
+            with self._lock:
+                self._stalls.append(record)
+                self.total_stalls += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            stalls = [dict(s) for s in self._stalls]
+        return {
+            "enabled": self.enabled,
+            "available": eventlet is not None,
+            "threshold_ms": self.threshold_ms,
+            "interval_ms": self.interval_ms,
+            "started_at": self.started_at,
+            "total_stalls": self.total_stalls,
+            "ring_size": self._stalls.maxlen,
+            "stalls": stalls,
+        }
+
+
+watchdog = HubWatchdog()
+
+
+def start_from_env() -> None:
+    """Opt-in at startup via RPI_MONITOR_HUB_WATCHDOG_MS=<threshold>."""
+    raw = (os.environ.get(ENV_THRESHOLD) or "").strip()
+    if not raw:
+        return
+    try:
+        watchdog.start(int(raw))
+    except Exception as e:
+        print(f"[hub_watch] watchdog not started: {e}")
@@ -0,0 +1,182 @@
+# routes/debug/memory.py
+# tracemalloc snapshots/diffs + sizes of the long-lived module registries.
+
+from __future__ import annotations
+import importlib
+import sys
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from routes.common.bounded import BoundedMap, all_stats
+
+MAX_SNAPSHOTS = 4
+_GROUPS = ("lineno", "filename", "traceback")
+
+# (label, module, attribute) for module-level state that lives as long as the process
+KNOWN_REGISTRIES: List[Tuple[str, str, str]] = [
+    ("updates._RUNS", "routes.updates.views_updates", "_RUNS"),
+    ("keepass._RUNS", "routes.keepass.views_keepass", "_RUNS"),
+    ("glances_client._NET_COUNTERS", "routes.dashboard.glances_client", "_NET_COUNTERS"),
+    ("commands_api._RATE_BUCKETS", "routes.terminal.commands_api", "_RATE_BUCKETS"),
+    ("metrics_net._last_stats", "routes.dashboard.metrics_net", "_last_stats"),
+    ("log_search._RUNS", "routes.common.log_search", "_RUNS"),
+    ("log_search._POSTINGS", "routes.common.log_search", "_POSTINGS"),
+]
+
+_lock = threading.Lock()
+_snapshots: "OrderedDict[int, Tuple[float, tracemalloc.Snapshot]]" = OrderedDict()
+_next_id = 1
+
+
+def _filtered(snap: tracemalloc.Snapshot) -> tracemalloc.Snapshot:
+    return snap.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        tracemalloc.Filter(False, "<unknown>"),
+    ))
+
+
+def _fmt_trace(tb: tracemalloc.Traceback, group: str) -> str:
+    if group == "filename":
+        return tb[0].filename
+    if group == "traceback":
+        return " <- ".join(f"{f.filename}:{f.lineno}" for f in tb)
+    return f"{tb[0].filename}:{tb[0].lineno}"
+
+
+def status() -> Dict[str, Any]:
+    tracing = tracemalloc.is_tracing()
+    cur, peak = tracemalloc.get_traced_memory() if tracing else (0, 0)
+    with _lock:
+        snaps = [{"id": sid, "ts": ts} for sid, (ts, _) in _snapshots.items()]
+    return {
+        "tracing": tracing,
+        "nframes": tracemalloc.get_traceback_limit() if tracing else 0,
+        "traced_bytes": cur,
+        "traced_peak_bytes": peak,
+        "overhead_bytes": tracemalloc.get_tracemalloc_memory() if tracing else 0,
+        "snapshots": snaps,
+        "registries": registry_sizes(),
+    }
+
+
+def start(nframes: int = 1) -> None:
+    nframes = max(1, min(int(nframes or 1), 25))
+    if tracemalloc.is_tracing():
+        return
+    tracemalloc.start(nframes)
+
+
+def stop() -> None:
+    """Stop tracing; stored snapshots are dropped with it."""
+    with _lock:
+        _snapshots.clear()
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def take_snapshot(top: int = 25, group: str = "lineno") -> Dict[str, Any]:
+    global _next_id
+    if not tracemalloc.is_tracing():
+        raise RuntimeError("tracemalloc is not running (POST /_debug/memory/start first)")
+    group = group if group in _GROUPS else "lineno"
+    snap = _filtered(tracemalloc.take_snapshot())
+    ts = time.time()
+    with _lock:
+        sid = _next_id
+        _next_id += 1
+        _snapshots[sid] = (ts, snap)
+        while len(_snapshots) > MAX_SNAPSHOTS:
+            _snapshots.popitem(last=False)
+    stats = snap.statistics(group)
+    return {
+        "id": sid,
+        "ts": ts,
+        "group": group,
+        "total_bytes": sum(s.size for s in stats),
+        "total_blocks": sum(s.count for s in stats),
+        "top": [
+            {"where": _fmt_trace(s.traceback, group), "bytes": s.size, "blocks": s.count}
+            for s in stats[:top]
+        ],
+    }
+
+
+def _get(sid: Optional[int]) -> Tuple[int, float, tracemalloc.Snapshot]:
+    with _lock:
+        if not _snapshots:
+            raise LookupError("no snapshots taken yet")
+        if sid is None:
+            sid = next(iter(_snapshots))
+        if sid not in _snapshots:
+            raise LookupError(f"unknown snapshot id {sid}")
+        ts, snap = _snapshots[sid]
+    return sid, ts, snap
+
+
+def diff(a: Optional[int] = None, b: Optional[int] = None, top: int = 25, group: str = "lineno") -> Dict[str, Any]:
+    """Compare snapshot `a` (default: oldest kept) with `b` (default: a fresh one)."""
+    group = group if group in _GROUPS else "lineno"
+    a_id, a_ts, old = _get(a)
+    if b is None:
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc is not running")
+        b_id, b_ts, new = None, time.time(), _filtered(tracemalloc.take_snapshot())
+    else:
+        b_id, b_ts, new = _get(b)
+    stats = new.compare_to(old, group)
+    return {
+        "a": a_id,
+        "b": b_id if b_id is not None else "current",
+        "seconds": round(b_ts - a_ts, 1),
+        "group": group,
+        "size_diff_bytes": sum(s.size_diff for s in stats),
+        "top": [
+            {
+                "where": _fmt_trace(s.traceback, group),
+                "size_diff_bytes": s.size_diff,
+                "bytes": s.size,
+                "count_diff": s.count_diff,
+                "blocks": s.count,
+            }
+            for s in stats[:top]
+        ],
+    }
+
+
+def registry_sizes() -> List[Dict[str, Any]]:
+    """Entry counts (plus eviction stats for BoundedMaps) of long-lived registries."""
+    out: List[Dict[str, Any]] = []
+    for label, mod_name, attr in KNOWN_REGISTRIES:
+        item: Dict[str, Any] = {"name": label, "loaded": False}
+        try:
+            mod = sys.modules.get(mod_name) or importlib.import_module(mod_name)
+            obj = getattr(mod, attr)
+        except Exception as e:
+            item["error"] = str(e)
+            out.append(item)
+            continue
+        item["loaded"] = True
+        item["type"] = type(obj).__name__
+        if isinstance(obj, BoundedMap):
+            item.update(obj.stats())
+            item["name"] = label
+        try:
+            item["entries"] = len(obj)
+        except Exception:
+            item["entries"] = None
+        try:
+            item["shallow_bytes"] = sys.getsizeof(obj)
+        except Exception:
+            item["shallow_bytes"] = None
+        out.append(item)
+    # Any other bounded map (caches etc.) registers itself by name
+    known = {it.get("name") for it in out}
+    for st in all_stats():
+        if st["name"] not in known:
+            out.append({"loaded": True, "type": "BoundedMap", **st})
+    return out
@@ -0,0 +1,172 @@
+# routes/debug/profiler.py
+# Low-overhead sampling profiler (OS threads + suspended greenlets).
+
+from __future__ import annotations
+import gc
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from .hub_watch import _greenlet, _real_threading, _real_time, eventlet
+
+MAX_SECONDS = 60
+MAX_HZ = 1000
+MAX_DEPTH = 64
+_GREENLET_REFRESH_S = 1.0
+_HUB_MARK = os.sep + os.path.join("eventlet", "hubs") + os.sep
+
+_busy = threading.Lock()
+
+
+def _label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _walk(frame) -> Tuple[str, ...]:
+    """Frame chain as labels, root first."""
+    out: List[str] = []
+    while frame is not None and len(out) < MAX_DEPTH:
+        out.append(_label(frame.f_code))
+        frame = frame.f_back
+    out.reverse()
+    return tuple(out)
+
+
+def _is_idle(frame) -> bool:
+    """True when the innermost frame is the eventlet hub waiting for I/O."""
+    return frame is not None and _HUB_MARK in frame.f_code.co_filename
+
+
+class SamplingProfiler:
+    """
+    Periodically snapshot stacks from a real OS thread, so sampling keeps
+    going even while the hub is blocked. The running greenlet is visible via
+    its OS thread's frame; suspended greenlets (waiting on I/O, sleeps, locks)
+    are sampled from gr_frame when `greenlets` is on (wall-clock view).
+    """
+
+    def __init__(self, seconds: float, hz: int, greenlets: bool = True, idle: bool = False,
+                 exclude_greenlet: Optional[int] = None):
+        self.seconds = max(0.1, min(float(seconds), MAX_SECONDS))
+        self.hz = max(1, min(int(hz), MAX_HZ))
+        self.greenlets = bool(greenlets) and _greenlet is not None
+        self.idle = bool(idle)
+        self._exclude = {exclude_greenlet} if exclude_greenlet else set()
+        if eventlet is not None:
+            # Resolve the hub here: get_hub() is per OS thread, and the
+            # sampler runs on its own thread.
+            try:
+                from eventlet import hubs
+                self._exclude.add(id(hubs.get_hub().greenlet))
+            except Exception:
+                pass
+        self.stacks: Counter = Counter()
+        self.ticks = 0
+        self.samples = 0
+        self.elapsed = 0.0
+        self._ident: Optional[int] = None
+
+    def _live_greenlets(self) -> List[Any]:
+        found = []
+        for obj in gc.get_objects():
+            try:
+                if isinstance(obj, _greenlet.greenlet) and not obj.dead and id(obj) not in self._exclude:
+                    found.append(obj)
+            except Exception:
+                continue
+        return found
+
+    def _tick(self, greenlets: List[Any]) -> None:
+        self.ticks += 1
+        for ident, frame in sys._current_frames().items():
+            if ident == self._ident:
+                continue
+            if not self.idle and _is_idle(frame):
+                continue
+            self.stacks[("[thread]",) + _walk(frame)] += 1
+            self.samples += 1
+        for gr in greenlets:
+            try:
+                frame = gr.gr_frame
+            except Exception:
+                continue
+            if frame is None:
+                continue
+            self.stacks[("[greenlet]",) + _walk(frame)] += 1
+            self.samples += 1
+
+    def _loop(self) -> None:
+        self._ident = _real_threading.get_ident()
+        interval = 1.0 / self.hz
+        start = _real_time.monotonic()
+        deadline = start + self.seconds
+        greenlets: List[Any] = []
+        refreshed = 0.0
+        while True:
+            now = _real_time.monotonic()
+            if now >= deadline:
+                break
+            if self.greenlets and now - refreshed >= _GREENLET_REFRESH_S:
+                greenlets = self._live_greenlets()
+                refreshed = now
+            self._tick(greenlets)
+            _real_time.sleep(max(0.0, interval - (_real_time.monotonic() - now)))
+        self.elapsed = _real_time.monotonic() - start
+
+    def run(self) -> "SamplingProfiler":
+        """Sample for `seconds`; the caller only waits cooperatively."""
+        t = _real_threading.Thread(target=self._loop, name="debug-profiler", daemon=True)
+        t.start()
+        # time.sleep is green under monkey_patch, so the hub keeps serving
+        while t.is_alive():
+            time.sleep(0.05)
+        return self
+
+    # ---- output -------------------------------------------------------
+    def collapsed(self) -> str:
+        """Brendan Gregg's folded format: 'root;child;leaf count'."""
+        lines = [";".join(stack) + f" {n}" for stack, n in self.stacks.most_common()]
+        return "\n".join(lines) + ("\n" if lines else "")
+
+    def top(self, n: int = 25) -> Dict[str, List[Dict[str, Any]]]:
+        self_c: Counter = Counter()
+        total_c: Counter = Counter()
+        for stack, cnt in self.stacks.items():
+            frames = stack[1:]
+            if not frames:
+                continue
+            self_c[frames[-1]] += cnt
+            for fn in set(frames):
+                total_c[fn] += cnt
+        denom = max(1, self.samples)
+
+        def _rows(c: Counter):
+            return [{"function": fn, "samples": k, "percent": round(100.0 * k / denom, 2)}
+                    for fn, k in c.most_common(n)]
+
+        return {"self": _rows(self_c), "total": _rows(total_c)}
+
+    def summary(self, n: int = 25) -> Dict[str, Any]:
+        return {
+            "seconds": round(self.elapsed, 3),
+            "hz": self.hz,
+            "ticks": self.ticks,
+            "samples": self.samples,
+            "distinct_stacks": len(self.stacks),
+            "greenlets": self.greenlets,
+            "idle": self.idle,
+            "top": self.top(n),
+        }
+
+
+def profile(seconds: float, hz: int, **kw) -> SamplingProfiler:
+    """Run one profile; only one may run at a time."""
+    if not _busy.acquire(blocking=False):
+        raise RuntimeError("profiler already running")
+    try:
+        return SamplingProfiler(seconds, hz, **kw).run()
+    finally:
+        _busy.release()
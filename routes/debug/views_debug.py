@@ -0,0 +1,133 @@
+# routes/debug/views_debug.py
+# Runtime diagnostics for the monitor process itself.
+
+from __future__ import annotations
+import time
+
+from flask import Response, jsonify, request
+
+from . import debug_bp
+from routes.common import perf
+from .hub_watch import _greenlet, list_greenlets, list_threads, watchdog, start_from_env
+from .profiler import profile
+from . import memory
+
+
+def _flag(name: str, default: bool = True) -> bool:
+    raw = request.args.get(name)
+    if raw is None:
+        return default
+    return raw.strip().lower() not in ("0", "false", "no", "off")
+
+
+@debug_bp.get("/_debug/greenlets")
+def debug_greenlets():
+    """Live greenlets + OS threads with stacks, and the hub watchdog ring.
+
+    Query: ?stacks=0 to omit stacks (cheaper on big processes).
+    """
+    stacks = _flag("stacks")
+    greenlets = list_greenlets(with_stacks=stacks)
+    threads = list_threads(with_stacks=stacks)
+    return jsonify({
+        "time": time.time(),
+        "greenlet_count": len(greenlets),
+        "thread_count": len(threads),
+        "greenlets": greenlets,
+        "threads": threads,
+        "watchdog": watchdog.snapshot(),
+    })
+
+
+@debug_bp.post("/_debug/greenlets/watchdog")
+def debug_greenlets_watchdog():
+    """Enable/disable the hub stall watchdog.
+
+    Body: {"enabled": true, "threshold_ms": 200}  |  {"enabled": false}  |  {"clear": true}
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        if data.get("clear"):
+            watchdog.clear()
+        if "enabled" in data:
+            if data.get("enabled"):
+                watchdog.start(int(data.get("threshold_ms") or 200))
+            else:
+                watchdog.stop()
+    except Exception as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    snap = watchdog.snapshot()
+    snap.pop("stalls", None)
+    return jsonify({"ok": True, "watchdog": snap})
+
+
+@debug_bp.get("/_debug/perf")
+def debug_perf():
+    """Per-endpoint latency percentiles and SSH round trips/bytes/time."""
+    return jsonify(perf.snapshot())
+
+
+@debug_bp.post("/_debug/perf/reset")
+def debug_perf_reset():
+    perf.reset()
+    return jsonify({"ok": True})
+
+
+@debug_bp.get("/_debug/profile")
+def debug_profile():
+    """Sample stacks for a while without restarting under cProfile.
+
+    Query: seconds (default 5, max 60), hz (default 100, max 1000),
+    format=json|collapsed, top=N, greenlets=0 to skip suspended greenlets,
+    idle=1 to keep samples where the hub just waits for I/O.
+    """
+    seconds = request.args.get("seconds", default=5.0, type=float)
+    hz = request.args.get("hz", default=100, type=int)
+    top_n = max(1, min(request.args.get("top", default=25, type=int), 200))
+    me = id(_greenlet.getcurrent()) if _greenlet is not None else None
+    try:
+        prof = profile(seconds, hz, greenlets=_flag("greenlets"), idle=_flag("idle", False), exclude_greenlet=me)
+    except RuntimeError as e:
+        return jsonify({"ok": False, "error": str(e)}), 409
+    if (request.args.get("format") or "").lower() == "collapsed":
+        return Response(prof.collapsed(), mimetype="text/plain; charset=utf-8")
+    return jsonify({"ok": True, **prof.summary(top_n)})
+
+
+@debug_bp.get("/_debug/memory")
+def debug_memory():
+    """tracemalloc status, stored snapshot ids and registry sizes."""
+    return jsonify(memory.status())
+
+
+@debug_bp.post("/_debug/memory/<op>")
+def debug_memory_op(op: str):
+    """Operations: start (nframes), stop, snapshot (top, group), diff (a, b, top, group).
+
+    group is lineno (default), filename or traceback. diff without b compares
+    against a fresh snapshot; without a it uses the oldest stored one.
+    """
+    data = request.get_json(silent=True) or {}
+    args = {**request.args.to_dict(), **data}
+    group = str(args.get("group") or "lineno")
+    try:
+        top = max(1, min(int(args.get("top") or 25), 500))
+        if op == "start":
+            memory.start(int(args.get("nframes") or 1))
+            return jsonify({"ok": True, **memory.status()})
+        if op == "stop":
+            memory.stop()
+            return jsonify({"ok": True, **memory.status()})
+        if op == "snapshot":
+            return jsonify({"ok": True, **memory.take_snapshot(top=top, group=group)})
+        if op == "diff":
+            a = int(args["a"]) if args.get("a") not in (None, "") else None
+            b = int(args["b"]) if args.get("b") not in (None, "", "current") else None
+            return jsonify({"ok": True, **memory.diff(a, b, top=top, group=group)})
+    except (RuntimeError, LookupError, ValueError) as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    return jsonify({"ok": False, "error": f"unknown op: {op}"}), 404
+
+
+# Opt-in via environment at startup
+start_from_env()
@@ -1,7 +1,7 @@
 # routes/drivers/os_base.py
 from __future__ import annotations
 import paramiko
-from typing import Generator, Tuple, Dict, Any
+from typing import Generator, Tuple, Dict, Any, Optional
 
 from routes.settings import _get_active_ssh_settings, _is_configured
 from routes.common.ssh_utils import ssh_connect, ssh_exec
@@ -10,9 +10,13 @@ from routes.common.ssh_utils import ssh_connect, ssh_exec
 class BaseDriver:
     """Abstract base for OS-specific update drivers."""
 
+    def __init__(self, settings: Optional[dict] = None):
+        # Explicit SSH settings (e.g. one profile of a fleet scan); default: the active profile
+        self._settings = settings
+
     # -------- Shared helpers --------
     def _active_settings(self) -> dict:
-        s = _get_active_ssh_settings()
+        s = self._settings if self._settings is not None else _get_active_ssh_settings()
         if not _is_configured(s):
             raise RuntimeError("SSH not configured")
         return s
@@ -69,10 +73,10 @@ class BaseDriver:
         return rc, out, err
 
     # -------- Abstract API --------
-    def stream_scan(self) -> Generator[Tuple[str, Dict[str, Any]], None, None]:
+    def stream_scan(self, refresh: Optional[bool] = None) -> Generator[Tuple[str, Dict[str, Any]], None, None]:
         raise NotImplementedError
 
-    def pkg_detail(self, name: str) -> Dict[str, Any]:
+    def pkg_detail(self, name: str, policy: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         raise NotImplementedError
 
     def run_action(self, action: str) -> Tuple[int, str, str]:
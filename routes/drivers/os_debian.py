@@ -1,12 +1,94 @@
 # routes/drivers/os_debian.py
 from __future__ import annotations
+import gzip
+import os
+import posixpath
 import re
-from typing import Dict, Any
+import shlex
+from typing import Dict, Any, Iterable, Optional
 
+from routes.common import cve_index, pkg_inventory
+from routes.common.disk_cache import DiskLRU
+from routes.common.singleflight import SingleFlight
+from routes.common.ssh_utils import iter_ssh_stream, ssh_exec, ssh_stream
 from .os_base import BaseDriver
 
 ANSI_RE = re.compile(r"\x1B\[[0-9;]*[A-Za-z]")
 
+# Package lists younger than this are trusted; older ones get `apt-get update` first
+ENV_LISTS_MAX_AGE = "RPI_MONITOR_APT_LISTS_MAX_AGE"
+DEFAULT_LISTS_MAX_AGE = 3600
+
+# Touched by the monitor after each successful `apt-get update` (relative to the login's home).
+# apt itself leaves no such mark: lists/*Release keep the mirror's Last-Modified time on a "Hit"
+# and update-success-stamp only exists with the APT::Periodic hook
+LISTS_STAMP = ".cache/rpi-monitor/lists-stamp"
+_MARK_FRESH = f'mkdir -p "$HOME/{posixpath.dirname(LISTS_STAMP)}" && touch "$HOME/{LISTS_STAMP}"'
+
+# Remote clock, last successful refresh, newest sources mtime (one line each; empty if none).
+# The Release files are only a fallback for hosts this monitor never refreshed
+_LISTS_PROBE = (
+    "date +%s; "
+    f's=$(stat -c %Y "$HOME/{LISTS_STAMP}" /var/lib/apt/periodic/update-success-stamp 2>/dev/null | sort -n | tail -1); '
+    '[ -n "$s" ] || s=$(stat -c %Y /var/lib/apt/lists/*Release 2>/dev/null | sort -n | tail -1); echo "$s"; '
+    "stat -c %Y /etc/apt/sources.list /etc/apt/sources.list.d/* 2>/dev/null | sort -n | tail -1"
+)
+
+# One `apt-get update` per host at a time; concurrent scans wait for it
+_REFRESH = SingleFlight()
+
+# Changelogs by package + candidate version, shared by all hosts
+ENV_CHANGELOG_CACHE_MB = "RPI_MONITOR_CHANGELOG_CACHE_MB"
+CHANGELOG_MAX_BYTES = 512 * 1024   # per changelog; the newest entries are at the top
+
+
+def _changelog_cache_bytes() -> int:
+    try:
+        return max(1, int(os.environ.get(ENV_CHANGELOG_CACHE_MB) or 32)) * 1024 * 1024
+    except ValueError:
+        return 32 * 1024 * 1024
+
+
+_CHANGELOGS = DiskLRU("changelogs", _changelog_cache_bytes())
+_CHANGELOG_FETCH = SingleFlight()
+
+_RX_POLICY_HEAD = re.compile(r"^(\S+):\s*$")
+
+# (user, host) -> release codename; looked up once per process for CVE matching
+_RELEASES: Dict[Any, str] = {}
+
+
+def parse_policy(pol: str) -> Dict[str, Any]:
+    """Installed/candidate/suite from one package's `apt-cache policy` block."""
+    current = ""
+    candidate = ""
+    suite = ""
+    m = re.search(r"Installed:\s*([^\s]+)", pol)
+    if m: current = m.group(1).strip()
+    m = re.search(r"Candidate:\s*([^\s]+)", pol)
+    if m: candidate = m.group(1).strip()
+    m = re.search(r"\s[a-z0-9-]+://[^\s]+\s+([a-z0-9-]+)\s", pol, re.I)
+    if m: suite = m.group(1).strip()
+    return {"current": current, "candidate": candidate, "suite": suite, "repo": suite}
+
+
+def split_policy(text: str) -> Dict[str, Dict[str, Any]]:
+    """`apt-cache policy a b c` output -> {name: parse_policy(block)}."""
+    out: Dict[str, Dict[str, Any]] = {}
+    name = None
+    block: list = []
+    for line in (text or "").splitlines():
+        m = _RX_POLICY_HEAD.match(line)
+        if m:
+            if name:
+                out[name] = parse_policy("\n".join(block))
+            name, block = m.group(1), []
+        elif name:
+            block.append(line)
+    if name:
+        out[name] = parse_policy("\n".join(block))
+    return out
+
 
 def strip_ansi(s: str) -> str:
     return ANSI_RE.sub("", s or "")
@@ -19,20 +101,97 @@ class DebianDriver(BaseDriver):
     in a stable, locale-independent way (using LC_ALL=C).
     """
 
-    def stream_scan(self):
+    @staticmethod
+    def lists_max_age() -> int:
+        raw = (os.environ.get(ENV_LISTS_MAX_AGE) or "").strip()
+        try:
+            return max(0, int(raw)) if raw else DEFAULT_LISTS_MAX_AGE
+        except ValueError:
+            return DEFAULT_LISTS_MAX_AGE
+
+    def lists_age(self, client) -> Dict[str, Any]:
+        """Age of the package lists (remote clock) and whether sources changed since."""
+        rc, out, _ = ssh_exec(client, f"sh -c {shlex.quote(_LISTS_PROBE)}", timeout=30)
+        vals = [l.strip() for l in (out or "").splitlines()] + ["", "", ""]
+        try:
+            now = int(vals[0])
+        except ValueError:
+            return {"age": None, "sources_changed": False}
+        lists = int(vals[1]) if vals[1].isdigit() else None
+        sources = int(vals[2]) if vals[2].isdigit() else None
+        return {
+            "age": max(0, now - lists) if lists is not None else None,
+            "sources_changed": bool(lists is not None and sources is not None and sources > lists),
+        }
+
+    def _refresh_lists(self, client) -> None:
+        # Output is discarded but still drained, so a chatty update can't stall the channel
+        rc = ssh_stream(
+            client,
+            'sh -lc "LC_ALL=C DEBIAN_FRONTEND=noninteractive apt-get update -yq || apt update -yq"',
+            timeout=600,
+        )
+        if rc != 0:
+            raise RuntimeError(f"apt-get update failed (exit {rc})")
+        self.mark_lists_fresh(client)
+
+    @staticmethod
+    def mark_lists_fresh(client) -> None:
+        """Record a successful `apt-get update` for lists_age()."""
+        ssh_exec(client, f"sh -c {shlex.quote(_MARK_FRESH)}", timeout=15)
+
+    def release(self, client, host_key) -> str:
+        """VERSION_CODENAME of the host (e.g. bookworm), the key of the CVE index."""
+        if host_key not in _RELEASES:
+            rc, out, _ = ssh_exec(client, "sh -c '. /etc/os-release 2>/dev/null; echo \"$VERSION_CODENAME\"'", timeout=15)
+            _RELEASES[host_key] = (out or "").strip() if rc == 0 else ""
+        return _RELEASES[host_key]
+
+    def stream_scan(self, refresh: Optional[bool] = None):
+        """
+        refresh=None refreshes the indexes only when they are older than
+        lists_max_age() (or sources changed since); True/False force it on/off.
+        """
+        client = None
         try:
             client = self._ssh_connect_paramiko()
+            s = self._active_settings()
+            host_key = (s.get("pi_user"), s.get("pi_host"))
+            max_age = self.lists_max_age()
 
-            # Stage 1: refresh indexes (quiet)
-            yield ("status", {"stage": "apt_update"})
-            _stdin, stdout, _stderr = client.exec_command(
-                'sh -lc "LC_ALL=C DEBIAN_FRONTEND=noninteractive apt-get update -yq || apt update -yq"',
-                get_pty=False, timeout=600
-            )
+            # Stage 1: refresh indexes (quiet) unless they are fresh enough
+            yield ("status", {"stage": "check_lists"})
             try:
-                stdout.channel.recv_exit_status()
+                info = self.lists_age(client)
             except Exception:
-                pass
+                info = {"age": None, "sources_changed": False}
+            age = info["age"]
+            if refresh is None:
+                stale = age is None or age > max_age or info["sources_changed"]
+            else:
+                stale = bool(refresh)
+            lists = {**info, "max_age": max_age, "refreshed": False, "shared": False}
+            if stale:
+                shared = _REFRESH.in_flight(host_key)
+                yield ("status", {"stage": "apt_update", "shared": shared})
+                try:
+                    _, shared = _REFRESH.do(host_key, lambda: self._refresh_lists(client))
+                    lists.update({"age": 0, "sources_changed": False, "refreshed": True, "shared": shared})
+                except Exception:
+                    pass
+
+            # CVE matching needs the release and the source package of each binary;
+            # the inventory (cached per host) costs at most one exec
+            release, inv = "", None
+            if cve_index.meta():
+                try:
+                    release = self.release(client, host_key)
+                    inv = pkg_inventory.get(s.get("pi_host", ""),
+                                            lambda cmd: ssh_exec(client, cmd, timeout=60)[1])
+                except Exception:
+                    pass
+            lists["release"] = release
+            yield ("lists", lists)
 
             # Stage 2: streaming scan using dry-run dist-upgrade
             yield ("status", {"stage": "list_upgradable"})
@@ -40,16 +199,19 @@ class DebianDriver(BaseDriver):
                 'sh -lc "LC_ALL=C DEBIAN_FRONTEND=noninteractive '
                 'apt-get -s -o Debug::NoLocking=1 dist-upgrade"'
             )
-            _stdin2, stdout2, _stderr2 = client.exec_command(cmd, get_pty=False, timeout=900)
 
+            # Inst <name>[:arch] [<current>] (<candidate> <origin, ...> [<arch>])
             pat = re.compile(
-                r"^Inst\s+([^\s:]+)(?::([^\s]+))?(?:\s+\[[^\]]+\])?\s+\(([^)\s]+).*?(?:\[(.*?)\])?",
+                r"^Inst\s+([^\s:]+)(?::(\S+))?\s+(?:\[([^\]]*)\]\s+)?\((\S+)\s*(.*?)\s*(?:\[([^\]]*)\])?\)",
                 re.IGNORECASE
             )
 
             count = 0
-            for raw in iter(stdout2.readline, ""):
-                line = strip_ansi(raw.strip())
+            names = []
+            for kind, raw in iter_ssh_stream(client, cmd, timeout=900):
+                if kind != "stdout":
+                    continue
+                line = strip_ansi(str(raw).strip())
                 if not line or not line.startswith("Inst "):
                     continue
                 m = pat.match(line)
@@ -57,51 +219,90 @@ class DebianDriver(BaseDriver):
                     continue
                 name = m.group(1)
                 arch_a = m.group(2) or ""
-                candidate = m.group(3) or ""
-                arch_b = (m.group(4) or "").strip()
+                current = m.group(3) or ""
+                candidate = m.group(4) or ""
+                origin = (m.group(5) or "").strip()
+                arch_b = (m.group(6) or "").strip()
                 arch = arch_b or arch_a or ""
                 count += 1
-                yield ("pkg", {"name": name, "candidate": candidate, "arch": arch})
+                names.append(name)
+                source = inv.source_of(name) if inv is not None else name
+                yield ("pkg", {"name": name, "current": current, "candidate": candidate,
+                               "arch": arch, "origin": origin, "source": source,
+                               "cves": cve_index.fixed_by(release, source, current, candidate)})
 
-            yield ("done", {"count": count})
+            # Stage 3: policy of every candidate in one call, so details need no round trip
+            if names:
+                yield ("status", {"stage": "policy"})
+                try:
+                    yield ("policy", {"packages": self.policy_batch(client, names)})
+                except Exception:
+                    pass
 
-            try:
-                client.close()
-            except Exception:
-                pass
+            yield ("done", {"count": count})
 
         except Exception as e:
             yield ("error", {"message": str(e)})
+        finally:
+            # Also when the consumer stops early (client gone, fleet deadline)
+            if client is not None:
+                try:
+                    client.close()
+                except Exception:
+                    pass
+
+    def policy_batch(self, client, names: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        args = " ".join(shlex.quote(n) for n in names)
+        rc, out, _ = ssh_exec(client, f'sh -lc "LC_ALL=C apt-cache policy {args}"', timeout=120)
+        return split_policy(out) if out else {}
 
-    def pkg_detail(self, name: str) -> Dict[str, Any]:
+    def changelog(self, name: str, version: str) -> str:
+        """`apt-get changelog` of one version, from the disk cache when possible."""
+        if version == "(none)":
+            version = ""
+        key = f"{name}_{version}"
+        blob = _CHANGELOGS.get(key) if version else None
+        if blob is not None:
+            return gzip.decompress(blob).decode("utf-8", errors="replace")
+
+        def _fetch() -> str:
+            target = f"{name}={version}" if version else name
+            rc, chlog, _ = self._ssh_exec_simple(
+                f'sh -lc "LC_ALL=C apt-get changelog -qq {shlex.quote(target)}"', timeout=120)
+            if rc != 0 or not chlog:
+                return ""
+            chlog = chlog[:CHANGELOG_MAX_BYTES]
+            if version:
+                _CHANGELOGS.put(key, gzip.compress(chlog.encode("utf-8"), 6))
+            return chlog
+
+        # Two hosts/tabs asking for the same version share one download
+        text, _ = _CHANGELOG_FETCH.do(key, _fetch)
+        return text
+
+    def pkg_detail(self, name: str, policy: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Details for one package; `policy` (from the scan's batch prefetch) skips apt-cache."""
         name = (name or "").strip()
         if not name:
             return {"ok": False, "error": "missing name"}
 
-        rc2, pol, _ = self._ssh_exec_simple(f'SH -lc "LC_ALL=C apt-cache policy {name}"', timeout=60)
-        if rc2 != 0 or not pol:
-            rc2, pol, _ = self._ssh_exec_simple(f'sh -lc "LC_ALL=C apt-cache policy {name}"', timeout=60)
-
-        current = ""
-        candidate = ""
-        suite = ""
-        repo = ""
+        if policy is None:
+            rc2, pol, _ = self._ssh_exec_simple(f'SH -lc "LC_ALL=C apt-cache policy {name}"', timeout=60)
+            if rc2 != 0 or not pol:
+                rc2, pol, _ = self._ssh_exec_simple(f'sh -lc "LC_ALL=C apt-cache policy {name}"', timeout=60)
+            policy = parse_policy(pol) if rc2 == 0 and pol else {}
 
-        if rc2 == 0 and pol:
-            m = re.search(r"Installed:\s*([^\s]+)", pol)
-            if m: current = m.group(1).strip()
-            m = re.search(r"Candidate:\s*([^\s]+)", pol)
-            if m: candidate = m.group(1).strip()
-            m = re.search(r"\s[a-z0-9-]+://[^\s]+\s+([a-z0-9-]+)\s", pol, re.I)
-            if m: suite = m.group(1).strip()
-            repo = suite
+        current = policy.get("current", "")
+        candidate = policy.get("candidate", "")
+        suite = policy.get("suite", "")
+        repo = policy.get("repo", "")
 
         summary = ""
         cl_link = ""
         cves = []
         urgency = ""
-        rc3, chlog, _ = self._ssh_exec_simple(f'sh -lc "LC_ALL=C apt-get changelog -qq {name}"', timeout=120)
-        if rc3 == 0 and chlog:
+        chlog = self.changelog(name, candidate)
+        if chlog:
             for l in chlog.splitlines():
                 t = l.strip()
                 if t and not t.startswith("---"):
@@ -1,10 +1,17 @@
 # === routes/drivers.py ===
 # Drivers & Firmware (SSH to active device). UI strings kept in English.
 
-from flask import render_template, jsonify, request
+import threading
+import time
+from datetime import datetime, timezone
+
+from flask import render_template, jsonify, request, Response, stream_with_context
 from shlex import quote
 
-from routes.common.ssh_utils import ssh_connect, ssh_exec
+from routes.common.ssh_utils import ssh_connect, ssh_exec, ssh_stream
+from routes.common.bounded import BoundedMap
+from routes.common.fs import append_log, finalize_log, index_get, index_update, log_exists, tail_lines
+from routes.updates import run_events
 from routes.settings import _get_active_ssh_settings, _is_configured
 from . import drivers_bp
 
@@ -175,61 +182,201 @@ def status():
     except Exception as e:
         return jsonify({"error": str(e)}), 200
 
-@drivers_bp.route("/run_fix/<target>", methods=["POST"])
-def run_fix(target):
-    logs = []
-    def log(msg): logs.append(msg)
+# ---------- fix runs (background jobs) ----------------------------------------
+
+# Finished runs can be dropped: progress falls back to the run-log archive
+_RUNS: BoundedMap = BoundedMap(
+    "drivers._RUNS", maxsize=20, ttl=6 * 3600,
+    can_evict=lambda _rid, st: bool(st.get("done")),
+)
+
+# target -> (per-step timeout in seconds, steps builder)
+def _steps_wifi(ssh) -> list:
+    iface = _iface_detect(ssh)
+    nmcli = _which_bin(ssh, ["nmcli", "/usr/bin/nmcli", "/bin/nmcli"]) or "nmcli"
+    return [
+        "modprobe brcmfmac || true",      # harmless if non-Broadcom/ built-in
+        "rfkill unblock all || true",
+        f"ip link set {quote(iface)} up || true",
+        "if systemctl list-unit-files | grep -q '^wpa_supplicant@wlan0'; then "
+        "  systemctl enable --now wpa_supplicant@wlan0; "
+        "else "
+        "  systemctl enable --now wpa_supplicant; "
+        "fi",
+        "if systemctl list-unit-files | grep -q '^dhcpcd.service'; then "
+        "  systemctl enable --now dhcpcd && systemctl restart dhcpcd; "
+        "else "
+        "  dhclient -v wlan0 || true; "
+        "fi",
+        f"command -v {nmcli} >/dev/null 2>&1 && {nmcli} radio wifi on || true",
+    ]
+
+def _steps_reinstall(_ssh) -> list:
+    return [
+        "apt update",
+        "apt install -y --reinstall raspberrypi-kernel raspberrypi-bootloader firmware-brcm80211 || true",
+        "depmod -a $(uname -r) || true",
+    ]
+
+def _steps_recovery(_ssh) -> list:
+    return ["/usr/local/sbin/wifi-recover-pi3.sh"]
+
+FIX_TARGETS = {
+    "wifi": (30, _steps_wifi),
+    "reinstall_all": (1200, _steps_reinstall),
+    "wifi_script": (600, _steps_recovery),
+}
+
+
+def _new_fix_run(target: str, host: str) -> str:
+    ts = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H-%M-%SZ')
+    run_id = f"{ts}_drv{hex(int(time.time() * 1000))[-6:]}"
+    started = time.time()
+    _RUNS[run_id] = {
+        "target": target,
+        "host": host,
+        "started_ts": started,
+        "ended_ts": None,
+        "step": 0,
+        "steps": 0,
+        "current": "",
+        "percent": 0,
+        "done": False,
+        "exit_code": None,
+        "error": None,
+        "wifi": None,
+    }
+    run_events.open_journal(run_id)
+    index_update(run_id, action=f"driver_fix:{target}", host=host, start=started)
+    append_log(run_id, f"=== Driver fix {target} ({run_id}) started {datetime.now(timezone.utc).isoformat()} ===\n")
+    return run_id
+
+
+def _fix_progress(run_id: str, st: dict) -> dict:
+    rc = st.get("exit_code")
+    return {
+        "ok": True,
+        "run_id": run_id,
+        "target": st.get("target"),
+        "status": "done" if st.get("done") else "running",
+        "done": bool(st.get("done")),
+        "step": st.get("step", 0),
+        "steps": st.get("steps", 0),
+        "current": st.get("current", ""),
+        "percent": int(st.get("percent", 0)),
+        "phase": st.get("current") or ("Done" if st.get("done") else "Starting"),
+        "rc": rc,
+        "error": st.get("error"),
+        "wifi": st.get("wifi"),
+        "started_at": st.get("started_ts"),
+        "ended_at": st.get("ended_ts"),
+        "last_lines": tail_lines(run_id, 50),
+    }
+
+
+def _run_fix_bg(run_id: str, target: str, settings: dict, sudo_pw: str | None) -> None:
+    st = _RUNS.get(run_id) or {}
+    timeout, build = FIX_TARGETS[target]
+
+    def _out(text: str) -> None:
+        append_log(run_id, text.replace(sudo_pw, "******") if sudo_pw else text)
+
+    rc = 0
+    ssh = None
     try:
-        ssh = _ssh()
-        s = _active()
-        data = request.get_json(silent=True) or {}
-        sudo_pw = data.get("sudo_pw") or s.get("password") or None
-
-        if target == "wifi":
-            iface = _iface_detect(ssh)
-            nmcli = _which_bin(ssh, ["nmcli", "/usr/bin/nmcli", "/bin/nmcli"]) or "nmcli"
-            cmds = [
-                "modprobe brcmfmac || true",      # harmless if non-Broadcom/ built-in
-                "rfkill unblock all || true",
-                f"ip link set {quote(iface)} up || true",
-                "if systemctl list-unit-files | grep -q '^wpa_supplicant@wlan0'; then "
-                "  systemctl enable --now wpa_supplicant@wlan0; "
-                "else "
-                "  systemctl enable --now wpa_supplicant; "
-                "fi",
-                "if systemctl list-unit-files | grep -q '^dhcpcd.service'; then "
-                "  systemctl enable --now dhcpcd && systemctl restart dhcpcd; "
-                "else "
-                "  dhclient -v wlan0 || true; "
-                "fi",
-                f"command -v {nmcli} >/dev/null 2>&1 && {nmcli} radio wifi on || true",
-            ]
-            for c in cmds:
-                rc, out, err = ssh_exec(ssh, _sudo_cmd(sudo_pw, c), timeout=30)
-                log(f"$ {c}\n{(out or '')+(err or '')}\n(rc={rc})\n")
-            wifi = _wifi_status(ssh)
-            try: ssh.close()
-            except Exception: pass
-            return jsonify({"ok": True, "log": "\n".join(logs), "wifi": wifi})
-
-        elif target == "reinstall_all":
-            for c in [
-                "apt update",
-                "apt install -y --reinstall raspberrypi-kernel raspberrypi-bootloader firmware-brcm80211 || true",
-                "depmod -a $(uname -r) || true",
-            ]:
-                rc, out, err = ssh_exec(ssh, _sudo_cmd(sudo_pw, c), timeout=1200)
-                log(f"$ {c}\n{(out or '')+(err or '')}\n(rc={rc})\n")
-            wifi = _wifi_status(ssh)
+        ssh = ssh_connect(
+            host=settings["pi_host"], user=settings["pi_user"],
+            auth=settings.get("auth_method", "key"),
+            key_path=settings.get("ssh_key_path", ""),
+            password=settings.get("password", ""), timeout=20,
+        )
+        steps = build(ssh)
+        st["steps"] = len(steps)
+        for i, cmd in enumerate(steps):
+            st["step"], st["current"] = i + 1, cmd
+            run_events.emit(run_id, "overall", {"percent": st["percent"], "phase": cmd})
+            _out(f"$ {cmd}\n")
+            try:
+                rc = ssh_stream(ssh, _sudo_cmd(sudo_pw, cmd), on_stdout=_out, on_stderr=_out, timeout=timeout)
+            except Exception as e:
+                _out(f"[error] {e}\n")
+                rc = 255
+            _out(f"(rc={rc})\n")
+            st["percent"] = int(100 * (i + 1) / max(1, len(steps)))
+        _out("\n--- new Wi-Fi status ---\n")
+        st["wifi"] = _wifi_status(ssh)
+    except Exception as e:
+        st["error"] = str(e)
+        _out(f"[error] {e}\n")
+        rc = 255
+    finally:
+        if ssh is not None:
             try: ssh.close()
             except Exception: pass
-            return jsonify({"ok": True, "log": "\n".join(logs), "wifi": wifi})
+        st["exit_code"] = rc
+        st["ended_ts"] = time.time()
+        st["percent"] = 100
+        st["current"] = ""
+        st["done"] = True
+        _out(f"\n=== Driver fix {target} completed (rc={rc}) ===\n")
+        finalize_log(
+            run_id, action=f"driver_fix:{target}", host=st.get("host"), rc=rc,
+            start=st.get("started_ts"), end=st["ended_ts"],
+        )
+        final = _fix_progress(run_id, st)
+        final.pop("last_lines", None)
+        run_events.emit(run_id, "done", final)
 
-        else:
-            try: ssh.close()
-            except Exception: pass
-            return jsonify({"ok": False, "log": f"Unknown target: {target}"}), 400
 
+@drivers_bp.route("/run_fix/<target>", methods=["POST"])
+def run_fix(target):
+    """Start a fix as a background run; follow it via /drivers/runs/<run_id>[/stream]."""
+    if target not in FIX_TARGETS:
+        return jsonify({"ok": False, "log": f"Unknown target: {target}"}), 400
+    try:
+        s = _active()
     except Exception as e:
-        logs.append(str(e))
-        return jsonify({"ok": False, "log": "\n".join(logs)}), 200
+        return jsonify({"ok": False, "log": str(e)}), 200
+    data = request.get_json(silent=True) or {}
+    sudo_pw = data.get("sudo_pw") or s.get("password") or None
+    run_id = _new_fix_run(target, s.get("pi_host", ""))
+    threading.Thread(target=_run_fix_bg, args=(run_id, target, s, sudo_pw),
+                     name=f"drv-{run_id}", daemon=True).start()
+    return jsonify({"ok": True, "run_id": run_id, "target": target})
+
+
+@drivers_bp.get("/runs/<run_id>")
+def run_fix_progress(run_id):
+    st = _RUNS.get(run_id)
+    if st is not None:
+        return jsonify(_fix_progress(run_id, st))
+    entry = index_get(run_id)
+    if not entry or not log_exists(run_id):
+        return jsonify({"ok": False, "error": "unknown run_id"}), 404
+    return jsonify({
+        "ok": True, "run_id": run_id, "status": "done", "done": True,
+        "target": (entry.get("action") or "").split(":", 1)[-1],
+        "percent": 100, "phase": "Done", "rc": entry.get("rc"),
+        "started_at": entry.get("start"), "ended_at": entry.get("end"),
+        "last_lines": tail_lines(run_id, 50),
+    })
+
+
+@drivers_bp.get("/runs/<run_id>/stream")
+def run_fix_stream(run_id):
+    """SSE: snapshot, overall (step changes), log lines and done; resume with ?since=N / Last-Event-ID."""
+    since = request.args.get("since", type=int)
+    if since is None:
+        since = request.headers.get("Last-Event-ID", type=int)
+    journal = run_events.get_journal(run_id)
+    st = _RUNS.peek(run_id)
+    if journal is None or st is None:
+        return Response(status=204)  # unknown or long finished; use /drivers/runs/<run_id>
+    if journal.closed and since is not None and since >= journal.seq:
+        return Response(status=204)
+    body = run_events.stream(journal, lambda: _fix_progress(run_id, st), since)
+    return Response(stream_with_context(body), headers={
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
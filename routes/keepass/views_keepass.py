@@ -1,4 +1,5 @@
 from __future__ import annotations
+import json
 import os
 import threading
 import time
@@ -10,12 +11,17 @@ from flask import request, jsonify, render_template
 
 from . import keepass_bp
 from routes.settings import _get_active_ssh_settings, _is_configured
-from routes.common.ssh_utils import ssh_connect
+from routes.common.ssh_utils import ssh_connect, ssh_stream
+from routes.common.bounded import BoundedMap
 from paramiko.ssh_exception import AuthenticationException
 
 
 # --- Simple runs state for KeePass setup ---
-_RUNS: Dict[str, Dict[str, Any]] = {}
+# Finished runs can be dropped: progress falls back to the log and state files on disk.
+_RUNS: BoundedMap = BoundedMap(
+    "keepass._RUNS", maxsize=20, ttl=6 * 3600,
+    can_evict=lambda _rid, st: bool(st.get('finished')),
+)
 
 
 def _logs_dir() -> str:
@@ -36,6 +42,27 @@ def _append_log(run_id: str, text: str) -> None:
         f.write(text)
 
 
+def _state_path(run_id: str) -> str:
+    return _log_path(run_id)[:-len('.log')] + '.json'
+
+
+def _save_state(run_id: str, state: Dict[str, Any]) -> None:
+    """Keep the outcome with the log so it survives eviction and restarts."""
+    try:
+        with open(_state_path(run_id), 'w', encoding='utf-8') as f:
+            json.dump({k: state.get(k) for k in ('phase', 'finished', 'exit_code', 'error')}, f)
+    except Exception:
+        pass
+
+
+def _load_state(run_id: str) -> Dict[str, Any] | None:
+    try:
+        with open(_state_path(run_id), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+
 def _read_log(run_id: str) -> str:
     with open(_log_path(run_id), 'r', encoding='utf-8', errors='replace') as f:
         return f.read()
@@ -95,6 +122,13 @@ def _upload_scripts(ssh) -> str:
 
 def _run_phase_bg(run_id: str, env: Dict[str, str] | None, settings: Dict[str, Any]):
     state = _RUNS.get(run_id) or {}
+    try:
+        _run_phase(run_id, state, env, settings)
+    finally:
+        _save_state(run_id, state)
+
+
+def _run_phase(run_id: str, state: Dict[str, Any], env: Dict[str, str] | None, settings: Dict[str, Any]):
     s = (settings or {}).copy()
     if not _is_configured(s):
         state['finished'] = True
@@ -210,54 +244,15 @@ def _run_phase_bg(run_id: str, env: Dict[str, str] | None, settings: Dict[str, A
         _append_log(run_id, _mask(f"[dbg] shell=bash\n"))
         _append_log(run_id, _mask(f"[dbg] cmd={cmd}\n"))
 
-        stdin, stdout, stderr = ssh.exec_command(cmd, timeout=3600, get_pty=True)
-
-        ch_out = stdout.channel
-        ch_err = stderr.channel
-        exit_code = None
-        last_activity = time.time()
-        last_heartbeat = time.time()
-        while True:
-            did = False
-            if ch_out.recv_ready():
-                try:
-                    chunk = ch_out.recv(4096).decode(errors='replace')
-                    if chunk:
-                        _append_log(run_id, _mask(chunk))
-                        did = True
-                except Exception:
-                    pass
-            if ch_err.recv_ready():
-                try:
-                    chunk = ch_err.recv(4096).decode(errors='replace')
-                    if chunk:
-                        _append_log(run_id, _mask(chunk))
-                        did = True
-                except Exception:
-                    pass
-
-            now = time.time()
-            if not did and (now - last_heartbeat) >= 5:
-                _append_log(run_id, "[dbg] still running...\n")
-                last_heartbeat = now
-
-            if ch_out.exit_status_ready():
-                exit_code = ch_out.recv_exit_status()
-                # Drain remaining
-                try:
-                    while ch_out.recv_ready():
-                        _append_log(run_id, _mask(ch_out.recv(4096).decode(errors='replace')))
-                except Exception:
-                    pass
-                try:
-                    while ch_err.recv_ready():
-                        _append_log(run_id, _mask(ch_err.recv(4096).decode(errors='replace')))
-                except Exception:
-                    pass
-                break
-
-            if not did:
-                time.sleep(0.1)
+        def _out(text: str) -> None:
+            _append_log(run_id, _mask(text))
+
+        # Line mode keeps secrets from being split across chunks before masking
+        exit_code = ssh_stream(
+            ssh, cmd, on_stdout=_out, on_stderr=_out,
+            on_idle=lambda _s: _append_log(run_id, "[dbg] still running...\n"),
+            timeout=3600, get_pty=True, idle_interval=5,
+        )
         state['exit_code'] = int(exit_code or 0)
         state['finished'] = True
         _append_log(run_id, f"\n=== KeePass setup {phase} completed (rc={state['exit_code']}) ===\n")
@@ -337,12 +332,16 @@ def kp_rollback():
 def kp_progress(run_id: str):
     st = _RUNS.get(run_id)
     if not st:
-        # If log exists, return as finished
+        # Evicted: the log and the saved outcome are on disk
         try:
             txt = _read_log(run_id)
-            return jsonify({'log': txt, 'finished': True, 'exit_code': 0, 'error': None})
         except Exception:
             return jsonify({'error': 'unknown run_id'}), 404
+        saved = _load_state(run_id) or {}
+        if saved.get('finished'):
+            return jsonify({'log': txt, 'finished': True, 'exit_code': saved.get('exit_code'), 'error': saved.get('error')})
+        # No outcome recorded (e.g. the process stopped mid-run): do not claim success
+        return jsonify({'log': txt, 'finished': True, 'exit_code': None, 'error': 'outcome unknown'})
     txt = ''
     try:
         txt = _read_log(run_id)
@@ -1,42 +1,174 @@
-from flask import Blueprint, jsonify
+import re
+from datetime import datetime, timedelta, timezone
+
+from flask import Blueprint, jsonify, request
 from utils import ssh_run  # Henter SSH-fjernkommando funktionen
+from routes.common import pkg_inventory, pkg_snapshots
 
 # === SOFTWARE BLUEPRINT ===
 software_bp = Blueprint("software", __name__)
 
+# === INSTALL QUEUE ===
+# The buttons go through the updates install queue: clicks within a few seconds
+# become one apt transaction (one index refresh, no dpkg lock contention).
+def _queued(op: str, name: str):
+    # Lazy import: routes.updates imports routes.settings itself
+    from routes.updates import install_queue
+    from routes.settings import _get_active_ssh_settings, _is_configured
+
+    s = _get_active_ssh_settings()
+    if not _is_configured(s):
+        return jsonify({"success": False, "output": "SSH not configured"}), 400
+    data = request.get_json(silent=True) or {}
+    batch = install_queue.submit(s, op, [name], data.get("sudo_password") or "")
+    batch.done.wait(timeout=1800)
+    result = batch.results.get(name) or {"op": op, "ok": False, "error": "timed out"}
+    return jsonify({
+        "success": bool(result.get("ok")),
+        "output": batch.output,
+        "result": result,
+        "run_id": batch.run_id,
+    })
+
 # === INSTALLATION: NEOFETCH ===
 @software_bp.route("/install-neofetch", methods=["POST"])
 def install_neofetch():
-    output = ssh_run("sudo apt-get update && sudo apt-get install -y neofetch")
-    return jsonify({"success": True, "output": output})
+    return _queued("install", "neofetch")
 
 # === AFINSTALLATION: NEOFETCH ===
 @software_bp.route("/uninstall-neofetch", methods=["POST"])
 def uninstall_neofetch():
-    output = ssh_run("sudo apt-get remove -y neofetch")
-    return jsonify({"success": True, "output": output})
+    return _queued("remove", "neofetch")
 
 # === INSTALLATION: CMATRIX ===
 @software_bp.route("/install-cmatrix", methods=["POST"])
 def install_cmatrix():
-    output = ssh_run("sudo apt-get update && sudo apt-get install -y cmatrix")
-    return jsonify({"success": True, "output": output})
+    return _queued("install", "cmatrix")
 
 # === AFINSTALLATION: CMATRIX ===
 @software_bp.route("/uninstall-cmatrix", methods=["POST"])
 def uninstall_cmatrix():
-    output = ssh_run("sudo apt-get remove -y cmatrix")
-    return jsonify({"success": True, "output": output})
+    return _queued("remove", "cmatrix")
+
+# === PACKAGE STATUS ===
+# Answered from the cached per-host inventory: one exec compares the dpkg
+# status file (and re-dumps only when it changed), none within the TTL.
+_RX_PKG = re.compile(r"^[a-z0-9][a-z0-9+.\-]*(:[a-z0-9-]+)?$")
+MAX_STATUS_PKGS = 500
+
+def _active_host():
+    from routes.settings import _get_active_ssh_settings, _is_configured
+
+    s = _get_active_ssh_settings()
+    if not _is_configured(s):
+        raise RuntimeError("SSH not configured")
+    return s["pi_host"]
+
+def _package_status(names):
+    return pkg_inventory.status(_active_host(), ssh_run, names)
+
+@software_bp.route("/software/status", methods=["GET"])
+def software_status():
+    names = [n.strip() for n in (request.args.get("pkgs") or "").split(",") if n.strip()]
+    if not names:
+        return jsonify({"ok": False, "error": "pkgs is required (comma separated)"}), 400
+    if len(names) > MAX_STATUS_PKGS:
+        return jsonify({"ok": False, "error": f"at most {MAX_STATUS_PKGS} packages per request"}), 400
+    bad = [n for n in names if not _RX_PKG.match(n)]
+    if bad:
+        return jsonify({"ok": False, "error": f"invalid package name: {bad[0]}"}), 400
+    try:
+        packages = _package_status(names)
+    except Exception as e:
+        return jsonify({"ok": False, "error": str(e)}), 503
+    return jsonify({"ok": True, "packages": packages})
+
+# === PACKAGE INVENTORY ===
+# Search runs over an in-memory index of the cached inventory; history comes
+# from the snapshots stored whenever the dpkg status file changed.
+def _snapshot_ref(host, raw, end_of_day):
+    """Snapshot id, ISO date/datetime or 'current' -> snapshot id (None = current inventory)."""
+    raw = (raw or "").strip()
+    if not raw or raw == "current":
+        return None
+    if raw.isdigit():
+        return int(raw)
+    when = datetime.fromisoformat(raw.replace("Z", "+00:00"))
+    if len(raw) == 10 and end_of_day:
+        when += timedelta(days=1, microseconds=-1)   # a plain date includes that whole day
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    snap = pkg_snapshots.at(host, when.timestamp())
+    if snap is None:
+        raise LookupError("no snapshots recorded for this host yet")
+    return snap["id"]
+
+@software_bp.route("/software/inventory", methods=["GET"])
+def software_inventory():
+    mode = request.args.get("mode", "substring")
+    if mode not in ("prefix", "substring"):
+        return jsonify({"ok": False, "error": "mode must be prefix or substring"}), 400
+    try:
+        limit = max(1, min(5000, int(request.args.get("limit", 100))))
+    except ValueError:
+        return jsonify({"ok": False, "error": "limit must be an integer"}), 400
+    try:
+        host = _active_host()
+        result = pkg_inventory.search(host, ssh_run, request.args.get("q", ""), mode, limit)
+    except Exception as e:
+        return jsonify({"ok": False, "error": str(e)}), 503
+    return jsonify({"ok": True, "host": host, **result})
+
+@software_bp.route("/software/inventory/snapshots", methods=["GET"])
+def software_inventory_snapshots():
+    try:
+        host = _active_host()
+        pkg_inventory.get(host, ssh_run)   # records a snapshot if dpkg changed since the last one
+    except Exception as e:
+        return jsonify({"ok": False, "error": str(e)}), 503
+    return jsonify({"ok": True, "host": host, "snapshots": pkg_snapshots.list_snapshots(host)})
+
+@software_bp.route("/software/inventory/diff", methods=["GET"])
+def software_inventory_diff():
+    """?from=<id|date>&to=<id|date|current>: added, removed, upgraded and downgraded packages."""
+    try:
+        host = _active_host()
+    except Exception as e:
+        return jsonify({"ok": False, "error": str(e)}), 503
+    try:
+        ref_from = _snapshot_ref(host, request.args.get("from"), end_of_day=False)
+        ref_to = _snapshot_ref(host, request.args.get("to"), end_of_day=True)
+    except ValueError:
+        return jsonify({"ok": False, "error": "from/to must be a snapshot id, an ISO date or 'current'"}), 400
+    except LookupError as e:
+        return jsonify({"ok": False, "error": str(e)}), 404
+    if ref_from is None:
+        return jsonify({"ok": False, "error": "from is required"}), 400
+    old = pkg_snapshots.load(host, ref_from)
+    if ref_to is None:
+        try:
+            new = pkg_inventory.get(host, ssh_run).installed()
+        except Exception as e:
+            return jsonify({"ok": False, "error": str(e)}), 503
+    else:
+        new = pkg_snapshots.load(host, ref_to)
+    if old is None or new is None:
+        return jsonify({"ok": False, "error": "snapshot not found"}), 404
+    changes = pkg_snapshots.diff(old, new)
+    return jsonify({
+        "ok": True, "host": host, "from": ref_from, "to": ref_to or "current",
+        "summary": {k: len(v) for k, v in changes.items()},
+        **changes,
+    })
 
 # === INSTALLATIONSTJEK: Viser hvilke programmer der er installeret ===
 @software_bp.route("/check-install-status", methods=["GET"])
 def check_install_status():
-    # Brug dpkg-query til at tjekke om pakken er korrekt installeret
-    status_neofetch = "Status: install ok installed" in ssh_run("dpkg-query -s neofetch 2>/dev/null")
-    status_cmatrix = "Status: install ok installed" in ssh_run("dpkg-query -s cmatrix 2>/dev/null")
-
+    try:
+        packages = _package_status(["neofetch", "cmatrix"])
+    except Exception:
+        packages = {}
     return jsonify({
-        "neofetch": status_neofetch,
-        "cmatrix": status_cmatrix
+        "neofetch": bool(packages.get("neofetch", {}).get("installed")),
+        "cmatrix": bool(packages.get("cmatrix", {}).get("installed")),
     })
-
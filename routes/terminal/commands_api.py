@@ -9,12 +9,14 @@ from flask import Response, jsonify, request
 
 from . import terminal_bp
 from . import commands_store
+from routes.common.bounded import BoundedMap
 
 MAX_TITLE = 64
 MAX_COMMAND = 2048
 MAX_DESCRIPTION = 512
 
-_RATE_BUCKETS: Dict[str, list] = {}
+# Keyed by "<action>:<remote addr>"; idle buckets expire well after the longest window
+_RATE_BUCKETS: BoundedMap = BoundedMap("commands_api._RATE_BUCKETS", maxsize=1024, ttl=300)
 
 
 def _rate_limited(action: str, limit: int = 10, window: int = 5):
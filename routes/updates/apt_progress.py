@@ -0,0 +1,170 @@
+# routes/updates/apt_progress.py
+# Incremental progress for apt runs: machine-readable status records + text fallback.
+
+from __future__ import annotations
+import re
+from typing import Any, Dict, Optional, Tuple
+
+# apt writes its status records to this fd. stderr rather than a private fd:
+# sudo closes every descriptor above 2 before exec'ing apt.
+STATUS_FD = 2
+
+_RX_APT = re.compile(r"(?<![\w./-])(apt-get|apt)(?=\s)")
+# pmstatus:<pkg[:arch]>:<percent>:<description>  |  dlstatus:<item>:<percent>:<description>
+_RX_STATUS = re.compile(r"^(pmstatus|dlstatus|pmerror|pmconffile):(.*?):(\d+(?:\.\d+)?):(.*)$")
+
+# Text fallback (no status records, e.g. old apt); cheap prefix test before any regex
+# Get:N <url> <suite> <arch> <pkg> <arch> <version> [<size>]
+_RX_DOWNLOAD = re.compile(r"^Get:\d+\s.*\s([a-z0-9][a-z0-9\-\+\.]*)\s+\S+\s+\S+\s+\[[\d.,]+\s*[kMG]?B\]", re.IGNORECASE)
+_RX_UNPACK = re.compile(r"^Unpacking\s+([a-z0-9\-\+\.]+)(?::\S+)?\s", re.IGNORECASE)
+_RX_SETUP = re.compile(r"^Setting up\s+([a-z0-9\-\+\.]+)(?::\S+)?\s", re.IGNORECASE)
+_RX_TRIGGERS = re.compile(r"^Processing triggers for\s+([a-z0-9\-\+\.]+)(?::\S+)?\s", re.IGNORECASE)
+
+# "Need to get 12.1 MB/45.3 MB of archives." (cached part excluded) | "Fetched 45.3 MB in 12s (3,700 kB/s)"
+_RX_NEED = re.compile(r"^Need to get ([\d.,]+\s*[kMG]?B)(?:/[\d.,]+\s*[kMG]?B)? of archives")
+_RX_FETCHED = re.compile(r"^Fetched ([\d.,]+\s*[kMG]?B) in ")
+_UNITS = {'B': 1, 'kB': 1000, 'KB': 1000, 'MB': 1000 ** 2, 'GB': 1000 ** 3}
+
+PHASE_WEIGHTS = {
+    'Download': 25,
+    'Unpacking': 35,
+    'Setting up': 35,
+    'Triggers': 5,
+}
+_TEXT_RULES = (
+    ('Get:', _RX_DOWNLOAD, 'Downloading', PHASE_WEIGHTS['Download']),
+    ('Unpacking ', _RX_UNPACK, 'Unpacking', PHASE_WEIGHTS['Download'] + PHASE_WEIGHTS['Unpacking']),
+    ('Setting up ', _RX_SETUP, 'Setting up', 100 - PHASE_WEIGHTS['Triggers']),
+    ('Processing triggers for ', _RX_TRIGGERS, 'Triggers', 100),
+)
+
+# pmstatus descriptions -> (phase, package percent); longest prefixes first
+_PM_STAGES = (
+    ('Preparing to configure', 'Configuring', 60),
+    ('Preparing for removal of', 'Removing', 25),
+    ('Preparing', 'Preparing', 10),
+    ('Unpacking', 'Unpacking', 40),
+    ('Installing', 'Unpacking', 40),
+    ('Configuring', 'Configuring', 80),
+    ('Running post-installation trigger', 'Triggers', 90),
+    ('Installed', 'Done', 100),
+    ('Completely removing', 'Removing', 50),
+    ('Completely removed', 'Done', 100),
+    ('Removing', 'Removing', 50),
+    ('Removed', 'Done', 100),
+)
+
+
+def with_status_fd(cmd: str) -> str:
+    """Ask every apt/apt-get in a command chain for status records on STATUS_FD."""
+    return _RX_APT.sub(rf"\1 -o APT::Status-Fd={STATUS_FD}", cmd)
+
+
+def parse_status(line: str) -> Optional[Tuple[str, str, float, str]]:
+    """(kind, package-or-item, percent, description) for a status record, else None."""
+    m = _RX_STATUS.match(line.rstrip('\r\n'))
+    if not m:
+        return None
+    return m.group(1), m.group(2), float(m.group(3)), m.group(4)
+
+
+def _pkg_entry(name: str) -> Dict[str, Any]:
+    return {'name': name, 'version': '', 'phase': 'Queued', 'percent': 0}
+
+
+def set_package(state: Dict[str, Any], name: str, phase: str, percent: int) -> None:
+    """Raise a package's percent, keeping `pkg_sum` (sum of all percents) in step."""
+    pkgs = state['packages']
+    pkg = pkgs.get(name)
+    if pkg is None:
+        pkg = pkgs[name] = _pkg_entry(name)
+    old = int(pkg.get('percent', 0))
+    new = max(old, max(0, min(100, int(percent))))
+    pkg['phase'] = phase
+    pkg['percent'] = new
+    state['pkg_sum'] = state.get('pkg_sum', 0) + (new - old)
+    if not state.get('status_fd'):
+        # No exact numbers from apt: overall is the mean package percent
+        avg = state['pkg_sum'] / max(1, len(pkgs))
+        prev = state.get('overall') or {}
+        phase_all = 'Done' if avg >= 100 else (prev.get('phase') or 'Installing')
+        state['overall'] = {**prev, 'percent': int(avg), 'phase': phase_all}
+
+
+def reset_sum(state: Dict[str, Any]) -> None:
+    state['pkg_sum'] = sum(int(p.get('percent', 0)) for p in state['packages'].values())
+
+
+def parse_size(text: str) -> int:
+    """apt's SI sizes ('45.3 MB', '1,234 kB') in bytes."""
+    m = re.match(r"([\d.,]+)\s*([kKMG]?B)", text.strip())
+    if not m:
+        return 0
+    return int(float(m.group(1).replace(',', '')) * _UNITS.get(m.group(2), 1))
+
+
+def _apply_bytes(state: Dict[str, Any], line: str) -> bool:
+    """Download totals from apt's summary lines; True if the line was one."""
+    rx = _RX_NEED if line.startswith('Need to get ') else _RX_FETCHED if line.startswith('Fetched ') else None
+    m = rx.match(line) if rx else None
+    if not m:
+        return False
+    overall = dict(state.get('overall') or {})
+    size = parse_size(m.group(1))
+    if rx is _RX_NEED:
+        overall['download_total'] = size
+        overall.setdefault('download_bytes', 0)
+    else:
+        overall['download_bytes'] = size
+        overall.setdefault('download_total', size)
+    state['overall'] = overall
+    return True
+
+
+def apply_status(state: Dict[str, Any], rec: Tuple[str, str, float, str]) -> Optional[str]:
+    """Apply one status record; returns the package touched ('' = overall only, None = nothing)."""
+    kind, who, pct, desc = rec
+    state['status_fd'] = True
+    overall = dict(state.get('overall') or {})
+    if kind == 'dlstatus':
+        overall['download_percent'] = round(pct, 1)
+        if overall.get('download_total'):
+            overall['download_bytes'] = int(overall['download_total'] * pct / 100)
+        if not state.get('pm_started'):
+            overall.update({'percent': int(pct), 'phase': 'Downloading'})
+        state['overall'] = overall
+        return ''
+    name = who.split(':', 1)[0]
+    if kind == 'pmstatus':
+        state['pm_started'] = True
+        overall.update({'percent': int(pct), 'phase': 'Installing'})
+        state['overall'] = overall
+        for prefix, phase, pkg_pct in _PM_STAGES:
+            if desc.startswith(prefix):
+                set_package(state, name, phase, pkg_pct)
+                return name
+        return ''
+    if kind == 'pmerror':
+        pkgs = state['packages']
+        pkg = pkgs.get(name) or pkgs.setdefault(name, _pkg_entry(name))
+        pkg['phase'] = 'Failed'
+        pkg['error'] = desc
+        return name
+    return None  # pmconffile: noninteractive runs keep the old file
+
+
+def apply_text(state: Dict[str, Any], line: str) -> Optional[str]:
+    """Fallback parser for human apt output; returns the package touched or None."""
+    if _apply_bytes(state, line):
+        return ''
+    for prefix, rx, phase, pct in _TEXT_RULES:
+        if line.startswith(prefix):
+            m = rx.search(line)
+            if not m:
+                return None
+            name = m.group(1)
+            if state.get('status_fd') and phase != 'Downloading':
+                return None  # status records already cover unpack/configure
+            set_package(state, name, phase, pct)
+            return name
+    return None
@@ -0,0 +1,329 @@
+# routes/updates/deb_cache.py
+# Shared .deb cache for the fleet: fetch each pending package once, push it to every host over SFTP.
+
+from __future__ import annotations
+import hashlib
+import os
+import posixpath
+import re
+import shlex
+import threading
+import urllib.request
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from routes.common.disk_cache import DiskLRU
+from routes.common.singleflight import SingleFlight
+from routes.common.ssh_utils import ssh_connect, ssh_exec
+from . import fleet
+
+ENV_CACHE_MB = "RPI_MONITOR_DEB_CACHE_MB"
+ENV_MIRROR = "RPI_MONITOR_DEB_MIRROR"      # e.g. http://127.0.0.1:8000 (a local stand-in mirror)
+ENV_FETCH_WORKERS = "RPI_MONITOR_DEB_FETCH_WORKERS"
+DEFAULT_CACHE_MB = 2048
+DEFAULT_FETCH_WORKERS = 4
+
+REMOTE_STAGING = ".cache/rpi-monitor/debs"   # relative to the login's home, mode 0700
+REMOTE_ARCHIVES = "/var/cache/apt/archives"
+
+# apt-get never locks or downloads with --print-uris; it only lists what is not in archives/ yet
+_PRINT_URIS = "LC_ALL=C apt-get -qq -y --print-uris -o Debug::NoLocking=1 dist-upgrade"
+# 'http://deb.debian.org/.../linux-image_6.1.0_arm64.deb' linux-image_6.1.0_arm64.deb 41213412 SHA256:ab12...
+_RX_URI = re.compile(r"^'(?P<uri>[^']+)'\s+(?P<file>\S+)\s+(?P<size>\d+)\s+(?:(?P<algo>[A-Za-z0-9]+):)?(?P<hash>[0-9a-fA-F]+)\s*$")
+_HASHES = {"sha512": "sha512", "sha256": "sha256", "sha1": "sha1", "md5sum": "md5", "md5": "md5"}
+_SUM_TOOLS = {"sha512": "sha512sum", "sha256": "sha256sum", "sha1": "sha1sum", "md5": "md5sum"}
+
+_FETCH = SingleFlight()
+_cache: Optional[DiskLRU] = None
+_cache_lock = threading.Lock()
+
+Log = Callable[[str], None]
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(1, int(os.environ.get(name) or default))
+    except ValueError:
+        return default
+
+
+def cache() -> DiskLRU:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = DiskLRU("debs", _env_int(ENV_CACHE_MB, DEFAULT_CACHE_MB) * 1024 * 1024)
+        return _cache
+
+
+def parse_print_uris(text: str) -> List[Dict[str, Any]]:
+    """`apt-get --print-uris` lines -> [{uri, file, size, algo, hash, key}]; key is content-addressed."""
+    debs = []
+    for line in (text or "").splitlines():
+        m = _RX_URI.match(line.strip())
+        if not m:
+            continue
+        algo = (m.group("algo") or "md5sum").lower()
+        if algo not in _HASHES:
+            continue
+        digest = m.group("hash").lower()
+        debs.append({
+            "uri": m.group("uri"),
+            "file": m.group("file"),
+            "size": int(m.group("size")),
+            "algo": _HASHES[algo],
+            "hash": digest,
+            "key": f"{_HASHES[algo]}:{digest}",
+        })
+    return debs
+
+
+def _mirror_uri(uri: str) -> str:
+    """Point a URI at RPI_MONITOR_DEB_MIRROR (same path) when that is set."""
+    mirror = (os.environ.get(ENV_MIRROR) or "").strip().rstrip("/")
+    if not mirror:
+        return uri
+    return mirror + (urlsplit(uri).path or "/")
+
+
+def fetch(deb: Dict[str, Any], timeout: int = 60) -> Tuple[Optional[str], bool]:
+    """
+    Local file of a .deb: (path, downloaded). Cached by content hash; concurrent
+    requests for the same package share one download. Size and hash are checked
+    before anything enters the cache.
+    """
+    c = cache()
+    path = c.path(deb["key"])
+    if path:
+        return path, False
+
+    def _download() -> Optional[str]:
+        tmp = c.tmp_path(deb["key"])
+        h = hashlib.new(deb["algo"])
+        size = 0
+        try:
+            with urllib.request.urlopen(_mirror_uri(deb["uri"]), timeout=timeout) as resp, open(tmp, "wb") as f:
+                for chunk in iter(lambda: resp.read(256 * 1024), b""):
+                    h.update(chunk)
+                    size += len(chunk)
+                    f.write(chunk)
+            if size != deb["size"] or h.hexdigest() != deb["hash"]:
+                raise RuntimeError(f"{deb['file']}: size/hash mismatch")
+            return c.put_file(deb["key"], tmp)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    path, shared = _FETCH.do(deb["key"], _download)
+    return path, not shared
+
+
+class SftpPool:
+    """One SSH connection + SFTP channel per host, reused for every file pushed to it."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._conns: Dict[str, Tuple[Any, Any]] = {}
+
+    def get(self, s: Dict[str, Any]) -> Tuple[Any, Any]:
+        key = f"{s['pi_user']}@{s['pi_host']}"
+        with self._lock:
+            conn = self._conns.get(key)
+        if conn is not None and conn[0].get_transport() and conn[0].get_transport().is_active():
+            return conn
+        ssh = ssh_connect(
+            host=s["pi_host"], user=s["pi_user"],
+            auth=s.get("auth_method", "key"), key_path=s.get("ssh_key_path", ""),
+            password=s.get("password", ""), timeout=20,
+        )
+        conn = (ssh, ssh.open_sftp())
+        with self._lock:
+            self._conns[key] = conn
+        return conn
+
+    def close(self) -> None:
+        with self._lock:
+            conns, self._conns = list(self._conns.values()), {}
+        for ssh, sftp in conns:
+            for c in (sftp, ssh):
+                try:
+                    c.close()
+                except Exception:
+                    pass
+
+
+def _pending(pool: SftpPool, prof: Dict[str, Any]) -> List[Dict[str, Any]]:
+    ssh, _sftp = pool.get(fleet.profile_settings(prof))
+    rc, out, err = ssh_exec(ssh, _PRINT_URIS, timeout=120, shell=True)
+    if rc != 0:
+        raise RuntimeError((err or out or f"apt-get --print-uris rc={rc}").strip().splitlines()[-1])
+    return parse_print_uris(out)
+
+
+def _staging(ssh) -> Tuple[str, str]:
+    """(absolute staging dir, uid of the login) on the host; the dir is private to the login."""
+    d = shlex.quote(REMOTE_STAGING)
+    rc, out, err = ssh_exec(ssh, f"sh -c {shlex.quote(f'mkdir -p {d} && chmod 0700 {d} && cd {d} && pwd -P && id -u')}",
+                            timeout=15)
+    lines = (out or "").split()
+    if rc != 0 or len(lines) != 2:
+        raise RuntimeError((err or out or f"staging dir rc={rc}").strip().splitlines()[-1])
+    return lines[0], lines[1]
+
+
+def _install_script(staging: str, uid: str, files: List[Tuple[Dict[str, Any], str]]) -> str:
+    """
+    Root side of a push: every staged file must be a regular file owned by the
+    login, and its copy (made by root, so it can't change underneath) must match
+    the apt hash before it is renamed into archives/. Bad uploads are removed so
+    the next push sends them again.
+    """
+    q = shlex.quote
+    steps = [f"cd {q(staging)} || exit 1", f"[ \"$(stat -c %u .)\" = {q(uid)} ] || exit 1", "bad=0"]
+    for deb, _local in files:
+        name = deb["file"]
+        final = posixpath.join(REMOTE_ARCHIVES, name)
+        tmp = final + ".rpi-monitor-tmp"
+        steps.append(
+            f"if [ -f {q(name)} ] && [ ! -L {q(name)} ] && [ \"$(stat -c %u {q(name)})\" = {q(uid)} ] "
+            f"&& install -m 0644 -o root -g root {q(name)} {q(tmp)} "
+            f"&& echo {q(deb['hash'] + '  ' + tmp)} | {_SUM_TOOLS[deb['algo']]} -c --status; "
+            f"then mv -f {q(tmp)} {q(final)}; "
+            f"else rm -f {q(tmp)}; echo {q(name + ': ownership/hash check failed')} >&2; bad=1; fi; "
+            f"rm -f {q(name)}"
+        )
+    steps.append("exit $bad")
+    return "\n".join(steps)
+
+
+def _push(pool: SftpPool, prof: Dict[str, Any], files: List[Tuple[Dict[str, Any], str]],
+          sudo_wrap: Callable[[str, Dict[str, Any]], str]) -> int:
+    """
+    Upload into the login's staging dir (resumable: same-size files are kept),
+    then verify and move into archives/ as root.
+    """
+    ssh, sftp = pool.get(fleet.profile_settings(prof))
+    staging, uid = _staging(ssh)
+    have = {a.filename: a.st_size for a in sftp.listdir_attr(staging)}
+    sent = 0
+    for deb, local in files:
+        if have.get(deb["file"]) != deb["size"]:
+            sftp.put(local, posixpath.join(staging, deb["file"]))
+            sent += deb["size"]
+    cmd = sudo_wrap(f"sudo sh -c {shlex.quote(_install_script(staging, uid, files))}", prof)
+    # Not shell=True: its double-quoted wrapper would expand the script's $(...) as the login
+    rc, out, err = ssh_exec(ssh, f"sh -c {shlex.quote(cmd)}", timeout=300)
+    if rc != 0:
+        raise RuntimeError((err or out or f"install rc={rc}").strip().splitlines()[-1])
+    return sent
+
+
+def _parallel(items: List[Any], fn: Callable[[Any], None], workers: int) -> None:
+    gate = threading.Semaphore(max(1, workers))
+
+    def _one(item: Any) -> None:
+        with gate:
+            fn(item)
+
+    threads = [threading.Thread(target=_one, args=(it,), daemon=True) for it in items]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+def seed(profiles: List[Dict[str, Any]], sudo_wrap: Callable[[str, Dict[str, Any]], str],
+         log: Log, progress: Optional[Callable[[int], None]] = None) -> Dict[str, Any]:
+    """
+    Union of the pending .debs of `profiles`, each fetched once into the local
+    cache, then pushed to every host that needs it. Per-host errors are logged
+    and skipped (that host simply downloads on its own during the upgrade).
+    """
+    pool = SftpPool()
+    hosts: Dict[Any, Dict[str, Any]] = {}
+    wanted: Dict[Any, List[Dict[str, Any]]] = {}
+    local: Dict[str, str] = {}
+    stats = {"fetched": 0, "cached": 0, "fetched_bytes": 0, "pushed_bytes": 0, "pushed": 0}
+    lock = threading.Lock()
+    workers = fleet.default_workers()
+
+    def _list(prof: Dict[str, Any]) -> None:
+        name = prof.get("name") or prof.get("pi_host", "")
+        try:
+            debs = _pending(pool, prof)
+        except Exception as e:
+            hosts[prof.get("id")] = {"name": name, "error": str(e)}
+            log(f"{name}: {e}")
+            return
+        wanted[prof.get("id")] = debs
+        hosts[prof.get("id")] = {"name": name, "needed": len(debs), "bytes": sum(d["size"] for d in debs)}
+
+    def _get(d: Dict[str, Any]) -> None:
+        try:
+            path, downloaded = fetch(d)
+        except Exception as e:
+            log(f"{d['file']}: {e}")
+            return
+        with lock:
+            if path:
+                local[d["key"]] = path
+            stats["fetched" if downloaded else "cached"] += 1
+            if downloaded:
+                stats["fetched_bytes"] += d["size"]
+            done = stats["fetched"] + stats["cached"]
+        if progress:
+            progress(int(done * 50 / max(1, len(union))))
+
+    def _send(prof: Dict[str, Any]) -> None:
+        info = hosts[prof.get("id")]
+        files = [(d, local[d["key"]]) for d in wanted[prof.get("id")] if d["key"] in local]
+        if files:
+            try:
+                sent = _push(pool, prof, files, sudo_wrap)
+                info.update(pushed=len(files), sent=sent, placed_bytes=sum(d["size"] for d, _ in files))
+                log(f"{info['name']}: {len(files)}/{info['needed']} packages placed in {REMOTE_ARCHIVES}")
+            except Exception as e:
+                info["error"] = str(e)
+                log(f"{info['name']}: push failed: {e}")
+                sent = 0
+        else:
+            sent = 0
+        with lock:
+            stats["pushed_bytes"] += sent
+            stats["pushed"] += 1
+            done = stats["pushed"]
+        if progress:
+            progress(50 + int(done * 50 / max(1, len(wanted))))
+
+    try:
+        _parallel(profiles, _list, workers)
+        union: Dict[str, Dict[str, Any]] = {}
+        for prof in profiles:
+            for d in wanted.get(prof.get("id"), []):
+                union.setdefault(d["key"], d)
+        log(f"{len(union)} distinct packages ({sum(d['size'] for d in union.values())} bytes) "
+            f"pending across {len(wanted)} hosts")
+        # Fetching later packages must not evict earlier ones of this batch before they are pushed
+        for k in union:
+            cache().pin(k)
+        try:
+            _parallel(list(union.values()), _get, _env_int(ENV_FETCH_WORKERS, DEFAULT_FETCH_WORKERS))
+            log(f"Fetched {stats['fetched']} packages ({stats['fetched_bytes']} bytes), {stats['cached']} already cached")
+            _parallel([p for p in profiles if p.get("id") in wanted], _send, workers)
+        finally:
+            for k in union:
+                cache().unpin(k)
+    finally:
+        pool.close()
+
+    # What the hosts would otherwise have downloaded themselves, minus our one download
+    placed = sum(h.get("placed_bytes", 0) for h in hosts.values())
+    return {
+        "hosts": hosts,
+        "packages": len(union),
+        "fetched": stats["fetched"],
+        "cached": stats["cached"],
+        "fetched_bytes": stats["fetched_bytes"],
+        "pushed_bytes": stats["pushed_bytes"],
+        "saved_bytes": max(0, placed - stats["fetched_bytes"]),
+        "cache": cache().stats(),
+    }
@@ -0,0 +1,206 @@
+# routes/updates/durations.py
+# Per-package install timings from past runs (by host class) -> progress weights and ETA.
+
+from __future__ import annotations
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+from routes.common.fs import get_logs_dir
+from routes.common.ssh_utils import ssh_exec
+
+DB_NAME = "durations.json"
+MAX_PER_CLASS = 4000
+ALPHA = 0.3              # weight of the newest run in the moving average
+DEFAULT_SECONDS = 2.0    # per package and bucket while a class has no history at all
+
+# Package phases (status records and text fallback) -> timing bucket; others are not timed
+_BUCKETS = {
+    'Preparing': 'unpack', 'Unpacking': 'unpack', 'Removing': 'unpack',
+    'Configuring': 'configure', 'Setting up': 'configure', 'Triggers': 'configure',
+}
+_ORDER = ('unpack', 'configure')
+
+_lock = threading.Lock()
+_db: Optional[Dict[str, Dict[str, List[float]]]] = None   # class -> pkg -> [n, unpack_s, configure_s, ts]
+_classes: Dict[str, str] = {}                              # host -> class
+
+
+def _path() -> str:
+    return os.path.join(get_logs_dir(), DB_NAME)
+
+
+def _load() -> Dict[str, Dict[str, List[float]]]:
+    global _db
+    if _db is None:
+        try:
+            with open(_path(), 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            _db = data.get('classes') if isinstance(data, dict) else None
+        except Exception:
+            _db = None
+        _db = _db if isinstance(_db, dict) else {}
+    return _db
+
+
+def _save() -> None:
+    path = _path()
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({'version': 1, 'classes': _db or {}}, f, separators=(',', ':'))
+    os.replace(tmp, path)
+
+
+def host_class(ssh, host: str) -> str:
+    """'<arch>|<board model>' of a host (one exec per host and process)."""
+    cls = _classes.get(host)
+    if cls:
+        return cls
+    try:
+        _rc, out, _ = ssh_exec(
+            ssh, "uname -m; tr -d '\\0' < /proc/device-tree/model 2>/dev/null || echo generic",
+            timeout=10, shell=True,
+        )
+        lines = [ln.strip() for ln in (out or '').splitlines() if ln.strip()]
+        # "Raspberry Pi 4 Model B Rev 1.4" -> "Raspberry Pi 4 Model B" (revisions time alike)
+        model = (lines[1] if len(lines) > 1 else 'generic').split(' Rev ')[0]
+        cls = f"{lines[0] if lines else 'unknown'}|{model}"
+    except Exception:
+        return 'unknown|generic'
+    _classes[host] = cls
+    return cls
+
+
+def observe(state: Dict[str, Any], name: Optional[str], now: Optional[float] = None) -> None:
+    """
+    Attribute the time since the previous package event to the package and
+    bucket that were active then. Call after every progress update.
+    """
+    if not name:
+        return
+    pkg = state['packages'].get(name)
+    bucket = _BUCKETS.get((pkg or {}).get('phase', ''))
+    now = now or time.time()
+    t = state.setdefault('timing', {'last': None, 'pkgs': {}})
+    last = t['last']
+    if last:
+        prev_name, prev_bucket, since = last
+        spent = t['pkgs'].setdefault(prev_name, {})
+        spent[prev_bucket] = spent.get(prev_bucket, 0.0) + max(0.0, now - since)
+    t['last'] = [name, bucket, now] if bucket else None
+
+
+def commit(state: Dict[str, Any]) -> int:
+    """Fold a successful run's timings into the database; returns packages recorded."""
+    cls = state.get('host_class')
+    # The open interval after the last event (cleanup, reboot check) belongs to no package
+    pkgs = (state.get('timing') or {}).get('pkgs') or {}
+    if not cls or not pkgs:
+        return 0
+    now = time.time()
+    with _lock:
+        db = _load()
+        table = db.setdefault(cls, {})
+        for name, spent in pkgs.items():
+            row = table.get(name)
+            obs = [round(spent.get(b, 0.0), 2) for b in _ORDER]
+            if row is None:
+                table[name] = [1, *obs, int(now)]
+            else:
+                n = int(row[0])
+                table[name] = [n + 1, *(round(old * (1 - ALPHA) + new * ALPHA, 2)
+                                        for old, new in zip(row[1:3], obs)), int(now)]
+        if len(table) > MAX_PER_CLASS:
+            for name, _row in sorted(table.items(), key=lambda kv: kv[1][3])[:len(table) - MAX_PER_CLASS]:
+                del table[name]
+        try:
+            _save()
+        except Exception:
+            pass
+    return len(pkgs)
+
+
+def _default(cls: str) -> List[float]:
+    """[unpack_s, configure_s] for a package without history: the class median."""
+    with _lock:
+        rows = list((_load().get(cls) or {}).values())
+    if not rows:
+        return [DEFAULT_SECONDS, DEFAULT_SECONDS]
+    totals = sorted(r[1] + r[2] for r in rows)
+    unpacks = sorted(r[1] for r in rows)
+    mid = len(totals) // 2
+    return [unpacks[mid], max(0.0, totals[mid] - unpacks[mid])]
+
+
+def _settled(phase: str, est: List[float]) -> float:
+    """Seconds of a package's estimate that count as done while it is not the active one."""
+    bucket = _BUCKETS.get(phase)
+    if phase == 'Done' or bucket == 'configure':
+        return est[0] + est[1]
+    return est[0] if bucket == 'unpack' else 0.0
+
+
+def _track(t: Dict[str, Any], cls: str, name: str, pkgs: Dict[str, Any]) -> None:
+    """Fold one package's estimate and current phase into the running sums."""
+    est = t['est'].get(name)
+    if est is None:
+        with _lock:
+            row = (_load().get(cls) or {}).get(name)
+        est = t['est'][name] = list(row[1:3]) if row else t['default']
+        t['total_s'] += est[0] + est[1]
+    settled = _settled((pkgs.get(name) or {}).get('phase', ''), est)
+    t['done_s'] += settled - t['settled'].get(name, 0.0)
+    t['settled'][name] = settled
+
+
+def weigh(state: Dict[str, Any], expected: Sequence[str] = (), now: Optional[float] = None,
+          name: Optional[str] = None) -> None:
+    """
+    Overall install percent and ETA from the expected time of every package
+    (history of this host class) instead of apt's step count. Only touches
+    the install part of a run; downloads keep apt's own percent. `name` is
+    the package the event touched: the sums are kept up to date per package
+    change, so an event costs O(1).
+    """
+    cls = state.get('host_class')
+    t = state.get('timing')
+    if not cls or not t or not (t.get('last') or t.get('pkgs')):
+        return  # nothing installed yet (downloading)
+    now = now or time.time()
+    pkgs = state['packages']
+    if 'est' not in t:
+        t.update(est={}, settled={}, done_s=0.0, total_s=0.0, n_expected=0, default=_default(cls))
+        for n in pkgs:
+            _track(t, cls, n, pkgs)
+    if t['n_expected'] != len(expected):
+        for n in expected:
+            if n not in t['est']:
+                _track(t, cls, n, pkgs)
+        t['n_expected'] = len(expected)
+    if name:
+        _track(t, cls, name, pkgs)
+    total = t['total_s']
+    if total <= 0:
+        return
+    done = t['done_s']
+    last = t.get('last')
+    est = t['est'].get(last[0]) if last else None
+    if est:
+        # The active bucket counts as elapsed time (capped below its estimate), not in full
+        full = est[0] if last[1] == 'unpack' else est[1]
+        done += min(full * 0.95, now - last[2]) - full
+    # Never move backwards, even when a package takes longer than its estimate
+    t['pct'] = max(t.get('pct', 0), min(99, int(done * 100 / total)))
+    overall = dict(state.get('overall') or {})
+    overall['percent'] = t['pct']
+    overall['eta'] = int(max(0.0, total - done))
+    overall['weighted'] = True
+    state['overall'] = overall
+
+
+def stats() -> Dict[str, Any]:
+    with _lock:
+        db = _load()
+        return {cls: len(table) for cls, table in db.items()}
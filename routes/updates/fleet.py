@@ -0,0 +1,160 @@
+# routes/updates/fleet.py
+# Pending updates across several profiles: bounded concurrent scans, per-host deadlines.
+
+from __future__ import annotations
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+from routes.drivers.os_debian import DebianDriver
+from . import scan_cache
+
+ENV_WORKERS = "RPI_MONITOR_FLEET_WORKERS"
+ENV_DEADLINE = "RPI_MONITOR_FLEET_DEADLINE"
+DEFAULT_WORKERS = 4
+DEFAULT_DEADLINE = 300   # seconds per host, connect + optional index refresh + dry-run
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(1, int(os.environ.get(name) or default))
+    except ValueError:
+        return default
+
+
+def default_workers() -> int:
+    return _env_int(ENV_WORKERS, DEFAULT_WORKERS)
+
+
+def default_deadline() -> int:
+    return _env_int(ENV_DEADLINE, DEFAULT_DEADLINE)
+
+
+def profile_settings(prof: Dict[str, Any]) -> Dict[str, Any]:
+    """SSH settings of a profile, in the shape the drivers expect."""
+    return {
+        "pi_host": prof.get("pi_host", ""),
+        "pi_user": prof.get("pi_user", ""),
+        "auth_method": prof.get("auth_method", "key"),
+        "ssh_key_path": prof.get("ssh_key_path", ""),
+        "password": prof.get("password", ""),
+    }
+
+
+def is_security(pkg: Dict[str, Any]) -> bool:
+    # From a security suite, or the upgrade fixes a CVE known to the offline index
+    return bool(pkg.get("cves")) or "security" in (pkg.get("origin") or "").lower()
+
+
+def _row(prof: Dict[str, Any], snap: Optional[Dict[str, Any]], cached: bool,
+         error: Optional[str] = None, started: Optional[float] = None) -> Dict[str, Any]:
+    pkgs = [
+        {
+            "name": p.get("name", ""),
+            "current": p.get("current", ""),
+            "candidate": p.get("candidate", ""),
+            "security": is_security(p),
+        }
+        for p in ((snap or {}).get("packages") or [])
+    ]
+    return {
+        "id": prof.get("id"),
+        "name": prof.get("name") or prof.get("pi_host", ""),
+        "host": prof.get("pi_host", ""),
+        "ok": error is None,
+        "error": error,
+        "cached": cached,
+        "age": (snap or {}).get("age"),
+        "count": len(pkgs),
+        "security": sum(1 for p in pkgs if p["security"]),
+        "seconds": round(time.time() - started, 1) if started else 0.0,
+        "packages": pkgs,
+    }
+
+
+def scan_host(prof: Dict[str, Any], refresh: Optional[bool], deadline: float) -> Dict[str, Any]:
+    """One host's row: the cached scan while fresh, else a new scan shared via scan_cache."""
+    started = time.time()
+    host = prof.get("pi_host", "")
+    if refresh is None and scan_cache.is_fresh(host):
+        return _row(prof, scan_cache.snapshot(host), True, started=started)
+    if not scan_cache.begin(host):
+        # Someone is scanning this host already (page, scheduler, other fleet view)
+        if not scan_cache.wait(host, max(0.0, deadline - time.time())):
+            return _row(prof, scan_cache.snapshot(host), True, "deadline exceeded", started)
+        snap = scan_cache.snapshot(host)
+        err = (snap or {}).get("error") if not (snap or {}).get("ts") else None
+        return _row(prof, snap, True, err, started)
+
+    scan = DebianDriver(settings=profile_settings(prof)).stream_scan(refresh=refresh)
+    error = None
+    try:
+        for evt, payload in scan_cache.record(host, lambda: scan):
+            if evt == "error":
+                error = payload.get("message") or "scan failed"
+            if time.time() > deadline:
+                error = "deadline exceeded"
+                break
+    finally:
+        scan.close()
+    return _row(prof, None if error else scan_cache.snapshot(host), False, error, started)
+
+
+def run(app, profiles: List[Dict[str, Any]], refresh: Optional[bool] = None,
+        workers: Optional[int] = None, deadline: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Scan `profiles` with at most `workers` at a time; yields each host's row as
+    it completes. A host still running at its deadline yields an error row.
+    """
+    workers = max(1, workers or default_workers())
+    per_host = max(5, deadline or default_deadline())
+    results: "queue.Queue[Dict[str, Any]]" = queue.Queue()
+    gate = threading.Semaphore(workers)
+    deadlines: Dict[Any, float] = {}
+    lock = threading.Lock()
+
+    def _work(prof: Dict[str, Any]) -> None:
+        with gate:
+            # The deadline starts when the host gets a worker, not while it queues
+            dl = time.time() + per_host
+            with lock:
+                deadlines[prof.get("id")] = dl
+            try:
+                with app.app_context():
+                    row = scan_host(prof, refresh, dl)
+            except Exception as e:
+                row = _row(prof, None, False, str(e))
+            results.put(row)
+
+    for prof in profiles:
+        threading.Thread(target=_work, args=(prof,), name=f"fleet-{prof.get('pi_host')}", daemon=True).start()
+
+    pending = {p.get("id"): p for p in profiles}
+    while pending:
+        try:
+            row = results.get(timeout=1.0)
+        except queue.Empty:
+            now = time.time()
+            with lock:
+                late = [pid for pid, dl in deadlines.items() if pid in pending and now > dl + 5]
+            for pid in late:
+                # Worker is stuck below the driver's own timeouts: report now, drop its late row
+                yield _row(pending.pop(pid), None, False, "deadline exceeded")
+            continue
+        if row["id"] in pending:
+            del pending[row["id"]]
+            yield row
+
+
+def matrix(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Hosts x packages: {package: {profile id: {current, candidate, security}}}."""
+    pkgs: Dict[str, Dict[str, Any]] = {}
+    for r in rows:
+        for p in r["packages"]:
+            pkgs.setdefault(p["name"], {})[r["id"]] = {
+                "current": p["current"], "candidate": p["candidate"], "security": p["security"],
+            }
+    hosts = [{k: v for k, v in r.items() if k != "packages"} for r in rows]
+    return {"hosts": hosts, "packages": dict(sorted(pkgs.items()))}
@@ -0,0 +1,102 @@
+# routes/updates/install_queue.py
+# Per-host install queue: requests arriving within a short window become one apt transaction.
+
+from __future__ import annotations
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+ENV_WINDOW = "RPI_MONITOR_INSTALL_WINDOW"
+DEFAULT_WINDOW = 3.0   # seconds to wait for more clicks before running the transaction
+
+OPS = ("install", "remove")
+
+
+class Batch:
+    """Pending or running transaction of one host; every request merged into it shares its run."""
+
+    def __init__(self, host: str, settings: Dict[str, Any], run_id: str):
+        self.host = host
+        self.settings = settings
+        self.run_id = run_id
+        self.ops: Dict[str, str] = {}          # package -> "install" | "remove" (last request wins)
+        self.sudo_password = ""
+        self.created = time.time()
+        self.started = False
+        self.results: Dict[str, Dict[str, Any]] = {}
+        self.output = ""
+        self.done = threading.Event()
+
+    def names(self, op: str) -> List[str]:
+        return sorted(n for n, o in self.ops.items() if o == op)
+
+
+_lock = threading.Lock()
+_pending: Dict[str, Batch] = {}
+_running: Dict[str, Batch] = {}
+_open_run: Optional[Callable[[str], str]] = None      # host -> run_id
+_runner: Optional[Callable[[Batch], None]] = None     # executes a batch (views)
+
+
+def window() -> float:
+    try:
+        return max(0.0, float(os.environ.get(ENV_WINDOW) or DEFAULT_WINDOW))
+    except ValueError:
+        return DEFAULT_WINDOW
+
+
+def configure(open_run: Callable[[str], str], runner: Callable[[Batch], None]) -> None:
+    global _open_run, _runner
+    _open_run, _runner = open_run, runner
+
+
+def submit(settings: Dict[str, Any], op: str, names: List[str], sudo_password: str = "") -> Batch:
+    """Queue install/remove of `names`; joins the host's pending batch if there is one."""
+    if op not in OPS:
+        raise ValueError(f"op must be one of {', '.join(OPS)}")
+    if _open_run is None or _runner is None:
+        raise RuntimeError("install queue not configured")
+    host = settings.get("pi_host", "")
+    with _lock:
+        b = _pending.get(host)
+        if b is None:
+            b = _pending[host] = Batch(host, settings, _open_run(host))
+            threading.Thread(target=_dispatch, args=(b,), name=f"instq-{host}", daemon=True).start()
+        for n in names:
+            b.ops[n] = op
+        if sudo_password:
+            b.sudo_password = sudo_password
+    return b
+
+
+def _dispatch(b: Batch) -> None:
+    time.sleep(window())
+    # One transaction per host at a time (dpkg lock); requests keep merging meanwhile
+    prev = _running.get(b.host)
+    while prev is not None and prev is not b:
+        prev.done.wait()
+        prev = _running.get(b.host)
+    with _lock:
+        b.started = True
+        if _pending.get(b.host) is b:
+            del _pending[b.host]
+        _running[b.host] = b
+    try:
+        _runner(b)
+    finally:
+        with _lock:
+            if _running.get(b.host) is b:
+                del _running[b.host]
+        b.done.set()
+
+
+def snapshot() -> Dict[str, Any]:
+    with _lock:
+        def _view(b: Batch) -> Dict[str, Any]:
+            return {"run_id": b.run_id, "install": b.names("install"), "remove": b.names("remove"),
+                    "age": round(time.time() - b.created, 1)}
+        return {
+            "pending": {h: _view(b) for h, b in _pending.items()},
+            "running": {h: _view(b) for h, b in _running.items()},
+        }
@@ -0,0 +1,189 @@
+# routes/updates/remote_job.py
+# Long commands run detached on the host (setsid/nohup, output to files) and are followed by offset reads.
+
+from __future__ import annotations
+import os
+import posixpath
+import shlex
+import time
+from typing import Any, Callable, Dict, Optional
+
+import paramiko
+
+from routes.common.ssh_utils import _Splitter, ssh_exec
+
+ENV_DETACHED = "RPI_MONITOR_DETACHED_RUNS"       # 0 = stream over one SSH channel as before
+ENV_LOST_TIMEOUT = "RPI_MONITOR_JOB_LOST_TIMEOUT"
+DEFAULT_LOST_TIMEOUT = 1800   # seconds without contact before a followed job is given up
+
+JOBS_DIR = ".cache/rpi-monitor/jobs"   # relative to the login's home (exec and SFTP both start there)
+READ_CHUNK = 64 * 1024
+POLL_MIN = 0.5
+POLL_MAX = 5.0
+BACKOFF_AFTER = 10.0  # seconds without output before polling slows down
+ALIVE_EVERY = 10     # idle polls between `kill -0` checks of the job's process
+
+
+def enabled() -> bool:
+    return (os.environ.get(ENV_DETACHED) or "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+def lost_timeout() -> int:
+    try:
+        return max(30, int(os.environ.get(ENV_LOST_TIMEOUT) or DEFAULT_LOST_TIMEOUT))
+    except ValueError:
+        return DEFAULT_LOST_TIMEOUT
+
+
+def launch(ssh: paramiko.SSHClient, run_id: str, cmd: str) -> Dict[str, Any]:
+    """
+    Start `cmd` detached from this SSH session: stdout -> out, stderr -> err,
+    exit code -> rc (written last, atomically). Returns the job metadata that
+    follow() needs; it is plain JSON so it can be persisted with the run.
+    """
+    d = posixpath.join(JOBS_DIR, run_id)
+    # Subshell: an `exit` inside cmd must not skip writing rc
+    body = f"( {cmd}\n) >out 2>err </dev/null; echo $? >rc.tmp; mv rc.tmp rc"
+    start = (
+        f"mkdir -p {shlex.quote(d)} && cd {shlex.quote(d)} && rm -f rc && "
+        f"nohup $(command -v setsid) sh -lc {shlex.quote(body)} >/dev/null 2>&1 </dev/null & echo $!"
+    )
+    rc, out, err = ssh_exec(ssh, f"sh -c {shlex.quote(start)}", timeout=20)
+    pid = (out or "").strip().splitlines()[-1:] or [""]
+    if rc != 0 or not pid[0].isdigit():
+        raise RuntimeError((err or out or f"launch rc={rc}").strip() or "launch failed")
+    return {"dir": d, "pid": int(pid[0]), "out_off": 0, "err_off": 0, "launched": time.time()}
+
+
+def _read_from(sftp: paramiko.SFTPClient, path: str, offset: int) -> bytes:
+    try:
+        with sftp.open(path, "rb") as f:
+            f.seek(offset)
+            return f.read(READ_CHUNK)
+    except FileNotFoundError:   # not created yet
+        return b""
+
+
+def _read_rc(sftp: paramiko.SFTPClient, d: str) -> Optional[int]:
+    try:
+        with sftp.open(posixpath.join(d, "rc"), "r") as f:
+            raw = f.read().decode("utf-8", "replace").strip()
+        return int(raw) if raw else None
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _resume_point(split: _Splitter, start: int, data: bytes, prev: int) -> int:
+    """
+    Byte offset just past the output `split` has handed over after feeding it
+    `data` (read at `start`). Counted on the raw bytes: with errors="replace"
+    the decoded text need not re-encode to the same length.
+    """
+    if not split.buf:
+        # Everything decoded was passed on; only an incomplete UTF-8 sequence may be pending
+        return start + len(data) - len(split.dec.getstate()[0])
+    nl = data.rfind(b"\n")   # 0x0a never occurs inside a multi-byte sequence
+    return start + nl + 1 if nl != -1 else prev
+
+
+def follow(
+    connect: Callable[[], paramiko.SSHClient],
+    meta: Dict[str, Any],
+    on_stdout: Callable[[str], None],
+    on_stderr: Callable[[str], None],
+    on_poll: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ssh: Optional[paramiko.SSHClient] = None,
+) -> int:
+    """
+    Read new output from the job's files (from meta's offsets) until its rc
+    file appears; returns the exit code. Offsets in `meta` are advanced to
+    the last complete line handed over, so a later follow() (e.g. after a
+    restart) resumes without repeating or losing lines. Connection errors
+    are retried until there has been no contact for lost_timeout().
+    """
+    d = meta["dir"]
+    splitters = {"out": _Splitter(True), "err": _Splitter(True)}
+    consumed = {"out": meta["out_off"], "err": meta["err_off"]}
+    sinks = {"out": on_stdout, "err": on_stderr}
+    own = ssh is None
+    sftp = None
+    interval = POLL_MIN
+    idle_polls = 0
+    last_contact = last_data = time.time()
+    try:
+        while True:
+            try:
+                if ssh is None:
+                    ssh, own = connect(), True
+                if sftp is None:
+                    sftp = ssh.open_sftp()
+                got = False
+                for name in ("out", "err"):
+                    key = f"{name}_off"
+                    data = _read_from(sftp, posixpath.join(d, name), consumed[name])
+                    if not data:
+                        continue
+                    got = True
+                    split = splitters[name]
+                    for line in split.feed(data):
+                        sinks[name](line)
+                    # Resume point: everything except a still unterminated line
+                    meta[key] = _resume_point(split, consumed[name], data, meta[key])
+                    consumed[name] += len(data)
+                last_contact = time.time()
+                if got:
+                    last_data = time.time()
+                    idle_polls = 0
+                    interval = POLL_MIN
+                    if on_poll:
+                        on_poll(meta)
+                    continue
+                rc = _read_rc(sftp, d)
+                if rc is not None:
+                    # rc is written after the output files are closed: one more read drains them
+                    if any(_read_from(sftp, posixpath.join(d, n), consumed[n]) for n in ("out", "err")):
+                        continue
+                    for name, split in splitters.items():
+                        for line in split.close():
+                            sinks[name](line)
+                        meta[f"{name}_off"] = consumed[name]
+                    if on_poll:
+                        on_poll(meta)
+                    return rc
+                idle_polls += 1
+                if idle_polls % ALIVE_EVERY == 0:
+                    alive, _, _ = ssh_exec(ssh, f"kill -0 {int(meta['pid'])} 2>/dev/null", timeout=15)
+                    if alive != 0 and _read_rc(sftp, d) is None:
+                        raise RuntimeError("detached job is gone (host rebooted or process killed)")
+                if on_poll:
+                    on_poll(meta)
+                time.sleep(interval)
+                # Short gaps keep the fast pace (output times feed the per-package timings)
+                if time.time() - last_data > BACKOFF_AFTER:
+                    interval = min(POLL_MAX, interval * 1.5)
+            except (paramiko.SSHException, OSError, EOFError) as e:
+                if time.time() - last_contact > lost_timeout():
+                    raise RuntimeError(f"lost contact with detached job: {e}")
+                for c in (sftp, ssh if own else None):
+                    try:
+                        if c is not None:
+                            c.close()
+                    except Exception:
+                        pass
+                sftp = None
+                ssh = None
+                time.sleep(POLL_MAX)
+    finally:
+        for c in (sftp, ssh if own else None):
+            try:
+                if c is not None:
+                    c.close()
+            except Exception:
+                pass
+
+
+def cleanup(ssh: paramiko.SSHClient, meta: Dict[str, Any]) -> None:
+    try:
+        ssh_exec(ssh, f"rm -rf {shlex.quote(meta['dir'])}", timeout=15)
+    except Exception:
+        pass
@@ -0,0 +1,201 @@
+# routes/updates/rollout.py
+# Rolling upgrade of many profiles: canary batch first, bounded parallelism, failure threshold.
+
+from __future__ import annotations
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from routes.common.bounded import BoundedMap
+from routes.common.fs import append_log, finalize_log, index_update
+from . import run_events
+
+REBOOT_MODES = ("never", "if_required", "always")
+POLL_INTERVAL = 1.0   # seconds between progress samples of the running hosts
+
+# (profile, host run_id, options) -> exit code; does the whole upgrade of one host
+UpgradeFn = Callable[[Dict[str, Any], str, Dict[str, Any]], int]
+# host run_id -> {"percent", "phase", ...} or None
+ProgressFn = Callable[[str], Optional[Dict[str, Any]]]
+# (rollout, log) -> None; runs once before the first batch (e.g. seeding the .deb cache)
+PrepareFn = Callable[["Rollout", Callable[[str], None]], None]
+
+
+def plan_batches(n: int, canary: int, max_parallel: int) -> List[List[int]]:
+    """Host indexes per batch: the canaries alone, then groups of max_parallel."""
+    canary = max(0, min(canary, n))
+    max_parallel = max(1, max_parallel)
+    batches = [list(range(canary))] if canary else []
+    for i in range(canary, n, max_parallel):
+        batches.append(list(range(i, min(n, i + max_parallel))))
+    return batches
+
+
+class Rollout:
+    def __init__(self, rollout_id: str, profiles: List[Dict[str, Any]], opts: Dict[str, Any]):
+        self.id = rollout_id
+        self.opts = opts
+        self.hosts: List[Dict[str, Any]] = [
+            {
+                "idx": i,
+                "id": p.get("id"),
+                "name": p.get("name") or p.get("pi_host", ""),
+                "host": p.get("pi_host", ""),
+                "run_id": f"{rollout_id}_h{i:02d}",
+                "status": "queued",     # queued | running | ok | failed | skipped
+                "batch": None,
+                "percent": 0,
+                "phase": "",
+                "rc": None,
+            }
+            for i, p in enumerate(profiles)
+        ]
+        self.batches = plan_batches(len(profiles), opts["canary"], opts["max_parallel"])
+        self.batch = -1
+        self.failures = 0
+        self.halted: Optional[str] = None
+        self.halt_requested = False
+        self.done = False
+        self.started_ts = time.time()
+        self.ended_ts: Optional[float] = None
+        self.lock = threading.Lock()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "rollout_id": self.id,
+                "options": {k: v for k, v in self.opts.items() if k != "profiles" and not k.startswith("sudo")},
+                "hosts": [dict(h) for h in self.hosts],
+                "batches": self.batches,
+                "batch": self.batch,
+                "failures": self.failures,
+                "halted": self.halted,
+                "done": self.done,
+                "status": "done" if self.done and not self.halted else ("halted" if self.halted else "running"),
+                "started_at": self.started_ts,
+                "ended_at": self.ended_ts,
+            }
+
+
+_ROLLOUTS: BoundedMap = BoundedMap(
+    "updates._ROLLOUTS", maxsize=20, ttl=24 * 3600,
+    can_evict=lambda _rid, r: r.done,
+)
+
+
+def get(rollout_id: str) -> Optional[Rollout]:
+    return _ROLLOUTS.peek(rollout_id)
+
+
+def _log(r: Rollout, text: str) -> None:
+    append_log(r.id, f"[{datetime.now(timezone.utc).strftime('%H:%M:%S')}] {text}\n")
+
+
+def _set_host(r: Rollout, h: Dict[str, Any], **fields: Any) -> None:
+    with r.lock:
+        changed = any(h.get(k) != v for k, v in fields.items())
+        h.update(fields)
+        payload = dict(h)
+    if changed:
+        run_events.emit(r.id, "host", payload)
+
+
+def _run_batch(r: Rollout, idxs: List[int], upgrade: UpgradeFn, progress: ProgressFn) -> None:
+    threads = []
+    for i in idxs:
+        h = r.hosts[i]
+        prof = r.opts["profiles"][i]
+
+        def _one(h=h, prof=prof):
+            try:
+                rc = upgrade(prof, h["run_id"], r.opts)
+            except Exception as e:
+                _log(r, f"{h['name']}: {e}")
+                rc = 255
+            _set_host(r, h, rc=rc, status="ok" if rc == 0 else "failed",
+                      percent=100 if rc == 0 else h["percent"], phase="Done" if rc == 0 else "Failed")
+
+        _set_host(r, h, status="running", batch=r.batch)
+        t = threading.Thread(target=_one, name=f"rollout-{h['run_id']}", daemon=True)
+        t.start()
+        threads.append(t)
+
+    while any(t.is_alive() for t in threads):
+        for t in threads:
+            t.join(POLL_INTERVAL / max(1, len(threads)))
+        for i in idxs:
+            h = r.hosts[i]
+            if h["status"] != "running":
+                continue
+            snap = progress(h["run_id"]) or {}
+            _set_host(r, h, percent=int(snap.get("percent") or 0), phase=snap.get("phase") or "")
+
+
+def _drive(r: Rollout, upgrade: UpgradeFn, progress: ProgressFn,
+           prepare: Optional[PrepareFn] = None) -> None:
+    max_failures = r.opts["max_failures"]
+    try:
+        if prepare is not None:
+            run_events.emit(r.id, "batch", {"batch": -1, "label": "preparing", "hosts": []})
+            try:
+                prepare(r, lambda text: _log(r, text))
+            except Exception as e:
+                _log(r, f"preparation failed (continuing without it): {e}")
+        for b, idxs in enumerate(r.batches):
+            if r.halt_requested and not r.halted:
+                r.halted = "halted by user"
+            if r.halted:
+                break
+            with r.lock:
+                r.batch = b
+            label = "canary" if (b == 0 and r.opts["canary"]) else f"batch {b + 1}/{len(r.batches)}"
+            names = ", ".join(r.hosts[i]["name"] for i in idxs)
+            _log(r, f"{label}: {names}")
+            run_events.emit(r.id, "batch", {"batch": b, "label": label, "hosts": idxs})
+            _run_batch(r, idxs, upgrade, progress)
+            failed = [r.hosts[i]["name"] for i in idxs if r.hosts[i]["status"] == "failed"]
+            with r.lock:
+                r.failures += len(failed)
+            if failed:
+                _log(r, f"{label}: failed on {', '.join(failed)}")
+            if r.failures > max_failures:
+                r.halted = f"{r.failures} host(s) failed (threshold {max_failures})"
+                _log(r, f"halting: {r.halted}")
+        for h in r.hosts:
+            if h["status"] == "queued":
+                _set_host(r, h, status="skipped")
+    finally:
+        with r.lock:
+            r.done = True
+            r.ended_ts = time.time()
+        ok = sum(1 for h in r.hosts if h["status"] == "ok")
+        _log(r, f"=== Rollout finished: {ok}/{len(r.hosts)} upgraded, {r.failures} failed"
+                f"{', ' + r.halted if r.halted else ''} ===")
+        finalize_log(
+            r.id, action="fleet_upgrade", host=f"{len(r.hosts)} hosts",
+            rc=0 if (r.failures == 0 and not r.halted) else 1,
+            start=r.started_ts, end=r.ended_ts, hosts=[h["run_id"] for h in r.hosts],
+        )
+        run_events.emit(r.id, "done", r.snapshot())
+
+
+def start(app, profiles: List[Dict[str, Any]], opts: Dict[str, Any],
+          upgrade: UpgradeFn, progress: ProgressFn, prepare: Optional[PrepareFn] = None) -> Rollout:
+    """Start a rollout in the background; host runs are `<rollout_id>_hNN` in the log archive."""
+    ts = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H-%M-%SZ')
+    rollout_id = f"{ts}_fleet{hex(int(time.time() * 1000))[-4:]}"
+    r = Rollout(rollout_id, profiles, {**opts, "profiles": profiles})
+    _ROLLOUTS[rollout_id] = r
+    run_events.open_journal(rollout_id)
+    index_update(rollout_id, action="fleet_upgrade", host=f"{len(profiles)} hosts", start=r.started_ts)
+    _log(r, f"=== Rolling upgrade of {len(profiles)} hosts: canary={opts['canary']}, "
+            f"max_parallel={opts['max_parallel']}, max_failures={opts['max_failures']}, "
+            f"reboot={opts['reboot']} ===")
+
+    def _bg():
+        with app.app_context():
+            _drive(r, upgrade, progress, prepare)
+
+    threading.Thread(target=_bg, name=f"rollout-{rollout_id}", daemon=True).start()
+    return r
@@ -0,0 +1,130 @@
+# routes/updates/run_events.py
+# Per-run event journal for pushing update progress (SSE) with resume by sequence number.
+
+from __future__ import annotations
+import json
+import threading
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+from routes.common.bounded import BoundedMap
+
+JOURNAL_SIZE = 2000  # events kept per run for resume; older clients get a snapshot
+
+Event = Tuple[int, str, Dict[str, Any]]
+
+
+class RunEvents:
+    """Append-only ring of (seq, name, payload); readers block until something new arrives."""
+
+    def __init__(self, maxlen: int = JOURNAL_SIZE):
+        self.events: Deque[Event] = deque(maxlen=maxlen)
+        self.seq = 0
+        self.closed = False
+        self.cond = threading.Condition()
+
+    def emit(self, name: str, payload: Dict[str, Any]) -> int:
+        with self.cond:
+            self.seq += 1
+            self.events.append((self.seq, name, payload))
+            if name == 'done':
+                self.closed = True
+            self.cond.notify_all()
+            return self.seq
+
+    def since(self, seq: int) -> Tuple[List[Event], bool]:
+        """
+        Events after `seq`, and whether the ring still reaches back that far.
+        A `seq` ahead of the journal (an id from before a restart re-opened it)
+        is not complete either: the reader needs a snapshot.
+        """
+        with self.cond:
+            first = self.events[0][0] if self.events else self.seq + 1
+            complete = first <= seq + 1 and seq <= self.seq
+            return [e for e in self.events if e[0] > seq], complete
+
+    def wait(self, seq: int, timeout: float) -> bool:
+        """Block until an event newer than `seq` exists (or timeout); True if there is one."""
+        with self.cond:
+            if self.seq > seq:
+                return True
+            self.cond.wait(timeout)
+            return self.seq > seq
+
+
+# Journals outlive the run a little so late/reconnecting browsers still catch "done"
+_JOURNALS: BoundedMap = BoundedMap(
+    "updates._JOURNALS", maxsize=50, ttl=3600,
+    can_evict=lambda _rid, j: j.closed,
+)
+
+
+def open_journal(run_id: str) -> RunEvents:
+    j = RunEvents()
+    _JOURNALS[run_id] = j
+    return j
+
+
+def get_journal(run_id: str) -> Optional[RunEvents]:
+    return _JOURNALS.peek(run_id)
+
+
+def emit(run_id: str, name: str, payload: Dict[str, Any]) -> None:
+    j = _JOURNALS.peek(run_id)
+    if j is not None:
+        j.emit(name, payload)
+
+
+def coalesce(events: List[Event]) -> List[Event]:
+    """
+    Merge bursts for the wire: consecutive log events become one 'log' with
+    several lines; only the latest 'overall' and per-package state survive.
+    The merged event carries the highest seq so resume stays exact.
+    """
+    out: List[Event] = []
+    for seq, name, payload in events:
+        if out:
+            pseq, pname, ppay = out[-1]
+            if name == pname == 'log':
+                out[-1] = (seq, 'log', {'lines': ppay['lines'] + payload['lines']})
+                continue
+            if name == pname == 'overall':
+                out[-1] = (seq, 'overall', payload)
+                continue
+            if name == pname == 'package' and ppay.get('name') == payload.get('name'):
+                out[-1] = (seq, 'package', payload)
+                continue
+        out.append((seq, name, payload))
+    return out
+
+
+def sse_event(name: str, obj, seq: int | None = None) -> str:
+    head = f"id: {seq}\n" if seq is not None else ""
+    return f"{head}event: {name}\ndata: {json.dumps(obj, ensure_ascii=False)}\n\n"
+
+
+def stream(journal: RunEvents, snapshot: Callable[[], Optional[Dict[str, Any]]],
+           since: Optional[int], keepalive: float = 15.0) -> Iterator[str]:
+    """
+    SSE body for one run: events after `since`, or a snapshot first when
+    starting fresh, when the missed events fell out of the ring or when
+    `since` is a stale id from an older journal. Ends after 'done'.
+    """
+    seq = since or 0
+    _events, complete = journal.since(seq) if since is not None else ([], False)
+    if not complete:
+        with journal.cond:
+            seq = journal.seq
+            snap = snapshot()
+            if journal.closed:
+                seq -= 1  # replay the final 'done' after the snapshot
+        yield sse_event('snapshot', snap or {}, seq)
+    while True:
+        events, _ = journal.since(seq)
+        for num, name, payload in coalesce(events):
+            yield sse_event(name, payload, num)
+            seq = num
+            if name == 'done':
+                return
+        if not journal.wait(seq, keepalive):
+            yield ": keep-alive\n\n"
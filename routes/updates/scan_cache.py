@@ -0,0 +1,238 @@
+# routes/updates/scan_cache.py
+# Per-host cache of the last upgrade scan (package, candidate, arch, origin) + background refresh.
+
+from __future__ import annotations
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from routes.common.bounded import BoundedMap
+
+# Cached lists older than this are rescanned (by the scheduler or on the next page load)
+ENV_SCAN_INTERVAL = "RPI_MONITOR_SCAN_INTERVAL"
+DEFAULT_SCAN_INTERVAL = 1800
+
+ScanEvents = Iterable[Tuple[str, Dict[str, Any]]]
+
+
+class _Entry:
+    __slots__ = ("host", "ts", "packages", "policies", "lists", "error", "stale", "refreshing", "cond")
+
+    def __init__(self, host: str):
+        self.host = host
+        self.ts: Optional[float] = None
+        self.packages: List[Dict[str, Any]] = []
+        self.policies: Dict[str, Dict[str, Any]] = {}  # name -> apt-cache policy (batch prefetch)
+        self.lists: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.stale = False
+        self.refreshing = False
+        self.cond = threading.Condition()
+
+
+_lock = threading.Lock()
+_CACHE: BoundedMap = BoundedMap(
+    "updates._SCAN_CACHE", maxsize=32,
+    can_evict=lambda _host, e: not e.refreshing,
+)
+_app = None          # set by start_scheduler(); background scans need an app context
+_scan_fn: Optional[Callable[..., ScanEvents]] = None
+_host_fn: Optional[Callable[[], str]] = None
+
+
+def scan_interval() -> int:
+    raw = (os.environ.get(ENV_SCAN_INTERVAL) or "").strip()
+    try:
+        return max(0, int(raw)) if raw else DEFAULT_SCAN_INTERVAL
+    except ValueError:
+        return DEFAULT_SCAN_INTERVAL
+
+
+def _entry(host: str) -> _Entry:
+    with _lock:
+        e = _CACHE.get(host)
+        if e is None:
+            e = _CACHE[host] = _Entry(host)
+        return e
+
+
+def snapshot(host: str) -> Optional[Dict[str, Any]]:
+    """Cached scan for a host (None if never scanned)."""
+    e = _CACHE.peek(host)
+    if e is None:
+        return None
+    with e.cond:
+        return {
+            "host": host,
+            "ts": e.ts,
+            "age": int(time.time() - e.ts) if e.ts else None,
+            "count": len(e.packages),
+            "packages": list(e.packages),
+            "lists": e.lists,
+            "stale": e.stale,
+            "refreshing": e.refreshing,
+            "error": e.error,
+        }
+
+
+def is_fresh(host: str) -> bool:
+    e = _CACHE.peek(host)
+    if e is None or e.ts is None or e.stale:
+        return False
+    return (time.time() - e.ts) < scan_interval()
+
+
+def begin(host: str) -> bool:
+    """Claim the refresh for a host; False if one is already running."""
+    e = _entry(host)
+    with e.cond:
+        if e.refreshing:
+            return False
+        e.refreshing = True
+        return True
+
+
+def wait(host: str, timeout: Optional[float] = None) -> bool:
+    """Block until the running refresh (if any) is over; True if none is left."""
+    e = _CACHE.peek(host)
+    if e is None:
+        return True
+    with e.cond:
+        if e.refreshing:
+            e.cond.wait(timeout)
+        return not e.refreshing
+
+
+def policy(host: str, name: str) -> Optional[Dict[str, Any]]:
+    """Prefetched `apt-cache policy` of an upgradable package, if the last scan got it."""
+    e = _CACHE.peek(host)
+    if e is None:
+        return None
+    return e.policies.get(name)
+
+
+def package(host: str, name: str) -> Optional[Dict[str, Any]]:
+    """A package of the last scan (name, versions, origin, source, cves), if listed."""
+    e = _CACHE.peek(host)
+    if e is None:
+        return None
+    with e.cond:
+        return next((p for p in e.packages if p.get("name") == name), None)
+
+
+def _finish(host: str, packages: Optional[List[Dict[str, Any]]], lists, error: Optional[str],
+            policies: Optional[Dict[str, Dict[str, Any]]] = None) -> None:
+    e = _entry(host)
+    with e.cond:
+        if packages is not None:
+            e.packages = packages
+            e.policies = policies or {}
+            e.ts = time.time()
+            e.stale = False
+        if lists is not None:
+            e.lists = lists
+        e.error = error
+        e.refreshing = False
+        e.cond.notify_all()
+
+
+def record(host: str, scan: Callable[[], ScanEvents]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Run a driver scan and pass its events through while collecting them; the
+    result replaces the cached list on 'done'. The caller must have claimed
+    the refresh via begin().
+    """
+    packages: List[Dict[str, Any]] = []
+    policies: Dict[str, Dict[str, Any]] = {}
+    lists = None
+    finished = False
+    try:
+        for evt, payload in scan():
+            if evt == "pkg":
+                packages.append({
+                    "name": payload.get("name", ""),
+                    "current": payload.get("current", ""),
+                    "candidate": payload.get("candidate", ""),
+                    "arch": payload.get("arch", ""),
+                    "origin": payload.get("origin", ""),
+                    "source": payload.get("source", ""),
+                    "cves": payload.get("cves") or [],
+                })
+            elif evt == "lists":
+                lists = payload
+            elif evt == "policy":
+                policies.update(payload.get("packages") or {})
+            elif evt == "done":
+                _finish(host, packages, lists, None, policies)
+                finished = True
+            elif evt == "error":
+                _finish(host, None, lists, payload.get("message") or "scan failed")
+                finished = True
+            yield evt, payload
+    finally:
+        if not finished:  # aborted (client went away) or raised: keep the old list
+            _finish(host, None, lists, None)
+
+
+def invalidate(host: str) -> None:
+    """Mark a host's list outdated (e.g. after an update run) and rescan in the background."""
+    e = _CACHE.peek(host)
+    if e is None:
+        return
+    with e.cond:
+        e.stale = True
+    refresh_async(host)
+
+
+def invalidate_all() -> None:
+    """invalidate() for every cached host (e.g. after the CVE index was rebuilt)."""
+    for host in _CACHE.keys():
+        invalidate(host)
+
+
+def refresh_async(host: str, refresh: Optional[bool] = None) -> bool:
+    """Rescan in a background thread (active profile only); False if not started."""
+    if _app is None or _scan_fn is None:
+        return False
+    with _app.app_context():
+        if not host or host != _host_fn():
+            return False
+    if not begin(host):
+        return False
+
+    def _bg():
+        try:
+            with _app.app_context():
+                for _ in record(host, lambda: _scan_fn(refresh=refresh)):
+                    pass
+        except Exception as ex:
+            _finish(host, None, None, str(ex))
+
+    threading.Thread(target=_bg, name=f"scan-{host}", daemon=True).start()
+    return True
+
+
+def _scheduler() -> None:
+    while True:
+        interval = scan_interval()
+        time.sleep(max(60, min(interval or 300, 300)))
+        if not interval:
+            continue
+        try:
+            with _app.app_context():
+                host = _host_fn()
+            # Only hosts someone has looked at; a cold cache is filled by the page itself
+            if host and _CACHE.peek(host) is not None and not is_fresh(host):
+                refresh_async(host)
+        except Exception:
+            pass
+
+
+def start_scheduler(app, host_fn: Callable[[], str], scan_fn: Callable[..., ScanEvents]) -> None:
+    """Remember how to scan and start the periodic refresh (once per process)."""
+    global _app, _host_fn, _scan_fn
+    first = _app is None
+    _app, _host_fn, _scan_fn = app, host_fn, scan_fn
+    if first:
+        threading.Thread(target=_scheduler, name="scan-scheduler", daemon=True).start()
@@ -2,19 +2,27 @@
 # Main updates blueprint using OS-specific drivers.
 
 from __future__ import annotations
-import json
+import re
 import shlex
 import os
-import re
+import tempfile
 import threading
 import time
 from datetime import datetime, timezone
-from typing import Dict, Any, List
-from flask import render_template, request, jsonify, Response, stream_with_context, send_file, make_response
-
-from routes.settings import _get_active_ssh_settings, _is_configured, test_ssh_connection
-from routes.common.ssh_utils import ssh_connect, ssh_exec
-from routes.common.fs import append_log, make_log_path, list_logs, read_log, delete_log
+from typing import Dict, Any, Optional
+from flask import render_template, request, jsonify, Response, stream_with_context, current_app
+
+from routes.settings import _get_active_ssh_settings, _is_configured, test_ssh_connection, profiles_data
+from routes.common.ssh_utils import ssh_connect, ssh_exec, ssh_stream
+from routes.common.fs import (
+    append_log, finalize_log, tail_lines, list_logs, delete_log, save_run_state, load_run_state,
+    index_update, index_get, iter_log_chunks, log_exists, add_log_hook,
+)
+from routes.common.bounded import BoundedMap
+from routes.common import log_search
+from routes.common import cve_index, pkg_inventory
+from routes.common.singleflight import SingleFlight
+from . import apt_progress, deb_cache, durations, fleet, install_queue, remote_job, rollout, run_events, scan_cache
 
 # Drivers now live under routes/drivers
 from routes.drivers.os_debian import DebianDriver  # type: ignore
@@ -43,6 +51,21 @@ def _get_driver():
     return DebianDriver()
 
 
+def _active_host() -> str:
+    try:
+        return (_get_active_ssh_settings() or {}).get("pi_host", "") or ""
+    except Exception:
+        return ""
+
+
+def _scan(refresh: Optional[bool] = None):
+    return _get_driver().stream_scan(refresh=refresh)
+
+
+# Background rescans of the cached upgrade list (see scan_cache)
+updates_bp.record_once(lambda st: scan_cache.start_scheduler(st.app, _active_host, _scan))
+
+
 # ---------------------------------------------------------------------
 # Actions (APT/Flatpak/Snap)
 # ---------------------------------------------------------------------
@@ -58,6 +81,8 @@ _ACTIONS = {
     "snap_list":         "sudo snap refresh --list",
     "snap_refresh":      "sudo snap refresh",
     "docker_ps":         'docker ps --format "{{.Names}}\t{{.Image}}\t{{.Status}}" || true',
+    # Download-only, at idle CPU/IO priority; the real upgrade then just unpacks and configures
+    "apt_prefetch":      "sudo DEBIAN_FRONTEND=noninteractive nice -n 19 ionice -c3 apt-get -d -y -o Dpkg::Use-Pty=0 dist-upgrade",
     "full_noob_update": (
         "sudo DEBIAN_FRONTEND=noninteractive apt update && "
         "sudo DEBIAN_FRONTEND=noninteractive apt full-upgrade -y && "
@@ -70,7 +95,15 @@ _ACTIONS = {
 }
 
 # Handlinger hvor sudo oftest kræves
-_NEED_SUDO = {"apt_update", "apt_upgrade", "apt_full_upgrade", "snap_refresh", "full_noob_update"}
+_NEED_SUDO = {"apt_update", "apt_upgrade", "apt_full_upgrade", "snap_refresh", "full_noob_update", "apt_prefetch"}
+
+# Runs that leave the installed packages as they were (no rescan afterwards)
+_READ_ONLY = {"apt_list", "apt_dry_full", "apt_prefetch", "deb_seed", "flatpak_dry", "snap_list", "docker_ps", "reboot_required"}
+
+# Runs that take apt's locks; they wait for a background prefetch of the same host
+_APT_LOCKING = {"apt_update", "apt_upgrade", "apt_full_upgrade", "full_noob_update"}
+# Runs that install the scan's pending packages (used for the ETA)
+_UPGRADES = {"apt_upgrade", "apt_full_upgrade", "full_noob_update", "fleet_upgrade"}
 
 
 def _force_english(cmd: str) -> str:
@@ -160,27 +193,82 @@ def updates_os_info():
 # ---------------------------------------------------------------------
 # Non-stream list (compat)
 # ---------------------------------------------------------------------
+def _refresh_arg() -> Optional[bool]:
+    """?refresh=1 forces an index refresh, ?refresh=0 skips it; absent = by lists age."""
+    raw = (request.args.get("refresh") or "").strip().lower()
+    if not raw:
+        return None
+    return raw in ("1", "true", "yes")
+
+
+def _list_item(p: Dict[str, Any]) -> Dict[str, Any]:
+    cves = p.get("cves") or []   # matched by the scan against the offline CVE index
+    return {
+        "name": p.get("name", ""),
+        "current": p.get("current", ""),
+        "candidate": p.get("candidate", ""),
+        "arch": p.get("arch", ""),
+        "origin": p.get("origin", ""),
+        "repo": "",
+        "security": fleet.is_security(p),
+        "summary": "",
+        "cves": cves,
+        "links": {"changelog": ""}
+    }
+
+
+def _cached_payload(snap: Dict[str, Any], refreshing: bool) -> Dict[str, Any]:
+    return {
+        "ts": snap.get("ts"), "age": snap.get("age"), "count": snap.get("count", 0),
+        "packages": snap.get("packages") or [], "lists": snap.get("lists"),
+        "refreshing": refreshing,
+    }
+
+
 @updates_bp.get("/updates/list")
 def updates_list():
+    """Cached list when there is one (a stale one is rescanned in the background); else scan now."""
     try:
-        drv = _get_driver()
+        host = _active_host()
+        refresh = _refresh_arg()
+        snap = scan_cache.snapshot(host)
+        if refresh is None and snap and snap.get("ts"):
+            if not scan_cache.is_fresh(host):
+                scan_cache.refresh_async(host)
+            refreshing = bool(scan_cache.snapshot(host).get("refreshing"))
+            return jsonify({
+                "ok": True, "cached": True, "count": snap["count"],
+                "updates": [_list_item(p) for p in snap["packages"]],
+                "lists": snap.get("lists"), "ts": snap["ts"], "age": snap["age"],
+                "refreshing": refreshing,
+            })
+
+        if not scan_cache.begin(host):
+            scan_cache.wait(host, 900)  # another scan of this host is running: use its result
+            snap = scan_cache.snapshot(host) or {}
+            if snap.get("error") and not snap.get("ts"):
+                return jsonify({"ok": False, "error": snap["error"]}), 500
+            return jsonify({
+                "ok": True, "cached": True, "count": snap.get("count", 0),
+                "updates": [_list_item(p) for p in snap.get("packages") or []],
+                "lists": snap.get("lists"), "ts": snap.get("ts"), "age": snap.get("age"),
+                "refreshing": False,
+            })
+
         updates = []
         total = 0
-        for evt, payload in drv.stream_scan():
+        lists = None
+        for evt, payload in scan_cache.record(host, lambda: _scan(refresh=refresh)):
             if evt == "pkg":
-                updates.append({
-                    "name": payload.get("name", ""),
-                    "current": "",
-                    "candidate": payload.get("candidate", ""),
-                    "repo": "",
-                    "security": False,
-                    "summary": "",
-                    "cves": [],
-                    "links": {"changelog": ""}
-                })
+                updates.append(_list_item(payload))
+            elif evt == "lists":
+                lists = payload
             elif evt == "done":
                 total = payload.get("count", len(updates))
-        return jsonify({"ok": True, "count": total, "updates": updates})
+            elif evt == "error":
+                return jsonify({"ok": False, "error": payload.get("message", "scan failed")}), 500
+        return jsonify({"ok": True, "cached": False, "count": total, "updates": updates,
+                        "lists": lists, "ts": time.time(), "age": 0, "refreshing": False})
     except Exception as e:
         return jsonify({"ok": False, "error": str(e)}), 500
 
@@ -188,27 +276,100 @@ def updates_list():
 # ---------------------------------------------------------------------
 # Streaming scan (SSE)
 # ---------------------------------------------------------------------
-def _sse_event(name: str, obj) -> str:
-    return f"event: {name}\ndata: {json.dumps(obj, ensure_ascii=False)}\n\n"
+_sse_event = run_events.sse_event
+
+
+_SSE_HEADERS = {
+    "Content-Type": "text/event-stream",
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+    "Connection": "keep-alive",
+}
 
 
 @updates_bp.get("/updates/scan/stream")
 def updates_scan_stream():
+    """
+    Cached list first ('cached'); then, unless it is fresh, a live scan whose
+    events replace it. A scan already running for the host is joined, not repeated.
+    """
+    refresh = _refresh_arg()
+    host = _active_host()
+
     def _gen():
         try:
-            drv = _get_driver()
-            for evt, payload in drv.stream_scan():
-                yield _sse_event(evt, payload)
+            snap = scan_cache.snapshot(host)
+            live = refresh is not None or not scan_cache.is_fresh(host)
+            if snap and snap.get("ts"):
+                yield _sse_event("cached", _cached_payload(snap, live))
+                if not live:
+                    yield _sse_event("done", {"count": snap["count"], "cached": True})
+                    return
+            if scan_cache.begin(host):
+                for evt, payload in scan_cache.record(host, lambda: _scan(refresh=refresh)):
+                    yield _sse_event(evt, payload)
+                return
+            yield _sse_event("status", {"stage": "shared_scan"})
+            while not scan_cache.wait(host, 15):
+                yield ": keep-alive\n\n"
+            snap = scan_cache.snapshot(host) or {}
+            if snap.get("error") and not snap.get("ts"):
+                yield _sse_event("error", {"message": snap["error"]})
+                return
+            yield _sse_event("cached", _cached_payload(snap, False))
+            yield _sse_event("done", {"count": snap.get("count", 0), "cached": True})
         except Exception as e:
             yield _sse_event("error", {"message": str(e)})
 
-    headers = {
-        "Content-Type": "text/event-stream",
-        "Cache-Control": "no-cache",
-        "X-Accel-Buffering": "no",
-        "Connection": "keep-alive",
-    }
-    return Response(stream_with_context(_gen()), headers=headers)
+    return Response(stream_with_context(_gen()), headers=_SSE_HEADERS)
+
+
+# ---------------------------------------------------------------------
+# Fleet: pending updates across profiles
+# ---------------------------------------------------------------------
+def _int_arg(name: str, lo: int, hi: int) -> Optional[int]:
+    try:
+        return max(lo, min(hi, int(request.args.get(name))))
+    except (TypeError, ValueError):
+        return None
+
+
+@updates_bp.get("/updates/fleet")
+def updates_fleet():
+    """
+    Scan the selected profiles (?profiles=id1,id2; default: all configured)
+    concurrently. SSE: one 'row' per host as it completes, then 'done' with
+    the hosts x packages matrix. ?format=json returns just the matrix.
+    """
+    wanted = {p for p in (request.args.get("profiles") or "").split(",") if p}
+    profiles = [
+        p for p in profiles_data.get_all_profiles().get("profiles", [])
+        if (not wanted or p.get("id") in wanted) and _is_configured(fleet.profile_settings(p))
+    ]
+    if not profiles:
+        return jsonify({"ok": False, "error": "No configured profiles selected"}), 400
+
+    app = current_app._get_current_object()
+    rows_iter = fleet.run(
+        app, profiles, refresh=_refresh_arg(),
+        workers=_int_arg("workers", 1, 32), deadline=_int_arg("deadline", 5, 3600),
+    )
+
+    if request.args.get("format") == "json":
+        return jsonify({"ok": True, **fleet.matrix(list(rows_iter))})
+
+    def _gen():
+        yield _sse_event("hosts", {"hosts": [
+            {"id": p.get("id"), "name": p.get("name") or p.get("pi_host"), "host": p.get("pi_host")}
+            for p in profiles
+        ]})
+        rows = []
+        for row in rows_iter:
+            rows.append(row)
+            yield _sse_event("row", row)
+        yield _sse_event("done", fleet.matrix(rows))
+
+    return Response(stream_with_context(_gen()), headers=_SSE_HEADERS)
 
 
 # ---------------------------------------------------------------------
@@ -218,7 +379,13 @@ def updates_scan_stream():
 def updates_pkg_detail(name: str):
     try:
         drv = _get_driver()
-        data = drv.pkg_detail(name)
+        host = _active_host()
+        data = drv.pkg_detail(name, policy=scan_cache.policy(host, name))
+        listed = scan_cache.package(host, name) or {}
+        if data.get("ok") and listed.get("cves"):
+            # Offline index first (authoritative per release), then changelog mentions
+            data["cves"] = list(dict.fromkeys(listed["cves"] + (data.get("cves") or [])))
+            data["security"] = True
         status = 200 if data.get("ok") else 500
         return jsonify(data), status
     except Exception as e:
@@ -228,29 +395,31 @@ def updates_pkg_detail(name: str):
 # ---------------------------------------------------------------------
 # Update runs: state, progress, logs (async)
 # ---------------------------------------------------------------------
-_RUNS: Dict[str, Dict[str, Any]] = {}
-_RUNS_LOCK = threading.Lock()
-
-_RX_DOWNLOAD = re.compile(r"^Get:\d+\s+.*\s([a-z0-9\-\+\.]+)\s.*\[(\d+(?:\.\d+)?\s*(?:kB|MB))\]", re.IGNORECASE)
-_RX_UNPACK = re.compile(r"^Unpacking\s+([a-z0-9\-\+\.]+)\s", re.IGNORECASE)
-_RX_SETUP = re.compile(r"^Setting up\s+([a-z0-9\-\+\.]+)\s", re.IGNORECASE)
-_RX_TRIGGERS = re.compile(r"^Processing triggers for\s+([a-z0-9\-\+\.]+)\s", re.IGNORECASE)
+def _persist_evicted_run(run_id: str, state: Dict[str, Any], _reason: str) -> None:
+    """Keep finished runs inspectable after they leave memory."""
+    try:
+        save_run_state(run_id, state)
+    except Exception:
+        pass
 
-PHASE_WEIGHTS = {
-    'Download': 25,
-    'Unpacking': 35,
-    'Setting up': 35,
-    'Triggers': 5,
-}
 
+# Running runs are never evicted; finished ones go to disk before they are dropped
+_RUNS: BoundedMap = BoundedMap(
+    "updates._RUNS", maxsize=50, ttl=6 * 3600,
+    can_evict=lambda _rid, st: bool(st.get('done')),
+    on_evict=_persist_evicted_run,
+)
+_RUNS_LOCK = threading.Lock()
 
-def _new_run() -> str:
-    ts = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H-%M-%SZ')
-    short = hex(int(time.time()*1000))[-6:]
-    run_id = f"{ts}_{short}"
+def _new_run(action: str | None = None, host: str = '', run_id: str | None = None) -> str:
+    if not run_id:
+        ts = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H-%M-%SZ')
+        short = hex(int(time.time()*1000))[-6:]
+        run_id = f"{ts}_{short}"
+    started = time.time()
     with _RUNS_LOCK:
         _RUNS[run_id] = {
-            'started_ts': time.time(),
+            'started_ts': started,
             'updated_ts': None,
             'ended_ts': None,
             'overall': {'percent': 0, 'phase': 'Starting'},
@@ -260,67 +429,82 @@ def _new_run() -> str:
             'done': False,
             'exit_code': None,
             'error': None,
-            'action': None,
+            'action': action,
+            'host': host,
         }
+    run_events.open_journal(run_id)
+    index_update(run_id, action=action, host=host, start=started)
     append_log(run_id, f"=== Update run {run_id} started {datetime.utcnow().isoformat()}Z ===\n")
     return run_id
 
 
-def _pkg_progress_entry(name: str) -> Dict[str, Any]:
-    return {'name': name, 'version': '', 'phase': 'Queued', 'percent': 0}
-
-
-def _recompute_overall(state: Dict[str, Any]) -> None:
-    pkgs = list(state['packages'].values())
-    if not pkgs:
-        state['overall'] = {'percent': state['overall'].get('percent', 0), 'phase': state['overall'].get('phase', 'Idle')}
-        return
-    p = sum(max(0, min(100, x.get('percent', 0))) for x in pkgs) / max(1, len(pkgs))
-    phase = 'Done' if p >= 100 else (state['overall'].get('phase') or 'Installing')
-    state['overall'] = {'percent': int(p), 'phase': phase}
-
-
-def _apply_line_to_state(state: Dict[str, Any], line: str) -> None:
+def _end_run(run_id: str, state: Dict[str, Any]) -> None:
+    """Close the run log and record the run in the archive index (then gzip it)."""
+    finalize_log(
+        run_id,
+        action=state.get('action'),
+        host=state.get('host'),
+        rc=state.get('exit_code'),
+        start=state.get('started_ts'),
+        end=state.get('ended_ts') or time.time(),
+        packages=len(state.get('packages') or {}),
+    )
+    if state.get('exit_code') == 0:
+        durations.commit(state)
+    final = _progress_snapshot(run_id, state)
+    final.pop('last_lines', None)
+    run_events.emit(run_id, 'done', final)
+    # Whatever the run did, the cached upgrade list no longer reflects it
+    if state.get('action') not in _READ_ONLY:
+        scan_cache.invalidate(state.get('host') or '')
+
+
+def _journal_log_line(run_id: str, _line_no: int, line: str) -> None:
+    run_events.emit(run_id, 'log', {'lines': [line]})
+
+
+# Every line a run writes to its log also goes to its event journal (if it has one)
+add_log_hook("line", _journal_log_line)
+
+
+def _emit_progress(run_id: str, state: Dict[str, Any], name: str) -> None:
+    pkg = state['packages'].get(name) if name else None
+    if pkg:
+        run_events.emit(run_id, 'package', {
+            'name': name, 'version': pkg.get('version', ''),
+            'phase': pkg.get('phase', ''), 'percent': int(pkg.get('percent', 0)),
+        })
+    overall = state.get('overall') or {}
+    run_events.emit(run_id, 'overall', {
+        'percent': int(overall.get('percent', 0) or 0), 'phase': overall.get('phase', 'Idle'),
+        'download_percent': overall.get('download_percent'),
+        'download_bytes': overall.get('download_bytes'),
+        'download_total': overall.get('download_total'),
+        'eta': overall.get('eta'),
+    })
+
+
+def _apply_line_to_state(state: Dict[str, Any], line: str) -> str | None:
+    """Update progress from one stdout line; returns the package touched ('' = overall only)."""
     line = (line or '').rstrip('\n')
     if not line:
-        return
+        return None
     # Mark state as updated on every processed line
     state['updated_ts'] = time.time()
-    m = _RX_DOWNLOAD.search(line)
-    if m:
-        name = m.group(1)
-        pkg = state['packages'].setdefault(name, _pkg_progress_entry(name))
-        pkg['phase'] = 'Downloading'
-        pkg['percent'] = max(int(pkg.get('percent', 0)), PHASE_WEIGHTS['Download'])
-        _recompute_overall(state)
-        return
-    m = _RX_UNPACK.search(line)
-    if m:
-        name = m.group(1)
-        pkg = state['packages'].setdefault(name, _pkg_progress_entry(name))
-        pkg['phase'] = 'Unpacking'
-        base = PHASE_WEIGHTS['Download']
-        pkg['percent'] = max(int(pkg.get('percent', 0)), base + PHASE_WEIGHTS['Unpacking'])
-        _recompute_overall(state)
-        return
-    m = _RX_SETUP.search(line)
-    if m:
-        name = m.group(1)
-        pkg = state['packages'].setdefault(name, _pkg_progress_entry(name))
-        pkg['phase'] = 'Setting up'
-        base = PHASE_WEIGHTS['Download'] + PHASE_WEIGHTS['Unpacking']
-        pkg['percent'] = max(int(pkg.get('percent', 0)), base + PHASE_WEIGHTS['Setting up'])
-        _recompute_overall(state)
-        return
-    m = _RX_TRIGGERS.search(line)
-    if m:
-        name = m.group(1)
-        pkg = state['packages'].setdefault(name, _pkg_progress_entry(name))
-        pkg['phase'] = 'Triggers'
-        base = PHASE_WEIGHTS['Download'] + PHASE_WEIGHTS['Unpacking'] + PHASE_WEIGHTS['Setting up']
-        pkg['percent'] = max(int(pkg.get('percent', 0)), min(100, base + PHASE_WEIGHTS['Triggers']))
-        _recompute_overall(state)
-        return
+    return _time_package(state, apt_progress.apply_text(state, line))
+
+
+def _apply_status_record(state: Dict[str, Any], rec) -> str | None:
+    state['updated_ts'] = time.time()
+    return _time_package(state, apt_progress.apply_status(state, rec))
+
+
+def _time_package(state: Dict[str, Any], name: str | None) -> str | None:
+    """Per-package timings for the history; overall percent/ETA from that history."""
+    if name is not None:
+        durations.observe(state, name)
+        durations.weigh(state, state.get('expected') or (), name=name)
+    return name
 
 
 def _finish_state(state: Dict[str, Any], exit_code: int) -> None:
@@ -328,43 +512,71 @@ def _finish_state(state: Dict[str, Any], exit_code: int) -> None:
         for pkg in state['packages'].values():
             pkg['percent'] = 100
             pkg['phase'] = 'Done'
-        state['overall'] = {'percent': 100, 'phase': 'Done'}
+        apt_progress.reset_sum(state)
+        overall = {'percent': 100, 'phase': 'Done'}
     else:
-        state['overall'] = {'percent': int(state['overall'].get('percent', 0)), 'phase': 'Failed'}
+        overall = {'percent': int(state['overall'].get('percent', 0)), 'phase': 'Failed'}
+    # Byte counts stay visible after the run
+    for k in ('download_bytes', 'download_total'):
+        if k in state['overall']:
+            overall[k] = state['overall'][k]
+    state['overall'] = overall
     state['done'] = True
     state['exit_code'] = int(exit_code or 0)
     state['ended_ts'] = time.time()
     state['updated_ts'] = state.get('ended_ts')
 
 
+def _active_run(host: str, action: str) -> str | None:
+    for rid, st in _RUNS.items():
+        if st.get('action') == action and st.get('host') == host and not st.get('done'):
+            return rid
+    return None
+
+
+def _wait_for_prefetch(host: str, run_id: str, state: Dict[str, Any], timeout: float = 1800) -> None:
+    """Let a running background download finish first (it holds apt's archive lock)."""
+    rid = _active_run(host, 'apt_prefetch')
+    if not rid:
+        return
+    append_log(run_id, f"Waiting for background download {rid} to finish...\n")
+    state['overall'] = {'percent': 0, 'phase': 'Waiting for download'}
+    _emit_progress(run_id, state, '')
+    j = run_events.get_journal(rid)
+    deadline = time.time() + timeout
+    while _active_run(host, 'apt_prefetch') == rid and time.time() < deadline:
+        if j is not None:
+            j.wait(j.seq, 5)
+        else:
+            time.sleep(2)
+
+
+def _line_handlers(run_id: str, state: Dict[str, Any]):
+    """(on_stdout, on_stderr) that log a run's output and feed its progress state."""
+    def _on_stdout(line: str) -> None:
+        append_log(run_id, line)
+        name = _apply_line_to_state(state, line)
+        if name is not None:
+            _emit_progress(run_id, state, name)
+
+    def _on_stderr(line: str) -> None:
+        # apt status records (APT::Status-Fd) arrive here; everything else is log text
+        rec = apt_progress.parse_status(line)
+        if rec is None:
+            append_log(run_id, line)
+            return
+        name = _apply_status_record(state, rec)
+        if name is not None:
+            _emit_progress(run_id, state, name)
+
+    return _on_stdout, _on_stderr
+
+
 def _run_streaming(ssh, cmd: str, run_id: str, state: Dict[str, Any]) -> int:
+    _on_stdout, _on_stderr = _line_handlers(run_id, state)
     try:
         run_cmd = f"sh -lc {shlex.quote(cmd)}"
-        stdin, stdout, stderr = ssh.exec_command(run_cmd, timeout=3600, get_pty=False)
-        exit_code = None
-        while True:
-            line = stdout.readline()
-            if line:
-                append_log(run_id, line)
-                _apply_line_to_state(state, line)
-            else:
-                if stdout.channel.exit_status_ready():
-                    exit_code = stdout.channel.recv_exit_status()
-                    break
-                if stderr.channel.recv_ready():
-                    try:
-                        err_chunk = stderr.read(4096).decode(errors='replace')
-                        if err_chunk:
-                            append_log(run_id, err_chunk)
-                    except Exception:
-                        pass
-                time.sleep(0.1)
-        try:
-            rem = stderr.read().decode(errors='replace')
-            if rem:
-                append_log(run_id, rem)
-        except Exception:
-            pass
+        exit_code = ssh_stream(ssh, run_cmd, on_stdout=_on_stdout, on_stderr=_on_stderr, timeout=3600)
         state['exit_code'] = exit_code
         return int(exit_code or 0)
     except Exception as e:
@@ -374,6 +586,122 @@ def _run_streaming(ssh, cmd: str, run_id: str, state: Dict[str, Any]) -> int:
         return 255
 
 
+def _run_job(ssh, s: Dict[str, Any], cmd: str, run_id: str, state: Dict[str, Any]) -> int:
+    """
+    Run a long command detached on the host and follow its output files, so
+    no channel stays open for the whole run and a restart can reattach.
+    Falls back to streaming when detaching is disabled or fails.
+    """
+    host = s.get('pi_host', '')
+    state['host_class'] = durations.host_class(ssh, host)
+    if 'expected' not in state and state.get('action') in _UPGRADES:
+        # Packages the last scan saw pending: the ETA covers those not reached yet too
+        state['expected'] = [p['name'] for p in (scan_cache.snapshot(host) or {}).get('packages', [])]
+    if not remote_job.enabled():
+        return _run_streaming(ssh, cmd, run_id, state)
+    try:
+        meta = remote_job.launch(ssh, run_id, cmd)
+    except Exception as e:
+        append_log(run_id, f"[warn] could not start a detached job ({e}); streaming instead\n")
+        return _run_streaming(ssh, cmd, run_id, state)
+    state['job'] = {**meta, 'host': s.get('pi_host', ''), 'user': s.get('pi_user', '')}
+    index_update(run_id, job=True)
+    return _follow_job(s, run_id, state, ssh=ssh)
+
+
+def _follow_job(s: Dict[str, Any], run_id: str, state: Dict[str, Any], ssh=None) -> int:
+    on_stdout, on_stderr = _line_handlers(run_id, state)
+    saved = [0.0]
+
+    def _on_poll(_meta: Dict[str, Any]) -> None:
+        # Offsets + progress on disk every few seconds: what a restarted monitor resumes from
+        if time.time() - saved[0] >= 5:
+            saved[0] = time.time()
+            try:
+                save_run_state(run_id, state)
+            except Exception:
+                pass
+
+    _on_poll(state['job'])
+    try:
+        rc = remote_job.follow(lambda: _connect(s), state['job'], on_stdout, on_stderr, _on_poll, ssh=ssh)
+    except Exception as e:
+        state['error'] = str(e)
+        append_log(run_id, f"[error] {e}\n")
+        rc = 255
+    else:
+        try:
+            cleanup_ssh = ssh or _connect(s)
+            remote_job.cleanup(cleanup_ssh, state['job'])
+            if cleanup_ssh is not ssh:
+                cleanup_ssh.close()
+        except Exception:
+            pass
+    state['exit_code'] = rc
+    return rc
+
+
+def _settings_for(host: str, user: str) -> Dict[str, Any] | None:
+    """SSH settings for host/user: the active profile, else a matching saved one."""
+    s = _get_active_ssh_settings()
+    if s.get('pi_host') == host and s.get('pi_user') == user and _is_configured(s):
+        return s
+    for p in profiles_data.get_all_profiles().get('profiles', []):
+        ps = fleet.profile_settings(p)
+        if ps['pi_host'] == host and ps['pi_user'] == user and _is_configured(ps):
+            return ps
+    return None
+
+
+def _reattach_jobs(app) -> None:
+    """After a restart: pick up detached runs that were still being followed."""
+    def _bg():
+        with app.app_context():
+            for entry in list_logs():
+                if not entry.get('job') or entry.get('end'):
+                    continue
+                run_id = entry['id']
+                state = load_run_state(run_id)
+                if not state or state.get('done') or not state.get('job'):
+                    continue
+                job = state['job']
+                s = _settings_for(job.get('host', ''), job.get('user', ''))
+                _RUNS[run_id] = state
+                run_events.open_journal(run_id)
+                if s is None:
+                    state['error'] = f"no saved SSH settings for {job.get('user')}@{job.get('host')}"
+                    append_log(run_id, f"[error] cannot reattach: {state['error']}\n")
+                    _finish_state(state, 255)
+                    _end_run(run_id, state)
+                    continue
+                append_log(run_id, f"\n=== Monitor restarted; reattached to detached job (pid {job.get('pid')}) ===\n")
+                threading.Thread(target=_finish_reattached, args=(app, s, run_id, state),
+                                 name=f"upd-{run_id}", daemon=True).start()
+
+    threading.Thread(target=_bg, name="upd-reattach", daemon=True).start()
+
+
+def _finish_reattached(app, s: Dict[str, Any], run_id: str, state: Dict[str, Any]) -> None:
+    with app.app_context():
+        try:
+            exit_code = _follow_job(s, run_id, state)
+            # Steps an action runs after its main command are not repeated here
+            try:
+                ssh = _connect(s, timeout=15)
+                _rc, out3, _ = ssh_exec(ssh, 'test -f /run/reboot-required && echo REBOOT_REQUIRED || echo NO_REBOOT', timeout=15, shell=True)
+                state['requires_reboot'] = 'REBOOT_REQUIRED' in (out3 or '')
+                ssh.close()
+            except Exception:
+                pass
+            _finish_state(state, exit_code)
+            append_log(run_id, f"\n=== Update run completed (rc={state.get('exit_code')}) ===\n")
+        finally:
+            _end_run(run_id, state)
+
+
+updates_bp.record_once(lambda st: _reattach_jobs(st.app))
+
+
 @updates_bp.post("/updates/run")
 def updates_run_async():
     """Start an update run asynchronously and return a run_id."""
@@ -404,14 +732,20 @@ def updates_run_async():
                 pass
             return jsonify({"ok": True, "rc": rc, "stdout": out, "stderr": err})
 
-        run_id = _new_run()
-        with _RUNS_LOCK:
-            _RUNS[run_id]['action'] = action
+        host = s.get("pi_host", "")
+        if action == 'apt_prefetch':
+            running = _active_run(host, 'apt_prefetch')
+            if running:
+                return jsonify({"ok": True, "run_id": running, "action": action, "reused": True})
+
+        run_id = _new_run(action, host)
 
         def _bg():
             with _RUNS_LOCK:
                 state = _RUNS.get(run_id) or {}
             append_log(run_id, f"Action: {action}\n")
+            if action in _APT_LOCKING:
+                _wait_for_prefetch(host, run_id, state)
             try:
                 ssh = ssh_connect(
                     host=s["pi_host"], user=s["pi_user"],
@@ -423,6 +757,7 @@ def updates_run_async():
                 state['error'] = str(e)
                 append_log(run_id, f"[error] SSH connect failed: {e}\n")
                 _finish_state(state, 255)
+                _end_run(run_id, state)
                 return
 
             try:
@@ -440,7 +775,7 @@ def updates_run_async():
                         append_log(run_id, erru if not sudo_password else erru.replace(sudo_password, '******'))
 
                     # Then, stream the full-upgrade for progress parsing
-                    apt_cmd = (
+                    apt_cmd = apt_progress.with_status_fd(
                         "sudo DEBIAN_FRONTEND=noninteractive apt-get -y "
                         "-o Dpkg::Use-Pty=0 -o Dpkg::Progress-Fancy=0 full-upgrade"
                     )
@@ -448,7 +783,7 @@ def updates_run_async():
                         apt_cmd = _wrap_with_password(apt_cmd, sudo_password)
                     else:
                         apt_cmd = _force_english(apt_cmd)
-                    _run_streaming(ssh, apt_cmd, run_id, state)
+                    _run_job(ssh, s, apt_cmd, run_id, state)
 
                     chain = (
                         "sudo apt-get autoremove --purge -y && "
@@ -467,8 +802,10 @@ def updates_run_async():
                         append_log(run_id, err2 if not sudo_password else err2.replace(sudo_password, '******'))
                     exit_code = 0 if (_RUNS.get(run_id, {}).get('exit_code') in (None, 0) and rc2 == 0) else (_RUNS.get(run_id, {}).get('exit_code') or 0)
                 else:
-                    cmd = _wrap_with_password(base_cmd, sudo_password) if (action in _NEED_SUDO and sudo_password) else _force_english(base_cmd)
-                    exit_code = _run_streaming(ssh, cmd, run_id, state)
+                    # Status records must be requested before the password wrapper quotes anything
+                    apt_cmd = apt_progress.with_status_fd(base_cmd)
+                    cmd = _wrap_with_password(apt_cmd, sudo_password) if (action in _NEED_SUDO and sudo_password) else _force_english(apt_cmd)
+                    exit_code = _run_job(ssh, s, cmd, run_id, state)
 
                 try:
                     rc3, out3, _ = ssh_exec(ssh, 'test -f /run/reboot-required && echo REBOOT_REQUIRED || echo NO_REBOOT', timeout=15, shell=True)
@@ -483,6 +820,7 @@ def updates_run_async():
                     ssh.close()
                 except Exception:
                     pass
+                _end_run(run_id, state)
 
         threading.Thread(target=_bg, name=f"upd-{run_id}", daemon=True).start()
         return jsonify({"ok": True, "run_id": run_id, "action": action})
@@ -490,49 +828,31 @@ def updates_run_async():
         return jsonify({"ok": False, "error": str(e)}), 500
 
 
-@updates_bp.get('/updates/progress/<run_id>')
-def updates_progress(run_id: str):
-    def _tail_lines(path: str, max_lines: int = 50) -> List[str]:
-        try:
-            with open(path, "rb") as f:
-                f.seek(0, os.SEEK_END)
-                size = f.tell()
-                block = 4096
-                data = b""
-                while size > 0 and data.count(b"\n") <= max_lines:
-                    read_size = block if size >= block else size
-                    size -= read_size
-                    f.seek(size)
-                    data = f.read(read_size) + data
-                text = data.decode("utf-8", errors="replace")
-                lines = text.splitlines()[-max_lines:]
-                return lines
-        except Exception:
-            return []
-
-    state = _RUNS.get(run_id)
+def _progress_snapshot(run_id: str, state: Dict[str, Any] | None = None) -> Dict[str, Any] | None:
+    """Full progress view of a run (live, persisted or archived); None if unknown."""
+    state = state or _RUNS.get(run_id) or load_run_state(run_id)
     if not state:
-        items = list_logs()
-        if any(x.get('id') == run_id for x in items):
-            txt = read_log(run_id)
-            return jsonify({
+        entry = index_get(run_id)
+        if entry or log_exists(run_id):
+            entry = entry or {}
+            return {
                 'overall': {'percent': 100, 'phase': 'Done'},
                 'packages': [],
                 'active_iface': '',
                 'requires_reboot': False,
                 'done': True,
-                'size': len(txt),
+                'size': entry.get('size') or 0,
                 # New compact fields for async UI consumers
                 'percent': 100,
                 'phase': 'Done',
                 'status': 'done',
-                'rc': 0,
+                'rc': int(entry.get('rc') or 0),
                 'run_id': run_id,
-                'started_at': None,
-                'updated_at': None,
-                'last_lines': _tail_lines(make_log_path(run_id), 50),
-            })
-        return jsonify({'error': 'unknown run_id'}), 404
+                'started_at': entry.get('start'),
+                'updated_at': entry.get('end'),
+                'last_lines': tail_lines(run_id, 50),
+            }
+        return None
     pkgs = [
         {'name': k, 'version': v.get('version', ''), 'phase': v.get('phase', ''), 'percent': int(v.get('percent', 0))}
         for k, v in state.get('packages', {}).items()
@@ -560,34 +880,384 @@ def updates_progress(run_id: str):
         'run_id': run_id,
         'started_at': started_ts,
         'updated_at': ended_ts or updated_ts,
-        'last_lines': _tail_lines(make_log_path(run_id), 50),
+        'last_lines': tail_lines(run_id, 50),
     }
+    if state.get('result') is not None:
+        payload['result'] = state['result']
+    return payload
+
+
+@updates_bp.get('/updates/progress/<run_id>')
+def updates_progress(run_id: str):
+    payload = _progress_snapshot(run_id)
+    if payload is None:
+        return jsonify({'error': 'unknown run_id'}), 404
     return jsonify(payload)
 
 
+@updates_bp.get('/updates/progress/<run_id>/stream')
+def updates_progress_stream(run_id: str):
+    """Push progress for one run as SSE instead of polling /updates/progress.
+
+    Events: snapshot (full view, same shape as /updates/progress), package,
+    overall, log ({"lines": [...]}) and done. Every event carries an `id`
+    (sequence number); resume with ?since=N or the Last-Event-ID header to
+    get only what was missed. A snapshot is sent first when starting fresh
+    or when the missed events are no longer in the journal.
+    """
+    since = request.args.get('since', type=int)
+    if since is None:
+        since = request.headers.get('Last-Event-ID', type=int)
+    journal = run_events.get_journal(run_id)
+    if journal is None:
+        snap = _progress_snapshot(run_id)
+        if snap is None:
+            return jsonify({'error': 'unknown run_id'}), 404
+        if since is not None:
+            return Response(status=204)  # finished long ago; tells EventSource to stop
+        snap.pop('last_lines', None)
+
+        def _archived():
+            yield _sse_event('done', snap, 0)
+        return Response(stream_with_context(_archived()), headers=_SSE_HEADERS)
+    if journal.closed and since is not None and since >= journal.seq:
+        return Response(status=204)
+
+    body = run_events.stream(journal, lambda: _progress_snapshot(run_id), since)
+    return Response(stream_with_context(body), headers=_SSE_HEADERS)
+
+
+# ---------------------------------------------------------------------
+# Rolling fleet upgrade
+# ---------------------------------------------------------------------
+_FLEET_UPGRADE_CMD = (
+    "sudo DEBIAN_FRONTEND=noninteractive apt-get update -q && "
+    "sudo DEBIAN_FRONTEND=noninteractive apt-get -y "
+    "-o Dpkg::Use-Pty=0 -o Dpkg::Progress-Fancy=0 "
+    "-o Dpkg::Options::=--force-confdef -o Dpkg::Options::=--force-confold full-upgrade"
+)
+
+
+def _connect(s: Dict[str, Any], timeout: int = 20):
+    return ssh_connect(
+        host=s["pi_host"], user=s["pi_user"],
+        auth=s.get("auth_method", "key"), key_path=s.get("ssh_key_path", ""),
+        password=s.get("password", ""), timeout=timeout,
+    )
+
+
+_BOOT_ID = "cat /proc/sys/kernel/random/boot_id"
+
+
+def _boot_id(ssh) -> str:
+    _rc, out, _ = ssh_exec(ssh, _BOOT_ID, timeout=10)
+    return (out or "").strip()
+
+
+def _wait_for_host(s: Dict[str, Any], run_id: str, timeout: float, boot_id: str) -> bool:
+    """After a reboot: poll until SSH answers with a boot_id other than the one read before it."""
+    if not boot_id:
+        time.sleep(15)   # unknown: fall back to giving the host time to go away
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            ssh = _connect(s, timeout=10)
+            try:
+                now = _boot_id(ssh)
+                _rc, out, _ = ssh_exec(ssh, "cat /proc/uptime", timeout=10)
+            finally:
+                ssh.close()
+            if now and now != boot_id:
+                append_log(run_id, f"Host is back (uptime {(out or '').split(' ')[0]} s)\n")
+                return True
+        except Exception:
+            pass
+        time.sleep(5)
+    return False
+
+
+def _fleet_upgrade_host(prof: Dict[str, Any], run_id: str, opts: Dict[str, Any]) -> int:
+    """Full upgrade of one rollout host as a normal run (log, progress, journal)."""
+    s = fleet.profile_settings(prof)
+    host = s["pi_host"]
+    sudo_password = (opts.get("sudo_passwords") or {}).get(prof.get("id")) or opts.get("sudo_password") or ""
+    _new_run('fleet_upgrade', host, run_id=run_id)
+    state = _RUNS.get(run_id)
+    append_log(run_id, f"Action: fleet_upgrade on {prof.get('name') or host}\n")
+    _wait_for_prefetch(host, run_id, state)
+    try:
+        try:
+            ssh = _connect(s)
+        except Exception as e:
+            state['error'] = str(e)
+            append_log(run_id, f"[error] SSH connect failed: {e}\n")
+            _finish_state(state, 255)
+            return 255
+        try:
+            cmd = apt_progress.with_status_fd(_FLEET_UPGRADE_CMD)
+            cmd = _wrap_with_password(cmd, sudo_password) if sudo_password else _force_english(cmd)
+            exit_code = _run_job(ssh, s, cmd, run_id, state)
+            try:
+                _rc, out3, _ = ssh_exec(ssh, 'test -f /run/reboot-required && echo REBOOT_REQUIRED || echo NO_REBOOT', timeout=15, shell=True)
+                state['requires_reboot'] = 'REBOOT_REQUIRED' in (out3 or '')
+            except Exception:
+                pass
+            reboot = opts.get('reboot')
+            if exit_code == 0 and (reboot == 'always' or (reboot == 'if_required' and state['requires_reboot'])):
+                try:
+                    boot_id = _boot_id(ssh)
+                except Exception:
+                    boot_id = ""
+                append_log(run_id, "Rebooting...\n")
+                state['overall'] = {**state['overall'], 'phase': 'Rebooting'}
+                _emit_progress(run_id, state, '')
+                cmd = "sudo systemctl reboot"
+                cmd = _wrap_with_password(cmd, sudo_password) if sudo_password else _force_english(cmd)
+                try:
+                    ssh_exec(ssh, cmd, timeout=15, shell=True)
+                except Exception:
+                    pass  # the connection usually drops mid-command
+        finally:
+            try:
+                ssh.close()
+            except Exception:
+                pass
+        if state.get('overall', {}).get('phase') == 'Rebooting':
+            if _wait_for_host(s, run_id, opts.get('reboot_wait') or 600, boot_id):
+                state['requires_reboot'] = False
+            else:
+                state['error'] = 'host did not come back after reboot'
+                append_log(run_id, f"[error] {state['error']}\n")
+                exit_code = 254
+        _finish_state(state, exit_code)
+        append_log(run_id, f"\n=== Update run completed (rc={state.get('exit_code')}) ===\n")
+        return int(state.get('exit_code') or 0)
+    finally:
+        _end_run(run_id, state)
+
+
+def _sudo_wrapper(opts: Dict[str, Any]):
+    """(cmd, profile) -> cmd with that profile's sudo password piped in (if any)."""
+    def _wrap(cmd: str, prof: Dict[str, Any]) -> str:
+        pw = (opts.get("sudo_passwords") or {}).get(prof.get("id")) or opts.get("sudo_password") or ""
+        return _wrap_with_password(cmd, pw) if pw else _force_english(cmd)
+    return _wrap
+
+
+def _seed_debs(r, log) -> None:
+    """Rollout preparation: put the union of pending .debs into every host's apt archive."""
+    res = deb_cache.seed(r.opts["profiles"], _sudo_wrapper(r.opts), log)
+    log(f"Shared cache: {res['packages']} packages, {res['fetched_bytes']} bytes downloaded once, "
+        f"{res['saved_bytes']} bytes of host downloads saved")
+
+
+def _host_progress(run_id: str) -> Dict[str, Any] | None:
+    st = _RUNS.peek(run_id)
+    return (st or {}).get('overall')
+
+
+@updates_bp.post("/updates/fleet/upgrade")
+def updates_fleet_upgrade():
+    """
+    Rolling upgrade. Body: {"profiles": [ids], "max_parallel": 2, "canary": 1,
+    "max_failures": 0, "reboot": "never|if_required|always", "reboot_wait": 600,
+    "shared_cache": false, "sudo_password": "...", "sudo_passwords": {id: "..."}}.
+    """
+    data = request.get_json(force=True) or {}
+    wanted = [str(p) for p in (data.get("profiles") or [])]
+    by_id = {p.get("id"): p for p in profiles_data.get_all_profiles().get("profiles", [])}
+    profiles = [by_id[pid] for pid in wanted if pid in by_id and _is_configured(fleet.profile_settings(by_id[pid]))]
+    if not profiles:
+        return jsonify({"ok": False, "error": "No configured profiles selected"}), 400
+    reboot = data.get("reboot") or "never"
+    if reboot not in rollout.REBOOT_MODES:
+        return jsonify({"ok": False, "error": f"reboot must be one of {', '.join(rollout.REBOOT_MODES)}"}), 400
+    try:
+        opts = {
+            "max_parallel": max(1, min(32, int(data.get("max_parallel") or 2))),
+            "canary": max(0, int(data.get("canary") if data.get("canary") is not None else 1)),
+            "max_failures": max(0, int(data.get("max_failures") or 0)),
+            "reboot": reboot,
+            "reboot_wait": max(30, min(3600, int(data.get("reboot_wait") or 600))),
+            "sudo_password": data.get("sudo_password") or "",
+            "sudo_passwords": data.get("sudo_passwords") or {},
+            "shared_cache": bool(data.get("shared_cache")),
+        }
+    except (TypeError, ValueError):
+        return jsonify({"ok": False, "error": "invalid numeric option"}), 400
+    r = rollout.start(current_app._get_current_object(), profiles, opts, _fleet_upgrade_host, _host_progress,
+                      prepare=_seed_debs if opts["shared_cache"] else None)
+    return jsonify({"ok": True, "rollout_id": r.id, "hosts": [h["run_id"] for h in r.hosts], "batches": r.batches})
+
+
+@updates_bp.post("/updates/fleet/debcache")
+def updates_fleet_debcache():
+    """
+    Seed the apt archives of the selected profiles from the shared .deb cache,
+    as a run of its own. Body: {"profiles": [ids], "sudo_password": "...", "sudo_passwords": {...}}.
+    """
+    data = request.get_json(force=True) or {}
+    wanted = [str(p) for p in (data.get("profiles") or [])]
+    by_id = {p.get("id"): p for p in profiles_data.get_all_profiles().get("profiles", [])}
+    profiles = [by_id[pid] for pid in wanted if pid in by_id and _is_configured(fleet.profile_settings(by_id[pid]))]
+    if not profiles:
+        return jsonify({"ok": False, "error": "No configured profiles selected"}), 400
+    opts = {"sudo_password": data.get("sudo_password") or "", "sudo_passwords": data.get("sudo_passwords") or {}}
+    run_id = _new_run('deb_seed', f"{len(profiles)} hosts")
+    state = _RUNS.get(run_id)
+    app = current_app._get_current_object()
+
+    def _progress(pct: int) -> None:
+        state['overall'] = {'percent': pct, 'phase': 'Downloading' if pct < 50 else 'Pushing'}
+        _emit_progress(run_id, state, '')
+
+    def _bg():
+        with app.app_context():
+            try:
+                res = deb_cache.seed(profiles, _sudo_wrapper(opts), lambda t: append_log(run_id, t + "\n"), _progress)
+                state['result'] = res
+                append_log(run_id, f"\n=== {res['packages']} packages, {res['fetched_bytes']} bytes downloaded, "
+                                   f"{res['pushed_bytes']} bytes pushed, {res['saved_bytes']} bytes saved ===\n")
+                exit_code = 1 if any(h.get('error') for h in res['hosts'].values()) else 0
+            except Exception as e:
+                state['error'] = str(e)
+                append_log(run_id, f"[error] {e}\n")
+                exit_code = 255
+            _finish_state(state, exit_code)
+            _end_run(run_id, state)
+
+    threading.Thread(target=_bg, name=f"debseed-{run_id}", daemon=True).start()
+    return jsonify({"ok": True, "run_id": run_id})
+
+
+@updates_bp.get("/updates/durations")
+def updates_durations_stats():
+    """Packages with recorded install timings, per host class."""
+    return jsonify({"ok": True, "classes": durations.stats()})
+
+
+@updates_bp.get("/updates/debcache")
+def updates_debcache_stats():
+    return jsonify({"ok": True, **deb_cache.cache().stats()})
+
+
+@updates_bp.get("/updates/cve")
+def updates_cve_index():
+    """State of the offline CVE index (None until a tracker dump has been indexed)."""
+    return jsonify({"ok": True, "tracker": cve_index.tracker_path(), "index": cve_index.meta()})
+
+
+# Re-indexing the stored dump is shared by concurrent callers; an upload is its
+# own data and always waits its turn (the lock also keeps builds from interleaving)
+_CVE_REFRESH = SingleFlight()
+_CVE_LOCK = threading.Lock()
+
+
+def _cve_reindex(path: str, keep_as: Optional[str] = None) -> Dict[str, Any]:
+    with _CVE_LOCK:
+        return cve_index.refresh(path, keep_as=keep_as)
+
+
+@updates_bp.post("/updates/cve/refresh")
+def updates_cve_refresh():
+    """
+    Re-index the security-tracker JSON dump. An uploaded `file` replaces the
+    stored dump first; otherwise RPI_MONITOR_SECURITY_TRACKER (or the default
+    file in the logs dir) is read. No network access either way.
+    """
+    path = cve_index.tracker_path()
+    upload = request.files.get("file")
+    try:
+        if upload is not None:
+            # Indexed from a temp file; the stored dump is only replaced if that works
+            d = os.path.dirname(path) or "."
+            os.makedirs(d, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(prefix=".upload-", suffix=".json", dir=d)
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    upload.save(f)
+                meta = _cve_reindex(tmp, keep_as=path)
+            finally:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+        elif not os.path.isfile(path):
+            return jsonify({"ok": False, "error": f"no tracker dump at {path}"}), 404
+        else:
+            meta, _shared = _CVE_REFRESH.do("refresh", lambda: _cve_reindex(path))
+    except (OSError, ValueError) as e:
+        return jsonify({"ok": False, "error": f"cannot index {path}: {e}"}), 400
+    # Every cached list was annotated with the old index
+    scan_cache.invalidate_all()
+    return jsonify({"ok": True, "index": meta})
+
+
+@updates_bp.get("/updates/fleet/upgrade/<rollout_id>")
+def updates_fleet_upgrade_status(rollout_id: str):
+    r = rollout.get(rollout_id)
+    if r is None:
+        return jsonify({"ok": False, "error": "unknown rollout_id"}), 404
+    return jsonify({"ok": True, **r.snapshot()})
+
+
+@updates_bp.post("/updates/fleet/upgrade/<rollout_id>/halt")
+def updates_fleet_upgrade_halt(rollout_id: str):
+    """Finish the running batch, then stop."""
+    r = rollout.get(rollout_id)
+    if r is None:
+        return jsonify({"ok": False, "error": "unknown rollout_id"}), 404
+    r.halt_requested = True
+    return jsonify({"ok": True})
+
+
+@updates_bp.get("/updates/fleet/upgrade/<rollout_id>/stream")
+def updates_fleet_upgrade_stream(rollout_id: str):
+    """SSE: snapshot, then 'batch' / 'host' events as hosts progress, then 'done'."""
+    r = rollout.get(rollout_id)
+    journal = run_events.get_journal(rollout_id)
+    if r is None or journal is None:
+        return Response(status=204)
+    since = request.args.get('since', type=int)
+    if since is None:
+        since = request.headers.get('Last-Event-ID', type=int)
+    body = run_events.stream(journal, r.snapshot, since)
+    return Response(stream_with_context(body), headers=_SSE_HEADERS)
+
+
 @updates_bp.get('/updates/logs')
 def updates_logs_list():
     items = list_logs()
     for it in items:
-        st = _RUNS.get(it['id'])
+        st = _RUNS.peek(it['id'])
         if st and st.get('started_ts'):
             end = st.get('ended_ts') or time.time()
             it['duration'] = int(max(0, end - st['started_ts']))
     return jsonify({'items': items})
 
 
+@updates_bp.get('/updates/logs/search')
+def updates_logs_search():
+    """Search run logs by package name or error keyword.
+
+    Query: q (space-separated terms, all must match; 'lib*' for prefixes), limit.
+    Returns matching runs, newest first, with 1-based line numbers.
+    """
+    q = (request.args.get('q') or '').strip()
+    if not q:
+        return jsonify({'error': 'missing q'}), 400
+    limit = max(1, min(request.args.get('limit', default=50, type=int), 500))
+    return jsonify(log_search.search(q, limit=limit))
+
+
 @updates_bp.get('/updates/logs/<run_id>')
 def updates_log_read(run_id: str):
-    try:
-        text = read_log(run_id)
-    except FileNotFoundError:
+    if not log_exists(run_id):
         return jsonify({'error': 'not found'}), 404
+    # Stream (decompressing archived runs) instead of loading the whole file
+    headers = {'Content-Type': 'text/plain; charset=utf-8'}
     if request.args.get('download'):
-        path = make_log_path(run_id)
-        return send_file(path, as_attachment=True, download_name=f'{run_id}.log')
-    resp = make_response(text)
-    resp.headers['Content-Type'] = 'text/plain; charset=utf-8'
-    return resp
+        safe = ''.join(c for c in run_id if c.isalnum() or c in ('-', '_', '.'))
+        headers['Content-Disposition'] = f'attachment; filename="{safe}.log"'
+    return Response(iter_log_chunks(run_id), headers=headers)
 
 
 @updates_bp.delete('/updates/logs/<run_id>')
@@ -595,10 +1265,113 @@ def updates_log_delete(run_id: str):
     ok = delete_log(run_id)
     return jsonify({'ok': bool(ok)})
 
-@updates_bp.post("/updates/install_package")
+# ---------------------------------------------------------------------
+# Install queue: clicks within a short window become one apt transaction
+# ---------------------------------------------------------------------
+# "E: Unable to locate package foo" | "E: Package 'foo' has no installation candidate"
+_RX_APT_MISSING = re.compile(r"^E: (?:Unable to locate package (\S+)|Package '([^']+)' has no installation candidate)")
+
+
+def _install_batch(b: "install_queue.Batch") -> None:
+    """Run one queued transaction: refresh stale lists, install/remove everything in one apt-get call."""
+    run_id, s, host = b.run_id, b.settings, b.host
+    state = _RUNS.get(run_id)
+    installs, removes = b.names('install'), b.names('remove')
+    state['expected'] = installs + removes
+    pw = b.sudo_password
+
+    def _wrap(cmd: str) -> str:
+        return _wrap_with_password(cmd, pw) if pw else _force_english(cmd)
+
+    append_log(run_id, f"Transaction: install [{' '.join(installs)}] remove [{' '.join(removes)}]\n")
+    _wait_for_prefetch(host, run_id, state)
+    missing: set = set()
+    exit_code = 255
+    try:
+        try:
+            ssh = _connect(s)
+        except Exception as e:
+            state['error'] = str(e)
+            append_log(run_id, f"[error] SSH connect failed: {e}\n")
+            b.results = {n: {'op': op, 'ok': False, 'error': str(e)} for n, op in b.ops.items()}
+            _finish_state(state, 255)
+            return
+        try:
+            # Reuse a recent index refresh (scan, prefetch, earlier batch) instead of one per click
+            drv = DebianDriver(settings=s)
+            info = drv.lists_age(ssh)
+            if info['age'] is None or info['age'] > drv.lists_max_age() or info['sources_changed']:
+                append_log(run_id, "Refreshing package lists...\n")
+                rc, out, err = ssh_exec(ssh, _wrap("sudo apt-get update -q"), timeout=600, shell=True)
+                for text in (out, err):
+                    if text:
+                        append_log(run_id, text.replace(pw, '******') if pw else text)
+                if rc != 0:
+                    append_log(run_id, f"[warn] apt-get update failed (exit {rc}); using the existing lists\n")
+                else:
+                    drv.mark_lists_fresh(ssh)
+            else:
+                append_log(run_id, f"Package lists are {info['age']} s old; not refreshing\n")
+
+            # apt aborts the whole transaction for an unknown package: retry once without those
+            for _attempt in range(2):
+                targets = [n for n in installs if n not in missing] + [f"{n}-" for n in removes if n not in missing]
+                if not targets:
+                    break
+                cmd = apt_progress.with_status_fd(
+                    "sudo DEBIAN_FRONTEND=noninteractive apt-get install -y -o Dpkg::Use-Pty=0 --"
+                ) + " " + " ".join(shlex.quote(t) for t in targets)
+                exit_code = _run_job(ssh, s, _wrap(cmd), run_id, state)
+                if exit_code == 0:
+                    break
+                new = set()
+                for line in tail_lines(run_id, 200):
+                    m = _RX_APT_MISSING.match(line.strip())
+                    if m:
+                        new.add(m.group(1) or m.group(2))
+                new = (new & set(b.ops)) - missing
+                if not new:
+                    break
+                missing |= new
+                append_log(run_id, f"Retrying without {', '.join(sorted(new))}\n")
+
+            pkg_inventory.invalidate(host)
+            status = pkg_inventory.status(host, lambda cmd: ssh_exec(ssh, cmd, timeout=30)[1], sorted(b.ops))
+            for name, op in b.ops.items():
+                st = status[name]
+                installed = st['installed']
+                res = {'op': op, 'ok': installed if op == 'install' else not installed,
+                       'status': st['status'] or 'not-installed', 'version': st['version'] or ''}
+                if name in missing:
+                    res['error'] = 'package not found'
+                b.results[name] = res
+            try:
+                _rc, out3, _ = ssh_exec(ssh, 'test -f /run/reboot-required && echo REBOOT_REQUIRED || echo NO_REBOOT', timeout=15, shell=True)
+                state['requires_reboot'] = 'REBOOT_REQUIRED' in (out3 or '')
+            except Exception:
+                pass
+        finally:
+            try:
+                ssh.close()
+            except Exception:
+                pass
+        failed = sorted(n for n, r in b.results.items() if not r['ok'])
+        if failed:
+            append_log(run_id, f"[error] not done: {', '.join(failed)}\n")
+        _finish_state(state, 0 if not failed else (exit_code or 1))
+        append_log(run_id, f"\n=== Update run completed (rc={state.get('exit_code')}) ===\n")
+    finally:
+        state['result'] = {'packages': b.results}
+        b.output = "".join(tail_lines(run_id, 60))
+        _end_run(run_id, state)
+
+
+install_queue.configure(lambda host: _new_run('install_package', host), _install_batch)
+
+
 @updates_bp.post("/updates/install_package")
 def updates_install_package():
-    """Install a single package by name and stream progress like other runs.
+    """Queue a package install; clicks within a few seconds share one apt run.
     Body: {"name": "pkg-name", "sudo_password": "optional"}
     """
     try:
@@ -607,50 +1380,15 @@ def updates_install_package():
         sudo_password = data.get("sudo_password") or ""
         if not name:
             return jsonify({"ok": False, "error": "Missing package name"}), 400
-
-        # Capture active SSH settings before starting the background thread
         s = _get_active_ssh_settings()
-        run_id = _new_run()
-        _RUNS[run_id]['action'] = 'install_package'
-        append_log(run_id, f"Action: install_package {name}\n")
-
-        def _bg():
-            state = _RUNS.get(run_id)
-            try:
-                ssh = ssh_connect(
-                    host=s["pi_host"], user=s["pi_user"],
-                    auth=s.get("auth_method", "key"), key_path=s.get("ssh_key_path", ""),
-                    password=s.get("password", ""), timeout=20,
-                )
-            except Exception as e:
-                state['error'] = str(e)
-                append_log(run_id, f"[error] SSH connect failed: {e}\n")
-                _finish_state(state, 255)
-                return
-
-            try:
-                pkg = shlex.quote(name)
-                base_cmd = f"sudo DEBIAN_FRONTEND=noninteractive apt-get install -y -- {pkg}"
-                cmd = _wrap_with_password(base_cmd, sudo_password) if sudo_password else _force_english(base_cmd)
-                exit_code = _run_streaming(ssh, cmd, run_id, state)
-
-                try:
-                    rc3, out3, _ = ssh_exec(ssh, 'test -f /run/reboot-required && echo REBOOT_REQUIRED || echo NO_REBOOT', timeout=15, shell=True)
-                    state['requires_reboot'] = 'REBOOT_REQUIRED' in (out3 or '')
-                except Exception:
-                    pass
-
-                _finish_state(state, exit_code if isinstance(exit_code, int) else (state.get('exit_code') or 0))
-                append_log(run_id, f"\n=== Update run completed (rc={state.get('exit_code')}) ===\n")
-            finally:
-                try:
-                    ssh.close()
-                except Exception:
-                    pass
-
-        threading.Thread(target=_bg, name=f"upd-inst-{run_id}", daemon=True).start()
-        return jsonify({"ok": True, "run_id": run_id})
-    except Exception as e:
-        return jsonify({"ok": False, "error": str(e)}), 500
+        if not _is_configured(s):
+            return jsonify({"ok": False, "error": "SSH not configured"}), 400
+        b = install_queue.submit(s, 'install', [name], sudo_password)
+        return jsonify({"ok": True, "run_id": b.run_id, "batch": sorted(b.ops)})
     except Exception as e:
         return jsonify({"ok": False, "error": str(e)}), 500
+
+
+@updates_bp.get("/updates/install_queue")
+def updates_install_queue():
+    return jsonify({"ok": True, **install_queue.snapshot()})
@@ -38,6 +38,10 @@ const overallBox = document.getElementById('overall-progress');
 const overallPhase = document.getElementById('overall-progress-phase');
 const overallValue = document.getElementById('overall-progress-value');
 const overallFill = document.getElementById('overall-progress-fill');
+const listsAge = document.getElementById('lists-age');
+const btnRefreshLists = document.getElementById('btn-refresh-lists');
+const optPrefetch = document.getElementById('opt-prefetch');
+const prefetchStatus = document.getElementById('prefetch-status');
 
 // Hvilke UI-handlinger kræver sudo (på Mint m.fl.)
 // Hvilke UI-handlinger kræver sudo (på Mint m.fl.)
@@ -80,10 +84,8 @@ const SECURITY_UPDATE_STEPS = [
 
 let tickTimer = null;
 let tickProgress = null;
-let pollProgressTimer = null;
-let pollLogTimer = null;
+let progressSource = null;
 let currentRunId = null;
-let lastLogTextLen = 0;
 
 // Track counts so we only enable actions when enrichment is 100% done
 let totalExpected = 0;
@@ -140,6 +142,13 @@ function scheduleOverallReset() {
     }, 2200);
 }
 
+function fmtEta(secs) {
+    const s = Math.max(0, Math.round(secs));
+    if (s < 60) return `~${s} s`;
+    if (s < 3600) return `~${Math.floor(s / 60)} min ${s % 60 ? (s % 60) + ' s' : ''}`.trim();
+    return `~${Math.floor(s / 3600)} h ${Math.round((s % 3600) / 60)} min`;
+}
+
 function updateOverallProgress(snapshot) {
     if (!overallBox || !overallPhase || !overallValue || !overallFill) return;
     const snap = snapshot || {};
@@ -147,7 +156,9 @@ function updateOverallProgress(snapshot) {
     const pct = Math.max(0, Math.min(100, parseInt(rawPct != null ? rawPct : 0, 10) || 0));
     const phase = snap.phase || 'Idle';
     const status = snap.status || (pct > 0 ? 'running' : 'idle');
-    overallPhase.textContent = phase;
+    // ETA from past install times of these packages on this kind of host
+    const eta = snap.eta != null ? snap.eta : (snap.overall || {}).eta;
+    overallPhase.textContent = (status === 'running' && eta != null) ? `${phase} • ${fmtEta(eta)} left` : phase;
     overallValue.textContent = pct + '%';
     overallFill.style.setProperty('--w', pct + '%');
     overallFill.setAttribute('aria-valuenow', pct);
@@ -215,10 +226,8 @@ async function run(action, options = {}) {
             runId = j.run_id;
             currentRunId = runId;
             window.localStorage.setItem('upd.run_id', currentRunId);
-            lastLogTextLen = 0;
             beginRun(runId);
-            startProgressPolling(runId);
-            startLogPolling(runId);
+            startProgressStream(runId, { fresh: true });
             if (options.waitForCompletion) {
                 const snapshot = await waitForRunCompletion(runId);
                 return snapshot || j;
@@ -444,6 +453,7 @@ function showEnriching() {
 // ---- SSE scan ----
 let currentSource = null;
 let seenNames = new Set();
+let cachedNames = new Set();
 let rowIndex = 0;
 
 function closeSSE() {
@@ -477,24 +487,161 @@ async function enrichAsync(name, tr) {
     }
 }
 
-function startSSEScan() {
+// Rows waiting for details; fetched a few at a time
+let pendingEnrich = [];
+const ENRICH_PARALLEL = 4;
+let enrichActive = 0;
+
+function flushEnrich() {
+    while (enrichActive < ENRICH_PARALLEL && pendingEnrich.length) {
+        const [name, tr] = pendingEnrich.shift();
+        if (!tr.isConnected) { enrichedCount += 1; continue; }
+        enrichActive += 1;
+        enrichAsync(name, tr).finally(() => { enrichActive -= 1; flushEnrich(); });
+    }
+}
+
+function addPkgRow(name, data) {
+    seenNames.add(name);
+    discoveredCount = seenNames.size;
+
+    const html = pkgRowSkeleton(name, data.candidate, data.arch, rowIndex++);
+    bodyEl.insertAdjacentHTML('beforeend', html);
+
+    const tr = bodyEl.lastElementChild.previousElementSibling?.classList.contains('pkg')
+        ? bodyEl.lastElementChild.previousElementSibling
+        : bodyEl.lastElementChild;
+
+    if (tr && tr.classList.contains('pkg')) {
+        tr.setAttribute('data-arch', data.arch || '');
+        wireToggle(tr);
+        // Enriched once the scan's batched policy lookup is in (see flushEnrich)
+        pendingEnrich.push([name, tr]);
+
+        // Refresh placeholder progress cell so it starts at 0%/Queued
+        try {
+            const td = tr.querySelector('td[data-prog]');
+            if (td) td.innerHTML = buildPkgProgressMarkup(0, 'Queued');
+        } catch (e) { /* ignore */ }
+
+        // If this package was installed earlier in this session, grey out its button
+        try {
+            if (INSTALLED_SET.has(name.toLowerCase())) {
+                const b = tr.querySelector('[data-install]');
+                if (b) { b.disabled = true; b.textContent = 'Installed'; b.classList.add('is-disabled'); }
+            }
+        } catch (e) { }
+    }
+    return tr;
+}
+
+// ---- Background pre-download (opt-in) ----
+let prefetchSource = null;
+
+function fmtBytes(n) {
+    if (n == null) return '';
+    if (n < 1e3) return `${n} B`;
+    if (n < 1e6) return `${(n / 1e3).toFixed(0)} kB`;
+    if (n < 1e9) return `${(n / 1e6).toFixed(1)} MB`;
+    return `${(n / 1e9).toFixed(2)} GB`;
+}
+
+function renderPrefetch(o, done) {
+    if (!prefetchStatus) return;
+    const bytes = o.download_total ? ` (${fmtBytes(o.download_bytes || 0)} / ${fmtBytes(o.download_total)})` : '';
+    if (done) {
+        prefetchStatus.textContent = o.phase === 'Failed'
+            ? 'Pre-download failed (see logs)'
+            : `Upgrades downloaded${o.download_total ? ' • ' + fmtBytes(o.download_total) : ''}`;
+    } else {
+        prefetchStatus.textContent = `Pre-downloading… ${parseInt(o.percent || 0, 10)}%${bytes}`;
+    }
+    prefetchStatus.style.display = 'inline';
+}
+
+async function maybePrefetch() {
+    if (!optPrefetch || !optPrefetch.checked || prefetchSource) return;
+    try {
+        const r = await fetch('/updates/run', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ action: 'apt_prefetch', sudo_password: SUDO_PW_CACHE || '' })
+        });
+        const j = await r.json();
+        if (!j.ok || !j.run_id) return;
+        const src = new EventSource(`/updates/progress/${encodeURIComponent(j.run_id)}/stream`);
+        prefetchSource = src;
+        const parse = (ev) => { try { return JSON.parse(ev.data || '{}'); } catch (e) { return {}; } };
+        src.addEventListener('snapshot', (ev) => renderPrefetch(parse(ev).overall || {}, false));
+        src.addEventListener('overall', (ev) => renderPrefetch(parse(ev), false));
+        src.addEventListener('done', (ev) => {
+            renderPrefetch(parse(ev).overall || {}, true);
+            src.close();
+            prefetchSource = null;
+        });
+        src.onerror = () => { src.close(); prefetchSource = null; };
+    } catch (e) { /* best effort */ }
+}
+
+if (optPrefetch) {
+    optPrefetch.checked = localStorage.getItem('upd.prefetch') === 'true';
+    optPrefetch.addEventListener('change', () => {
+        localStorage.setItem('upd.prefetch', String(optPrefetch.checked));
+        if (optPrefetch.checked && discoveredCount > 0) maybePrefetch();
+    });
+}
+
+function fmtAge(secs) {
+    if (secs == null) return 'unknown';
+    if (secs < 60) return 'just now';
+    if (secs < 3600) return `${Math.round(secs / 60)} min ago`;
+    if (secs < 172800) return `${Math.round(secs / 3600)} h ago`;
+    return `${Math.round(secs / 86400)} days ago`;
+}
+
+function showListsAge(data) {
+    if (!listsAge) return;
+    let txt = `Package lists: updated ${fmtAge(data.age)}`;
+    if (data.refreshed) txt = data.shared ? 'Package lists: refreshed (shared with another scan)' : 'Package lists: refreshed now';
+    else if (data.sources_changed) txt += ' (sources changed since)';
+    listsAge.textContent = txt;
+    listsAge.title = `Refreshed automatically when older than ${fmtAge(data.max_age).replace(' ago', '')}`;
+    listsAge.style.display = 'inline';
+    if (btnRefreshLists) btnRefreshLists.style.display = data.refreshed ? 'none' : 'inline';
+}
+
+function startSSEScan(opts = {}) {
     closeSSE();
     startIndicator();
     seenNames = new Set();
+    cachedNames = new Set();
+    pendingEnrich = [];
     rowIndex = 0;
     totalExpected = 0;
     enrichedCount = 0;
     discoveredCount = 0;
     bodyEl.innerHTML = '';
 
-    currentSource = new EventSource('/updates/scan/stream');
+    const qs = opts.refresh ? '?refresh=1' : '';
+    currentSource = new EventSource('/updates/scan/stream' + qs);
 
     currentSource.addEventListener('status', (ev) => {
         try {
             const data = JSON.parse(ev.data || '{}');
-            if (data.stage === 'apt_update') {
-                searchText.textContent = 'Refreshing package index…';
+            if (data.stage === 'check_lists') {
+                searchText.textContent = 'Checking package lists…';
+                setProgress(10);
+            } else if (data.stage === 'apt_update') {
+                searchText.textContent = data.shared
+                    ? 'Waiting for package index refresh…'
+                    : 'Refreshing package index…';
                 setProgress(20);
+            } else if (data.stage === 'shared_scan') {
+                searchText.textContent = 'Waiting for a scan already running…';
+                setProgress(40);
+            } else if (data.stage === 'policy') {
+                searchText.textContent = 'Fetching package details…';
+                setProgress(60);
             } else if (data.stage === 'list_upgradable') {
                 searchText.textContent = 'Scanning upgradable packages…';
                 setProgress(40);
@@ -502,43 +649,53 @@ function startSSEScan() {
         } catch (e) { }
     });
 
+    currentSource.addEventListener('lists', (ev) => {
+        try { showListsAge(JSON.parse(ev.data || '{}')); } catch (e) { }
+    });
+
+    currentSource.addEventListener('cached', (ev) => {
+        try {
+            const data = JSON.parse(ev.data || '{}');
+            (data.packages || []).forEach(p => {
+                const name = stripAnsi(p.name);
+                if (!name || seenNames.has(name)) return;
+                addPkgRow(name, p);
+                // Still to be confirmed by the live scan that follows
+                if (data.refreshing) cachedNames.add(name);
+            });
+            if (data.lists) showListsAge(data.lists);
+            if (updatesCount && discoveredCount) {
+                updatesCount.style.display = 'inline-block';
+                updatesCount.textContent = `Found ${discoveredCount}`;
+            }
+            searchText.textContent = data.refreshing
+                ? `Cached list from ${fmtAge(data.age)} • refreshing…`
+                : `Cached list from ${fmtAge(data.age)}`;
+            flushEnrich();
+        } catch (e) { }
+    });
+
+    // Policies of all candidates were just fetched in one call: details are cheap now
+    currentSource.addEventListener('policy', () => flushEnrich());
+
     currentSource.addEventListener('pkg', (ev) => {
         try {
             const data = JSON.parse(ev.data || '{}');
-            const rawName = data.name;
-            const name = stripAnsi(rawName);
-            if (!name || seenNames.has(name)) return;
-
-            seenNames.add(name);
-            discoveredCount = seenNames.size;
-
-            const html = pkgRowSkeleton(name, data.candidate, data.arch, rowIndex++);
-            bodyEl.insertAdjacentHTML('beforeend', html);
-
-            const tr = bodyEl.lastElementChild.previousElementSibling?.classList.contains('pkg')
-                ? bodyEl.lastElementChild.previousElementSibling
-                : bodyEl.lastElementChild;
-
-            if (tr && tr.classList.contains('pkg')) {
-                tr.setAttribute('data-arch', data.arch || '');
-                wireToggle(tr);
-                // Enrich row in background
-                enrichAsync(name, tr);
-
-                // Refresh placeholder progress cell so it starts at 0%/Queued
-                try {
-                    const td = tr.querySelector('td[data-prog]');
-                    if (td) td.innerHTML = buildPkgProgressMarkup(0, 'Queued');
-                } catch (e) { /* ignore */ }
-
-                // If this package was installed earlier in this session, grey out its button
-                try {
-                    if (INSTALLED_SET.has(name.toLowerCase())) {
-                        const b = tr.querySelector('[data-install]');
-                        if (b) { b.disabled = true; b.textContent = 'Installed'; b.classList.add('is-disabled'); }
+            const name = stripAnsi(data.name);
+            if (!name) return;
+            if (seenNames.has(name)) {
+                // Row came from the cached list: confirm it, re-enrich if the candidate moved
+                if (cachedNames.delete(name)) {
+                    const tr = findPkgRow(name);
+                    const td = tr ? tr.querySelectorAll('td') : [];
+                    if (td[1] && data.candidate && td[1].textContent !== data.candidate) {
+                        td[1].textContent = data.candidate;
+                        pendingEnrich.push([name, tr]);
                     }
-                } catch (e) { }
+                }
+                return;
             }
+            addPkgRow(name, data);
             searchText.textContent = `Scanning… (${discoveredCount})`;
         } catch (e) { }
     });
@@ -546,7 +703,21 @@ function startSSEScan() {
     currentSource.addEventListener('done', (ev) => {
         try {
             const data = JSON.parse(ev.data || '{}');
+            if (!data.cached) {
+                // Live scan finished: cached rows it did not report are no longer upgradable
+                cachedNames.forEach(name => {
+                    const tr = findPkgRow(name);
+                    const d = tr ? tr.nextElementSibling : null;
+                    if (d && d.classList.contains('detail')) d.remove();
+                    if (tr) tr.remove();
+                    seenNames.delete(name);
+                });
+                cachedNames.clear();
+                discoveredCount = seenNames.size;
+            }
             totalExpected = data.count || discoveredCount || 0;
+            flushEnrich();
+            if (!data.cached && totalExpected > 0) maybePrefetch();
 
             // Show final count badge
             if (updatesCount) {
@@ -617,6 +788,11 @@ document.getElementById('btn-refresh')?.addEventListener('click', () => {
     startSSEScan();
 });
 
+btnRefreshLists?.addEventListener('click', (e) => {
+    e.preventDefault();
+    startSSEScan({ refresh: true });
+});
+
 btnInstallSec?.addEventListener('click', () => runSequence(SECURITY_UPDATE_STEPS, 'Security updates'));
 btnReboot?.addEventListener('click', rebootNow);
 
@@ -765,7 +941,7 @@ function showLogViewer(id, txt) {
     refreshLogsList();
 })();
 
-// Progress polling and rendering
+// Progress streaming and rendering
 function renderProgressCell(tr, pkg) {
     let td = tr.querySelector('td[data-prog]');
     if (!td) {
@@ -804,41 +980,95 @@ async function pollProgressOnce(run_id) {
     } catch (e) { return null; }
 }
 
-function startProgressPolling(run_id) {
-    if (pollProgressTimer) { clearInterval(pollProgressTimer); pollProgressTimer = null; }
-    pollProgressTimer = setInterval(async () => {
-        const j = await pollProgressOnce(run_id);
-        if (j && j.done) {
-            clearInterval(pollProgressTimer); pollProgressTimer = null;
-            window.localStorage.removeItem('upd.run_id');
-            refreshLogsList();
-        }
-    }, 1000);
+function closeProgressStream() {
+    if (progressSource) { try { progressSource.close(); } catch (e) {} progressSource = null; }
 }
 
-async function pollLogOnce(run_id) {
-    try {
-        const r = await fetch(`/updates/logs/${encodeURIComponent(run_id)}`, { cache: 'no-store' });
-        if (!r.ok) return;
-        const txt = await r.text();
-        if (lastLogTextLen < txt.length) {
-            out.textContent = txt;
-            out.scrollTop = out.scrollHeight;
-            lastLogTextLen = txt.length;
-            try { localStorage.setItem('upd.output.text', String(txt || '')); } catch (e) {}
-        }
-    } catch (e) { /* ignore */ }
+function appendLogLines(lines) {
+    if (!out || !lines || !lines.length) return;
+    const prev = out.textContent || '';
+    const sep = prev && !prev.endsWith('\n') ? '\n' : '';
+    out.textContent = prev + sep + lines.join('\n') + '\n';
+    out.scrollTop = out.scrollHeight;
+    try { localStorage.setItem('upd.output.text', out.textContent); } catch (e) {}
 }
 
-function startLogPolling(run_id) {
-    if (pollLogTimer) { clearInterval(pollLogTimer); pollLogTimer = null; }
-    pollLogTimer = setInterval(async () => {
-        await pollLogOnce(run_id);
+// Push channel per run: incremental package/overall/log events over SSE.
+// The last seen sequence number is kept so a reload resumes where it left off.
+function startProgressStream(run_id, opts = {}) {
+    closeProgressStream();
+    if (opts.fresh) {
+        localStorage.removeItem('upd.run_seq');
+        if (out) out.textContent = '';
+    }
+    const since = opts.fresh ? null : localStorage.getItem('upd.run_seq');
+    const qs = since ? `?since=${encodeURIComponent(since)}` : '';
+    const src = new EventSource(`/updates/progress/${encodeURIComponent(run_id)}/stream${qs}`);
+    progressSource = src;
+
+    const track = (ev) => { if (ev.lastEventId) localStorage.setItem('upd.run_seq', ev.lastEventId); };
+    const parse = (ev) => { try { return JSON.parse(ev.data || '{}'); } catch (e) { return {}; } };
+
+    src.addEventListener('snapshot', (ev) => {
+        const j = parse(ev);
+        renderProgressSnapshot(j);
+        if (out && Array.isArray(j.last_lines)) {
+            out.textContent = '';
+            appendLogLines(j.last_lines);
+        }
+        track(ev);
+    });
+    src.addEventListener('overall', (ev) => {
+        const j = parse(ev);
+        updateOverallProgress({ percent: j.percent, phase: j.phase, eta: j.eta, status: 'running' });
+        track(ev);
+    });
+    src.addEventListener('package', (ev) => {
+        renderPackageProgress(parse(ev));
+        track(ev);
+    });
+    src.addEventListener('log', (ev) => {
+        appendLogLines(parse(ev).lines || []);
+        track(ev);
+    });
+    src.addEventListener('done', (ev) => {
+        closeProgressStream();
+        renderProgressSnapshot(parse(ev));
+        localStorage.removeItem('upd.run_id');
+        localStorage.removeItem('upd.run_seq');
+        refreshLogsList();
+    });
+    src.onerror = async () => {
+        // EventSource retries by itself (with Last-Event-ID); a closed source
+        // means the server refused (unknown/finished run), so settle via one poll.
+        if (src.readyState !== EventSource.CLOSED) return;
+        if (progressSource === src) progressSource = null;
         const j = await pollProgressOnce(run_id);
-        if (j && j.done) {
-            clearInterval(pollLogTimer); pollLogTimer = null;
+        if (!j || j.done) {
+            localStorage.removeItem('upd.run_id');
+            localStorage.removeItem('upd.run_seq');
+            if (!j) completeRun(run_id, null);
         }
-    }, 1000);
+    };
+}
+
+function findPkgRow(name) {
+    const targetName = String(name || '').toLowerCase();
+    if (!targetName || !bodyEl) return null;
+    let tr = null;
+    // Prefer matching by data-name if present
+    bodyEl.querySelectorAll('tr.pkg').forEach(r => {
+        if (tr) return;
+        const dn = String(r.getAttribute('data-name') || '').toLowerCase();
+        const textName = String(r.querySelector('td')?.textContent || '').toLowerCase();
+        if (dn === targetName || textName === targetName) tr = r;
+    });
+    return tr;
+}
+
+function renderPackageProgress(pkg) {
+    const tr = findPkgRow(pkg && pkg.name);
+    if (tr) renderProgressCell(tr, pkg);
 }
 
 // Render a full snapshot from /updates/progress/<run_id>
@@ -847,20 +1077,7 @@ function renderProgressSnapshot(j) {
         updateOverallProgress(j);
         const pkgs = Array.isArray(j.packages) ? j.packages : [];
         // Update per-package cells when rows exist
-        pkgs.forEach(pkg => {
-            const targetName = String(pkg.name || '').toLowerCase();
-            if (!targetName) return;
-            let tr = null;
-            // Prefer matching by data-name if present
-            const rows = bodyEl ? bodyEl.querySelectorAll('tr.pkg') : [];
-            rows.forEach(r => {
-                if (tr) return;
-                const dn = String(r.getAttribute('data-name') || '').toLowerCase();
-                const textName = String(r.querySelector('td')?.textContent || '').toLowerCase();
-                if (dn === targetName || textName === targetName) tr = r;
-            });
-            if (tr) renderProgressCell(tr, pkg);
-        });
+        pkgs.forEach(renderPackageProgress);
 
         // If run is done or errored, hide bars and restore buttons
         if (j.done) {
@@ -917,7 +1134,6 @@ async function showConnectionInfo() {
         if (out && t) {
             out.textContent = t;
             out.scrollTop = out.scrollHeight;
-            lastLogTextLen = t.length;
         }
     } catch (e) {}
 })();
@@ -930,8 +1146,7 @@ startSSEScan();
     if (rid) {
         currentRunId = rid;
         beginRun(rid);
-        startProgressPolling(rid);
-        startLogPolling(rid);
+        startProgressStream(rid);
         setBusy(true);
     }
 })();
@@ -970,10 +1185,8 @@ async function installPackage(name, btnEl) {
       runId = j.run_id;
       currentRunId = runId;
       window.localStorage.setItem('upd.run_id', currentRunId);
-      lastLogTextLen = 0;
       beginRun(runId);
-      startProgressPolling(currentRunId);
-      startLogPolling(currentRunId);
+      startProgressStream(currentRunId, { fresh: true });
     }
     INSTALLED_SET.add(String(name || '').toLowerCase());
     if (btnEl) {
@@ -1012,3 +1225,135 @@ bodyEl.addEventListener('click', (e) => {
     }
   });
 });
+
+// ---- Fleet: all profiles at once ----
+const btnFleetScan = document.getElementById('btn-fleet-scan');
+const fleetBody = document.getElementById('fleet-body');
+const fleetTable = document.getElementById('fleet-table');
+const fleetStatus = document.getElementById('fleet-status');
+let fleetSource = null;
+
+function fleetRowHTML(h, row) {
+    const name = escapeHTML(h.name || h.host || '');
+    if (!row) {
+        return `<td>${name}</td><td class="muted" colspan="3">Scanning…</td>`;
+    }
+    if (!row.ok) {
+        return `<td>${name}</td><td colspan="3" style="color:#ffb3b3;">${escapeHTML(row.error || 'failed')}</td>`;
+    }
+    const names = (row.packages || []).map(p => escapeHTML(p.name)).join(', ');
+    const age = row.cached && row.age != null ? ` <span class="muted">(cached ${fmtAge(row.age)})</span>` : '';
+    return `<td>${name}${age}</td><td>${row.count}</td>`
+        + `<td>${row.security ? `<span class="pill sec">${row.security}</span>` : '0'}</td>`
+        + `<td title="${escapeAttr(names)}">${names.length > 160 ? names.slice(0, 160) + '…' : (names || '-')}</td>`;
+}
+
+function startFleetScan(refresh) {
+    if (fleetSource) { try { fleetSource.close(); } catch (e) { } }
+    fleetBody.innerHTML = '';
+    fleetTable.style.display = '';
+    fleetStatus.textContent = 'Scanning…';
+    btnFleetScan.disabled = true;
+    let done = 0, total = 0;
+    const src = new EventSource('/updates/fleet' + (refresh ? '?refresh=1' : ''));
+    fleetSource = src;
+    const parse = (ev) => { try { return JSON.parse(ev.data || '{}'); } catch (e) { return {}; } };
+    const finish = (text) => {
+        fleetStatus.textContent = text;
+        btnFleetScan.disabled = false;
+        src.close();
+        fleetSource = null;
+    };
+    src.addEventListener('hosts', (ev) => {
+        const hosts = parse(ev).hosts || [];
+        total = hosts.length;
+        fleetBody.innerHTML = hosts.map(h =>
+            `<tr data-fleet="${escapeAttr(h.id)}">${fleetRowHTML(h, null)}</tr>`).join('');
+        fleetStatus.textContent = `Scanning… (0/${total})`;
+    });
+    src.addEventListener('row', (ev) => {
+        const row = parse(ev);
+        const tr = fleetBody.querySelector(`tr[data-fleet="${CSS.escape(row.id || '')}"]`);
+        if (tr) tr.innerHTML = fleetRowHTML(row, row);
+        done += 1;
+        fleetStatus.textContent = `Scanning… (${done}/${total})`;
+    });
+    src.addEventListener('done', (ev) => {
+        const m = parse(ev);
+        fleetPending = (m.hosts || []).filter(h => h.ok && h.count > 0).map(h => h.id);
+        if (fleetUpgradeOpts) fleetUpgradeOpts.style.display = fleetPending.length ? 'inline-flex' : 'none';
+        finish(`${Object.keys(m.packages || {}).length} packages pending across ${total} hosts • ${ts()}`);
+    });
+    src.onerror = () => finish('Fleet scan failed');
+}
+
+// Rolling upgrade of the hosts the last fleet scan found updates on
+const fleetUpgradeOpts = document.getElementById('fleet-upgrade-opts');
+const btnFleetUpgrade = document.getElementById('btn-fleet-upgrade');
+let fleetPending = [];
+
+function rolloutCellHTML(h) {
+    const pct = parseInt(h.percent || 0, 10);
+    const color = h.status === 'failed' ? ' style="color:#ffb3b3;"' : '';
+    const label = h.status === 'running' ? `${escapeHTML(h.phase || 'Running')} ${pct}%` : escapeHTML(h.status);
+    return `<td colspan="3"${color}>${label}</td>`;
+}
+
+async function startRollout() {
+    if (!fleetPending.length) return;
+    if (!window.confirm(`Upgrade ${fleetPending.length} host(s)? The first one goes alone as a canary.`)) return;
+    if (SUDO_PW_CACHE == null) {
+        const typed = window.prompt('Enter sudo password (leave empty for passwordless sudo):', '');
+        if (typed === null) return;
+        SUDO_PW_CACHE = typed;
+    }
+    btnFleetUpgrade.disabled = true;
+    let j = {};
+    try {
+        const r = await fetch('/updates/fleet/upgrade', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                profiles: fleetPending,
+                max_parallel: parseInt(document.getElementById('fleet-parallel')?.value || '2', 10),
+                canary: 1,
+                max_failures: 0,
+                reboot: document.getElementById('fleet-reboot')?.value || 'never',
+                shared_cache: !!document.getElementById('fleet-shared-cache')?.checked,
+                sudo_password: SUDO_PW_CACHE || ''
+            })
+        });
+        j = await r.json();
+    } catch (e) { j = { error: String(e) }; }
+    if (!j.ok) {
+        fleetStatus.textContent = 'Rolling upgrade failed: ' + (j.error || 'unknown');
+        btnFleetUpgrade.disabled = false;
+        return;
+    }
+    const src = new EventSource(`/updates/fleet/upgrade/${encodeURIComponent(j.rollout_id)}/stream`);
+    const parse = (ev) => { try { return JSON.parse(ev.data || '{}'); } catch (e) { return {}; } };
+    const paint = (h) => {
+        const tr = fleetBody.querySelector(`tr[data-fleet="${CSS.escape(h.id || '')}"]`);
+        if (!tr) return;
+        const first = tr.querySelector('td');
+        tr.innerHTML = (first ? first.outerHTML : `<td>${escapeHTML(h.name)}</td>`) + rolloutCellHTML(h);
+    };
+    src.addEventListener('snapshot', (ev) => (parse(ev).hosts || []).forEach(paint));
+    src.addEventListener('host', (ev) => paint(parse(ev)));
+    src.addEventListener('batch', (ev) => { fleetStatus.textContent = `Rolling upgrade: ${parse(ev).label}…`; });
+    src.addEventListener('done', (ev) => {
+        const snap = parse(ev);
+        (snap.hosts || []).forEach(paint);
+        const ok = (snap.hosts || []).filter(h => h.status === 'ok').length;
+        fleetStatus.textContent = `Rolling upgrade: ${ok}/${(snap.hosts || []).length} upgraded`
+            + (snap.halted ? ` • stopped: ${snap.halted}` : '');
+        btnFleetUpgrade.disabled = false;
+        src.close();
+        refreshLogsList();
+    });
+    src.onerror = () => { src.close(); btnFleetUpgrade.disabled = false; };
+}
+
+btnFleetUpgrade?.addEventListener('click', startRollout);
+
+btnFleetScan?.addEventListener('click', (e) => startFleetScan(e.shiftKey));
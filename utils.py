@@ -7,6 +7,8 @@ import socket
 import threading
 import paramiko
 
+from routes.common.perf import record_ssh
+
 # --------- active profile loading ---------
 def _profiles_path_from_env() -> str | None:
     return os.environ.get("RPI_MONITOR_PROFILES_PATH")
@@ -84,23 +86,29 @@ class SSHManager:
         self._client = cli
         self._fp = self._finger(s)
 
+    def _exec_once(self, command: str) -> str:
+        t0 = time.perf_counter()
+        raw = b""
+        try:
+            _, out, _ = self._client.exec_command(command, timeout=self.read_timeout)
+            try: out.channel.settimeout(self.read_timeout)
+            except: pass
+            raw = out.read()
+            return raw.decode(errors="replace").strip()
+        finally:
+            record_ssh((time.perf_counter() - t0) * 1000.0, len(raw))
+
     def exec(self, command: str) -> str:
         with self._lock:
             s = _load_active_profile()
             if not s: return ""
             try:
                 if self._need_reconnect(s): self._connect(s)
-                _, out, _ = self._client.exec_command(command, timeout=self.read_timeout)
-                try: out.channel.settimeout(self.read_timeout)
-                except: pass
-                return out.read().decode(errors="replace").strip()
+                return self._exec_once(command)
             except (socket.timeout, paramiko.ssh_exception.SSHException):
                 try:
                     self._connect(s)
-                    _, out, _ = self._client.exec_command(command, timeout=self.read_timeout)
-                    try: out.channel.settimeout(self.read_timeout)
-                    except: pass
-                    return out.read().decode(errors="replace").strip()
+                    return self._exec_once(command)
                 except: return ""
             except: return ""
 